@@ -1,143 +1,120 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from sklearn.linear_model import LinearRegression
+import argparse
 
-# Set the directory containing the files and create a folder for plots
-data_folder = 'H:\\Comsol simulations\\diamond'  # Replace with your folder path
-plot_folder = os.path.join(data_folder, "plots")
-os.makedirs(plot_folder, exist_ok=True)
+from stage_profiler import StageProfiler, add_profiler_arguments
+from pipeline import default_cache_dir
+from watch_mode import watch, add_watch_arguments
+from comsol_pipeline import build_comsol_pipeline
 
-# Initialize lists to store data for positive and negative currents
-positive_data = []
-negative_data = []
+# numpy and matplotlib are imported inside the pipeline stages that use them
+# so that the script starts quickly (see check_startup_time.py)
 
-# Loop through all files in the directory
-for file_name in os.listdir(data_folder):
-    if file_name.endswith('.txt'):  # Process only .txt files
-        file_path = os.path.join(data_folder, file_name)
-        
-        try:
-            # Load data from the file and handle the header
-            print(f"Loading file: {file_name}")
-            data = np.loadtxt(file_path, skiprows=1)  # Skip the header row
-            
-            if data.size == 0:
-                print(f"Warning: File {file_name} seems to be empty after skipping rows. Skipping...")
-                continue
+# Set the directory containing the files
+DEFAULT_DATA_FOLDER = 'H:\\Comsol simulations\\diamond'  # Replace with your folder path
 
-            # Extract x and y
-            x = data[:, 0].reshape(-1, 1)  # Column 1 is X
-            y = data[:, 2]  # Column 3 is the magnetic field component
-            
-            # Check if x or y are empty
-            if len(x) == 0 or len(y) == 0:
-                print(f"Warning: No data available in file {file_name}. Skipping...")
-                continue
-            
-            # Extract current density value from the filename for labeling purposes
-            current_density = file_name.replace('.txt', '')
-            
-            # Separate data based on whether filename indicates positive or negative current
-            if file_name.startswith('-'):
-                negative_data.append((x, y, current_density))
-            else:
-                positive_data.append((x, y, current_density))
-            
-            # Create and fit the linear regression model
-            model = LinearRegression()
-            model.fit(x, y)
-            
-            # Make predictions
-            y_pred = model.predict(x)
-            
-            # Print coefficients
-            print(f"File: {file_name}")
-            print("Slope (m):", model.coef_[0])
-            print("Intercept (b):", model.intercept_)
-            
-            # Plot the original data and the regression line
-            plt.figure(dpi=400)  # Set the DPI to 400 for high resolution
-            plt.scatter(x, y, label='Gradient magnetic field (G/um)', marker='.', color='blue')
-            plt.plot(x, y_pred, label='Fitted data', color='red')
-            plt.xlabel('um')
-            plt.ylabel('Gradient Magnetic field (G)')
-            plt.legend()
-            plt.title(f'Gradient magnetic field vs spatial resolution - {current_density} G/um')
-            plt.savefig(os.path.join(plot_folder, f"{file_name.split('.')[0]}_plot.png"))
-            plt.close()
-            
-            print(f"Plot saved: {file_name.split('.')[0]}_plot.png\n")
-            
-        except Exception as e:
-            print(f"Error processing file {file_name}: {e}")
-            continue
 
-# %% Plot combined data for positive currents with fit
-if len(positive_data) > 0:
-    plt.figure(figsize=(12, 8), dpi=400)  # Set the DPI to 400 for high resolution
-    
-    # Combine all positive current data into single arrays
-    all_x_positive = np.vstack([x for x, _, _ in positive_data])
-    all_y_positive = np.concatenate([y for _, y, _ in positive_data])
-    
-    # Plot individual data points
-    for x, y, current_density in positive_data:
-        plt.scatter(x, y, label=f'{current_density} G/um', alpha=0.7)
+# Function to build the pipeline for the diamond exports
+def build_pipeline(data_folder, plot_folder, cache_dir=None, profiler=None, chunk_rows=None, calibration_degree=1,
+                   max_degree=None, folds=5, replicates=10000, seed=0, workers=None):
+    """
+    Builds the COMSOL pipeline for the diamond exports: one header row, a linear fit per file
+    and a linear fit to the combined data of each current polarity.
 
-    # Fit a linear regression model to the combined data
-    model_positive = LinearRegression()
-    model_positive.fit(all_x_positive, all_y_positive)
-    
-    # Make predictions for combined data
-    y_pred_positive = model_positive.predict(all_x_positive)
-    
-    # Plot the fitted line for combined data
-    plt.plot(all_x_positive, y_pred_positive, color='red', label='Combined Fit', linewidth=2)
-    
-    # Labels and legend
-    plt.xlabel('um')
-    plt.ylabel('Gradient Magnetic field (G)')
-    # plt.title()
-    plt.legend(loc='upper right')
-    positive_plot_path = os.path.join(plot_folder, "combined_positive_plot_with_fit.png")
-    plt.savefig(positive_plot_path)
-    plt.close()
-    print(f"Combined plot for positive current with fit saved: {positive_plot_path}\n")
-else:
-    print("No data available for positive currents.")
+    Parameters:
+    - data_folder (str): The directory containing the COMSOL .txt files.
+    - plot_folder (str): The directory where the plots are saved.
+    - cache_dir (str): Directory of the pipeline cache, or None.
+    - profiler (StageProfiler): Collects the per-stage timings of the run.
+    - chunk_rows (int): Read the exports in blocks of this many rows, or None to read them whole.
+    - calibration_degree (int): Degree in the current density of the field calibration at every position.
+    - max_degree (int): Highest polynomial degree cross-validated in model-selection mode.
+    - folds (int): Number of folds of the cross-validation.
+    - replicates (int): Number of bootstrap replicates of the slope intervals.
+    - seed (int): Seed of the bootstrap.
+    - workers (int): Number of bootstrap worker processes.
 
-# %% Plot combined data for negative currents with fit
-if len(negative_data) > 0:
-    plt.figure(figsize=(12, 8), dpi=400)  # Set the DPI to 400 for high resolution
-    
-    # Combine all negative current data into single arrays
-    all_x_negative = np.vstack([x for x, _, _ in negative_data])
-    all_y_negative = np.concatenate([y for _, y, _ in negative_data])
-    
-    # Plot individual data points
-    for x, y, current_density in negative_data:
-        plt.scatter(x, y, label=f'{current_density} G/um', alpha=0.7)
+    Returns:
+    - pipeline (Pipeline): The configured pipeline.
+    """
+    return build_comsol_pipeline(data_folder, plot_folder, skiprows=1, degree=1, combined_degree=1,
+                                 fit_label='Fitted data', combined_label='Combined Fit',
+                                 cache_dir=cache_dir, profiler=profiler, name='Comsol_analysis_diamond',
+                                 chunk_rows=chunk_rows, calibration_degree=calibration_degree,
+                                 max_degree=max_degree, folds=folds, replicates=replicates, seed=seed, workers=workers)
 
-    # Fit a linear regression model to the combined data
-    model_negative = LinearRegression()
-    model_negative.fit(all_x_negative, all_y_negative)
-    
-    # Make predictions for combined data
-    y_pred_negative = model_negative.predict(all_x_negative)
-    
-    # Plot the fitted line for combined data
-    plt.plot(all_x_negative, y_pred_negative, color='red', label='Combined Fit', linewidth=2)
-    
-    # Labels and legend
-    plt.xlabel('um')
-    plt.ylabel('Gradient Magnetic field (G)')
-    # plt.title()
-    plt.legend(loc='lower right')
-    negative_plot_path = os.path.join(plot_folder, "combined_negative_plot_with_fit.png")
-    plt.savefig(negative_plot_path)
-    plt.close()
-    print(f"Combined plot for negative current with fit saved: {negative_plot_path}\n")
-else:
-    print("No data available for negative currents.")
+
+# Function to print the fit of every file
+def print_fits(fits, intervals=None):
+    """
+    Prints the slope and intercept of every per-file fit, with their bootstrap intervals if given.
+
+    Parameters:
+    - fits (list): (SourceFile, PolynomialFit) pairs from the 'fit' stage.
+    - intervals (list): (Cutline, SlopeInterval) pairs from the 'bootstrap' stage.
+    """
+    by_name = {cutline.name: interval for cutline, interval in intervals or []}
+    for item, fit in fits:
+        slope, intercept = fit.coefficients
+        print(f"File: {os.path.basename(item.path)}")
+        print("Slope (m):", slope)
+        print("Intercept (b):", intercept)
+        interval = by_name.get(os.path.splitext(os.path.basename(item.path))[0])
+        if interval is not None:
+            level = f"{100 * interval.confidence:g}%"
+            print(f"Slope {level} interval: [{interval.slope_low}, {interval.slope_high}]")
+            print(f"Intercept {level} interval: [{interval.intercept_low}, {interval.intercept_high}]")
+
+
+# Main function to execute the script
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Fit and plot COMSOL cutlines for the diamond substrate.')
+    parser.add_argument('data_folder', nargs='?', default=DEFAULT_DATA_FOLDER, help='Folder containing the COMSOL .txt exports')
+    parser.add_argument('--no-plots', action='store_true', help='Only print the fit coefficients, do not render any plots')
+    parser.add_argument('--no-cache', action='store_true', help='Do not reuse or store intermediate results')
+    parser.add_argument('--clear-cache', action='store_true', help='Delete the cached intermediate results before running')
+    parser.add_argument('--chunk-rows', type=int, help='Read the exports in blocks of this many rows to bound memory on very large files')
+    parser.add_argument('--calibration-degree', type=int, default=1,
+                        help='Degree in the current density of the field calibration written to current_calibration.csv (default: 1)')
+    parser.add_argument('--select-degree', type=int, metavar='N',
+                        help='Cross-validate polynomial degrees 1..N for every file and write degree_selection.csv')
+    parser.add_argument('--folds', type=int, default=5, help='Number of folds of the cross-validation (default: 5)')
+    parser.add_argument('--bootstrap', type=int, metavar='N', help='Add 95%% bootstrap intervals of the slopes from N replicates')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the bootstrap (default: 0)')
+    parser.add_argument('--workers', type=int, help='Number of bootstrap worker processes (default: one per CPU)')
+    add_watch_arguments(parser)
+    add_profiler_arguments(parser)
+    args = parser.parse_args()
+    profiler = StageProfiler('Comsol_analysis_diamond', args.profile_stage, args.profiler,
+                             trace_memory=args.trace_memory, memory_budget=args.memory_budget)
+
+    # Create a folder for plots
+    data_folder = args.data_folder
+    plot_folder = os.path.join(data_folder, "plots")
+    os.makedirs(plot_folder, exist_ok=True)
+
+    cache_dir = None if args.no_cache else default_cache_dir(plot_folder)
+    pipeline = build_pipeline(data_folder, plot_folder, cache_dir, profiler, args.chunk_rows, args.calibration_degree,
+                              args.select_degree, args.folds, args.bootstrap or 10000, args.seed, args.workers)
+    # The calibration lookup table is written with or without plots
+    if args.clear_cache and cache_dir:
+        print(f"Cache cleared: {pipeline.cache.clear()} file(s) removed from {cache_dir}")
+    targets = ['fit', 'calibration'] if args.no_plots else ['fit', 'calibration', 'plot_file', 'plot_combined']
+    if args.select_degree:
+        targets.append('degree_selection')
+    if args.bootstrap:
+        targets += ['bootstrap', 'slope_intervals']
+    report = lambda results: print_fits(results['fit'], results.get('bootstrap'))
+    if args.watch:
+        # Re-run on every new export; fits and plots of earlier files come from the cache
+        watch(pipeline, targets, args.interval, args.settle, on_update=report)
+    else:
+        results = pipeline.run(targets)
+        report(results)
+        print(pipeline.cache_summary())
+    profiler.finish(args.report or os.path.join(plot_folder, 'run_report.json'))
+
+if __name__ == '__main__':
+    main()
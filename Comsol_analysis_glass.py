@@ -1,131 +1,103 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import argparse
 
-# Set the directory containing the files and create a folder for plots
-data_folder = 'H:\\Comsol simulations\\glass slides'  # Replace with your folder path
-plot_folder = os.path.join(data_folder, "plots")
-os.makedirs(plot_folder, exist_ok=True)
+from stage_profiler import StageProfiler, add_profiler_arguments
+from pipeline import default_cache_dir
+from watch_mode import watch, add_watch_arguments
+from comsol_pipeline import build_comsol_pipeline
 
-# Initialize lists to store data for positive and negative currents
-positive_data = []
-negative_data = []
+# numpy and matplotlib are imported inside the pipeline stages that use them
+# so that the script starts quickly (see check_startup_time.py)
 
-# Loop through all files in the directory
-for file_name in os.listdir(data_folder):
-    if file_name.endswith('.txt'):  # Process only .txt files
-        file_path = os.path.join(data_folder, file_name)
-        
-        try:
-            # Load data from the file and handle the header
-            print(f"Loading file: {file_name}")
-            data = np.loadtxt(file_path, skiprows=8)  # Skip the first 8 rows of header information
-            
-            if data.size == 0:
-                print(f"Warning: File {file_name} seems to be empty after skipping rows. Skipping...")
-                continue
+# Set the directory containing the files
+DEFAULT_DATA_FOLDER = 'H:\\Comsol simulations\\glass slides'  # Replace with your folder path
 
-            # Extract x and y
-            x = data[:, 0].reshape(-1)  # Column 1 is X
-            y = data[:, 2]  # Column 2 is Y
-            
-            # Check if x or y are empty
-            if len(x) == 0 or len(y) == 0:
-                print(f"Warning: No data available in file {file_name}. Skipping...")
-                continue
-            
-            # Extract current density value from the filename for labeling purposes
-            current_density = file_name.replace('.txt', '')
-            
-            # Separate data based on whether filename indicates positive or negative current
-            if current_density.startswith('-'):
-                negative_data.append((x, y, current_density))
-            else:
-                positive_data.append((x, y, current_density))
-            
-            # Create and fit a polynomial model (degree 3)
-            poly_coefficients = np.polyfit(x, y, 3)
-            y_pred = np.polyval(poly_coefficients, x)
-            
-            # Print polynomial coefficients
-            print(f"File: {file_name}")
-            print("Polynomial Coefficients (degree 3):", poly_coefficients)
-            
-            # Plot the original data and the polynomial fit
-            plt.figure(dpi=400)  # Set the DPI to 400 for high resolution
-            plt.scatter(x, y, label='Gradient magnetic field (G/um)', marker='.', color='blue')
-            plt.plot(x, y_pred, label='Polynomial Fit (Degree 3)', color='red')
-            plt.xlabel('um')
-            plt.ylabel('Gradient Magnetic field (G)')
-            plt.legend()
-            plt.title(f'Gradient magnetic field vs spatial resolution - {current_density} G/um')
-            plt.savefig(os.path.join(plot_folder, f"{file_name.split('.')[0]}_plot.png"))
-            
-            print(f"Plot saved: {file_name.split('.')[0]}_plot.png\n")
-            
-        except Exception as e:
-            print(f"Error processing file {file_name}: {e}")
-            continue
 
-# %% Plot combined data for positive currents with polynomial fit
-if len(positive_data) > 0:
-    plt.figure(figsize=(12, 8), dpi=400)  # Set the DPI to 400 for high resolution
-    
-    # Combine all positive current data into single arrays
-    all_x_positive = np.concatenate([x for x, _, _ in positive_data])
-    all_y_positive = np.concatenate([y for _, y, _ in positive_data])
-    
-    # Plot individual data points
-    for x, y, current_density in positive_data:
-        plt.scatter(x, y, label=f'{current_density} G/um', alpha=0.7)
+# Function to build the pipeline for the glass slide exports
+def build_pipeline(data_folder, plot_folder, cache_dir=None, profiler=None, chunk_rows=None, calibration_degree=1,
+                   max_degree=None, folds=5):
+    """
+    Builds the COMSOL pipeline for the glass slide exports: eight header rows, a degree-3
+    polynomial fit per file and no fit to the combined data.
 
-    # Perform a polynomial fit (3rd degree) for the combined data
-    # poly_coefficients_positive = np.polyfit(all_x_positive, all_y_positive, 3)
-    # y_pred_positive = np.polyval(poly_coefficients_positive, all_x_positive)
-    
-    # Plot the fitted polynomial for combined data
-    # plt.plot(all_x_positive, y_pred_positive, color='red', label='Combined Polynomial Fit (Degree 3)', linewidth=2)
-    
-    # Labels and legend
-    plt.xlabel('um')
-    plt.ylabel('Gradient Magnetic field (G)')
-    # plt.title()
-    plt.legend(loc='upper right')
-    positive_plot_path = os.path.join(plot_folder, "combined_positive_plot_with_fit.png")
-    plt.savefig(positive_plot_path)
-    plt.close()
-    print(f"Combined plot for positive current with polynomial fit saved: {positive_plot_path}\n")
-else:
-    print("No data available for positive currents.")
+    Parameters:
+    - data_folder (str): The directory containing the COMSOL .txt files.
+    - plot_folder (str): The directory where the plots are saved.
+    - cache_dir (str): Directory of the pipeline cache, or None.
+    - profiler (StageProfiler): Collects the per-stage timings of the run.
+    - chunk_rows (int): Read the exports in blocks of this many rows, or None to read them whole.
+    - calibration_degree (int): Degree in the current density of the field calibration at every position.
+    - max_degree (int): Highest polynomial degree cross-validated in model-selection mode.
+    - folds (int): Number of folds of the cross-validation.
 
-# %% Plot combined data for negative currents with polynomial fit
-if len(negative_data) > 0:
-    plt.figure(figsize=(12, 8), dpi=400)  # Set the DPI to 400 for high resolution
-    
-    # Combine all negative current data into single arrays
-    all_x_negative = np.concatenate([x for x, _, _ in negative_data])
-    all_y_negative = np.concatenate([y for _, y, _ in negative_data])
-    
-    # Plot individual data points
-    for x, y, current_density in negative_data:
-        plt.scatter(x, y, label=f'{current_density} G/um', alpha=0.7)
+    Returns:
+    - pipeline (Pipeline): The configured pipeline.
+    """
+    return build_comsol_pipeline(data_folder, plot_folder, skiprows=8, degree=3, combined_degree=None,
+                                 fit_label='Polynomial Fit (Degree 3)',
+                                 combined_label='Combined Polynomial Fit (Degree 3)',
+                                 cache_dir=cache_dir, profiler=profiler, name='Comsol_analysis_glass',
+                                 chunk_rows=chunk_rows, calibration_degree=calibration_degree,
+                                 max_degree=max_degree, folds=folds)
 
-    # Perform a polynomial fit (3rd degree) for the combined data
-    # poly_coefficients_negative = np.polyfit(all_x_negative, all_y_negative, 3)
-    # y_pred_negative = np.polyval(poly_coefficients_negative, all_x_negative)
-    
-    # # Plot the fitted polynomial for combined data
-    # plt.plot(all_x_negative, y_pred_negative, color='red', label='Combined Polynomial Fit (Degree 3)', linewidth=2)
-    
-    # Labels and legend
-    plt.xlabel('um')
-    plt.ylabel('Gradient Magnetic field (G)')
-    # plt.title()
-    plt.legend(loc='lower right')
-    negative_plot_path = os.path.join(plot_folder, "combined_negative_plot_with_fit.png")
-    plt.savefig(negative_plot_path)
-    plt.close()
-    print(f"Combined plot for negative current with polynomial fit saved: {negative_plot_path}\n")
-else:
-    print("No data available for negative currents.")
+
+# Function to print the fit of every file
+def print_fits(fits):
+    """
+    Prints the polynomial coefficients of every per-file fit.
+
+    Parameters:
+    - fits (list): (SourceFile, PolynomialFit) pairs from the 'fit' stage.
+    """
+    for item, fit in fits:
+        print(f"File: {os.path.basename(item.path)}")
+        print("Polynomial Coefficients (degree 3):", fit.coefficients)
+
+
+# Main function to execute the script
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Fit and plot COMSOL cutlines for the glass substrate.')
+    parser.add_argument('data_folder', nargs='?', default=DEFAULT_DATA_FOLDER, help='Folder containing the COMSOL .txt exports')
+    parser.add_argument('--no-plots', action='store_true', help='Only print the fit coefficients, do not render any plots')
+    parser.add_argument('--no-cache', action='store_true', help='Do not reuse or store intermediate results')
+    parser.add_argument('--clear-cache', action='store_true', help='Delete the cached intermediate results before running')
+    parser.add_argument('--chunk-rows', type=int, help='Read the exports in blocks of this many rows to bound memory on very large files')
+    parser.add_argument('--calibration-degree', type=int, default=1,
+                        help='Degree in the current density of the field calibration written to current_calibration.csv (default: 1)')
+    parser.add_argument('--select-degree', type=int, metavar='N',
+                        help='Cross-validate polynomial degrees 1..N for every file and write degree_selection.csv')
+    parser.add_argument('--folds', type=int, default=5, help='Number of folds of the cross-validation (default: 5)')
+    add_watch_arguments(parser)
+    add_profiler_arguments(parser)
+    args = parser.parse_args()
+    profiler = StageProfiler('Comsol_analysis_glass', args.profile_stage, args.profiler,
+                             trace_memory=args.trace_memory, memory_budget=args.memory_budget)
+
+    # Create a folder for plots
+    data_folder = args.data_folder
+    plot_folder = os.path.join(data_folder, "plots")
+    os.makedirs(plot_folder, exist_ok=True)
+
+    cache_dir = None if args.no_cache else default_cache_dir(plot_folder)
+    pipeline = build_pipeline(data_folder, plot_folder, cache_dir, profiler, args.chunk_rows, args.calibration_degree,
+                              args.select_degree, args.folds)
+    # The calibration lookup table is written with or without plots
+    if args.clear_cache and cache_dir:
+        print(f"Cache cleared: {pipeline.cache.clear()} file(s) removed from {cache_dir}")
+    targets = ['fit', 'calibration'] if args.no_plots else ['fit', 'calibration', 'plot_file', 'plot_combined']
+    if args.select_degree:
+        targets.append('degree_selection')
+    if args.watch:
+        # Re-run on every new export; fits and plots of earlier files come from the cache
+        watch(pipeline, targets, args.interval, args.settle, on_update=lambda results: print_fits(results['fit']))
+    else:
+        results = pipeline.run(targets)
+        print_fits(results['fit'])
+        print(pipeline.cache_summary())
+    profiler.finish(args.report or os.path.join(plot_folder, 'run_report.json'))
+
+if __name__ == '__main__':
+    main()
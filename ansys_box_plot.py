@@ -1,11 +1,12 @@
 import os
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-import tkinter as tk
-import scipy.interpolate
-from tkinter import filedialog
+import argparse
+
+from box_stats import consolidated_box_statistics, draw_box_plots
+from figure_writer import savefig
+
+# pandas, matplotlib, numpy and tkinter are imported inside the functions that
+# use them so that the script starts quickly (see check_startup_time.py)
 
 # ---------------------------- Helper Functions ---------------------------- #
 
@@ -37,6 +38,9 @@ def select_directory():
     Returns:
     - directory (str): The selected directory path.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     root.attributes('-topmost', True)  # Bring the dialog to the front
@@ -60,6 +64,9 @@ def create_multiline_plots(directory, s_parameters, plot_folder):
     - s_parameters (dict): Dictionary of S-parameter names to column names.
     - plot_folder (str): Directory where the consolidated plots should be saved.
     """
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
     consolidated_data = {param: {} for param in s_parameters.keys()}
 
     csv_files = find_csv_files(directory)
@@ -125,7 +132,7 @@ def create_multiline_plots(directory, s_parameters, plot_folder):
 
             # Save the multi-line plot
             consolidated_plot_path = os.path.join(plot_folder, f"{param}vs_frequency{material}_multiline_heights.png")
-            plt.savefig(consolidated_plot_path)
+            savefig(consolidated_plot_path)
             plt.close()
             print(f"Multi-Line {param} vs Frequency plot for different heights saved: {consolidated_plot_path}")
     # plt.show()
@@ -149,7 +156,7 @@ def create_multiline_plots(directory, s_parameters, plot_folder):
 
             # Save the multi-line plot
             consolidated_plot_path = os.path.join(plot_folder, f"{param}vs_frequency_height{height}_multiline_materials.png")
-            plt.savefig(consolidated_plot_path)
+            savefig(consolidated_plot_path)
             # plt.show()
             plt.close()
             print(f"Multi-Line {param} vs Frequency plot for different materials saved: {consolidated_plot_path}")
@@ -164,6 +171,8 @@ def create_summary_tables(consolidated_data, plot_folder, s_parameters):
     - plot_folder (str): Path to the folder where summary tables will be saved.
     - s_parameters (dict): Dictionary of S-parameter names to column names.
     """
+    import pandas as pd
+
     for param in s_parameters.keys():
         for material, height_data in consolidated_data[param].items():
             if material == 'Ti-Au':  # Only create summary for Ti-Au
@@ -190,18 +199,23 @@ def create_box_plots(consolidated_data, plot_folder, s_parameters):
     - plot_folder (str): Path to the folder where box plots will be saved.
     - s_parameters (dict): Dictionary of S-parameter names to column names.
     """
+    import matplotlib.pyplot as plt
+
+    # Quartiles, whiskers and outliers of every (param, material, height, try) in one pass
+    stats = consolidated_box_statistics(consolidated_data, list(s_parameters.keys()))
+
     for param in s_parameters.keys():
         for material, height_data in consolidated_data[param].items():
             plt.figure(figsize=(10, 6), dpi=400)
-            data_to_plot = []
+            stats_to_plot = []
             labels = []
             for height, data_list in sorted(height_data.items()):
-                # Append each try's data without averaging
-                for _, s_param_values in data_list:
-                    data_to_plot.append(s_param_values)
+                # Append each try's statistics without averaging
+                for try_index in range(len(data_list)):
+                    stats_to_plot.append(stats[(param, material, height, try_index)])
                     labels.append(f'Height: {height} nm')
 
-            plt.boxplot(data_to_plot, labels=labels)
+            draw_box_plots(plt.gca(), stats_to_plot, labels)
             plt.xlabel('Height (nm)')
             plt.ylabel(f'{param} Parameter (dB)')
             plt.title(f'Box Plot of {param} for {material}')
@@ -224,6 +238,9 @@ def create_radar_plots(consolidated_data, plot_folder, s_parameters):
     - plot_folder (str): Path to the folder where radar plots will be saved.
     - s_parameters (dict): Dictionary of S-parameter names to column names.
     """
+    import numpy as np
+    import matplotlib.pyplot as plt
+
     labels = list(s_parameters.keys())
     num_vars = len(labels)
 
@@ -265,8 +282,12 @@ def main():
     """
     Main function to execute the script.
     """
-    # Select the directory using GUI
-    directory = select_directory()
+    parser = argparse.ArgumentParser(description='Draw box and radar plots of the HFSS sweeps for every material.')
+    parser.add_argument('directory', nargs='?', help='Directory containing the CSV files (a dialog opens if omitted)')
+    args = parser.parse_args()
+
+    # Take the directory from the command line, or select it using GUI
+    directory = args.directory or select_directory()
 
     if not directory:
         print("No directory selected. Exiting.")
@@ -1,12 +1,19 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import tkinter as tk
-from tkinter import filedialog
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from touchstone import TOUCHSTONE_EXTENSIONS, read_report
+from box_stats import box_statistics, draw_box_plots
+from figure_writer import savefig
+
+# pandas, matplotlib and tkinter are imported inside the functions that use them
+# so that the script starts quickly (see check_startup_time.py)
 
 def find_csv_files(directory):
     """
-    Recursively finds all CSV files in the given directory and subdirectories.
+    Recursively finds all CSV and Touchstone (.sNp) files in the given directory and subdirectories,
+    except for the 'plots' folders.
 
     Parameters:
     - directory (str): The directory path where to look for CSV files.
@@ -16,12 +23,13 @@ def find_csv_files(directory):
     """
     csv_files = []
     for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d != 'plots']  # Skip the summary tables written by the other scripts
         for file in files:
-            if file.lower().endswith('.csv'):
+            if file.lower().endswith(('.csv',) + TOUCHSTONE_EXTENSIONS):
                 csv_files.append(os.path.join(root, file))
     if not csv_files:
-        print("No CSV files found in the directory and its subdirectories.")
-    return csv_files
+        print(f"No CSV or Touchstone files found in '{directory}' and its subdirectories.")
+    return sorted(csv_files)
 
 def select_directory():
     """
@@ -30,58 +38,194 @@ def select_directory():
     Returns:
     - directory (str): The selected directory path.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     directory = filedialog.askdirectory()
+    root.destroy()
     return directory
 
-def load_and_plot_s21(directory, s_parameter="dB(St(2,1)) []"):
+def select_directories():
     """
-    Loads CSV files from the directory, extracts the S21 parameter, and plots a box plot.
+    Opens directory dialogs until one is cancelled.
+
+    Returns:
+    - directories (list): The selected directory paths.
+    """
+    directories = []
+    while True:
+        print(f"Select directory {len(directories) + 1} for loading CSV files (cancel to start the comparison):")
+        directory = select_directory()
+        if not directory:
+            return directories
+        directories.append(directory)
+
+# Function to reduce one directory to box-plot statistics (runs in a worker process)
+def summarize_directory(directory, s_parameter="dB(St(2,1)) []"):
+    """
+    Loads every CSV or Touchstone file of a directory and reduces the S-parameter column
+    of each file to box-plot statistics, so that only the statistics leave the worker.
 
     Parameters:
     - directory (str): The directory path where the CSV files are located.
-    - s_parameter (str): The S-parameter to plot (default is 'S21').
-    """
-    csv_files = find_csv_files(directory)
-    s21_data = []
+    - s_parameter (str): The S-parameter column to summarise (default is 'S21').
 
-    for csv_path in csv_files:
+    Returns:
+    - stats (list): One statistics dict per file (see box_stats.box_statistics), labelled with the file name.
+    """
+    s21_data, labels = [], []
+    for csv_path in find_csv_files(directory):
         try:
-            # Load the CSV data using pandas
-            data = pd.read_csv(csv_path)
+            # Load the report (Touchstone files are laid out like an HFSS report)
+            data = read_report(csv_path)
 
             # Print name of file and its directory
             print(f"Reading file: {csv_path}")
 
             # Extract S21 parameter
             if s_parameter in data.columns:
-                s21_data.append(data[s_parameter])
+                s21_data.append(data[s_parameter].to_numpy())
+                labels.append(os.path.splitext(os.path.relpath(csv_path, directory))[0])
             else:
                 print(f"No {s_parameter} column found in '{csv_path}'. Skipping.")
                 continue
         except Exception as e:
             print(f"Error reading '{csv_path}': {e}")
             continue
+    return box_statistics(s21_data, labels)
 
-    # Plot the box plot for S21 parameter
-    plt.figure(figsize=(10, 6))
-    plt.boxplot(s21_data, labels=[os.path.basename(directory)] * len(s21_data))
-    plt.title(f'Box Plot of {s_parameter} Parameter')
-    plt.xlabel('Files')
-    plt.ylabel(s_parameter)
-    plt.show()
+# Function to summarise several directories concurrently
+def summarize_directories(directories, s_parameter="dB(St(2,1)) []", workers=None):
+    """
+    Runs summarize_directory for every directory on a pool of worker processes.
 
-if __name__ == "__main__":
-    directories = []
-    for i in range(5):
-        print(f"Select directory {i+1} for loading CSV files:")
-        directory = select_directory()
-        if directory:
-            directories.append(directory)
-        else:
-            print("No directory selected. Exiting.")
-            exit()
+    Parameters:
+    - directories (list): The directories to compare.
+    - s_parameter (str): The S-parameter column to summarise.
+    - workers (int): Number of worker processes (default: one per directory, at most one per CPU).
+                     With a single worker the directories are summarised in this process.
 
+    Returns:
+    - summaries (list): The statistics of every directory, in the order of directories.
+    """
+    workers = workers or min(len(directories), os.cpu_count() or 1)
+    if workers <= 1 or len(directories) <= 1:
+        return [summarize_directory(directory, s_parameter) for directory in directories]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(summarize_directory, directories, [s_parameter] * len(directories)))
+
+def directory_labels(directories):
+    """
+    Returns short labels for the directories: their basenames, or their paths relative
+    to the common parent when basenames repeat.
+    """
+    names = [os.path.basename(os.path.normpath(d)) for d in directories]
+    if len(set(names)) == len(names):
+        return names
+    common = os.path.commonpath([os.path.abspath(d) for d in directories])
+    return [os.path.relpath(os.path.abspath(d), common) if os.path.abspath(d) != common else names[k]
+            for k, d in enumerate(directories)]
+
+# Function to draw the summaries of all directories side by side in one figure
+def plot_comparison(directories, summaries, s_parameter="dB(St(2,1)) []", plot_path=None, show=True):
+    """
+    Draws one box per file, grouped by directory, in a single figure.
+
+    Parameters:
+    - directories (list): The compared directories.
+    - summaries (list): Statistics of every directory (see summarize_directories).
+    - s_parameter (str): The summarised S-parameter column, used for the labels.
+    - plot_path (str): Where to save the figure (not saved if None).
+    - show (bool): Whether to show the figure.
+    """
+    import matplotlib.pyplot as plt
+
+    labels = directory_labels(directories)
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    fig, ax = plt.subplots(figsize=(max(10, 0.4 * sum(len(s) for s in summaries) + 2), 6))
+
+    position, ticks, tick_labels = 1, [], []
+    for k, (label, stats) in enumerate(zip(labels, summaries)):
+        if not stats:
+            print(f"No {s_parameter} data found in '{directories[k]}'.")
+            continue
+        positions = list(range(position, position + len(stats)))
+        color = colors[k % len(colors)]
+        draw_box_plots(ax, stats, positions=positions, patch_artist=True, manage_ticks=False,
+                       boxprops={'facecolor': color, 'alpha': 0.6}, medianprops={'color': 'black'})
+        ax.plot([], [], 's', color=color, alpha=0.6, label=f"{label} ({len(stats)} files)")
+        ticks.append((positions[0] + positions[-1]) / 2)
+        tick_labels.append(label)
+        position += len(stats) + 1  # Leave a gap between directories
+
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(tick_labels, rotation=30 if len(ticks) > 4 else 0, ha='right' if len(ticks) > 4 else 'center')
+    ax.set_xlim(0, max(position - 1, 2))
+    ax.set_title(f'Box Plot of {s_parameter} Parameter')
+    ax.set_xlabel('Directories (one box per file)')
+    ax.set_ylabel(s_parameter)
+    if ticks:
+        ax.legend(loc='best')
+    fig.tight_layout()
+
+    if plot_path:
+        savefig(plot_path, fig=fig)
+        print(f"Comparison plot saved: {plot_path}")
+    if show:
+        plt.show()
+    plt.close(fig)
+
+# Function to compare several directories in one figure
+def compare_directories(directories, s_parameter="dB(St(2,1)) []", workers=None, plot_path=None, show=True):
+    """
+    Summarises the directories concurrently and draws them side by side.
+
+    Parameters:
+    - directories (list): The directories to compare.
+    - s_parameter (str): The S-parameter to plot (default is 'S21').
+    - workers (int): Number of worker processes (see summarize_directories).
+    - plot_path (str): Where to save the figure (not saved if None).
+    - show (bool): Whether to show the figure.
+    """
+    summaries = summarize_directories(directories, s_parameter, workers)
+    plot_comparison(directories, summaries, s_parameter, plot_path, show)
+
+def load_and_plot_s21(directory, s_parameter="dB(St(2,1)) []"):
+    """
+    Loads CSV files from the directory, extracts the S21 parameter, and plots a box plot.
+
+    Parameters:
+    - directory (str): The directory path where the CSV files are located.
+    - s_parameter (str): The S-parameter to plot (default is 'S21').
+    """
+    compare_directories([directory], s_parameter)
+
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Compare the S21 distribution of several HFSS result directories in one figure.')
+    parser.add_argument('directories', nargs='*', help='Directories containing the CSV or Touchstone files (dialogs open if omitted)')
+    parser.add_argument('--parameter', default="dB(St(2,1)) []", help='Report column to compare')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default: one per directory, at most one per CPU)')
+    parser.add_argument('--output', help='Save the comparison figure to this path')
+    parser.add_argument('--no-show', action='store_true', help='Do not open the figure window')
+    args = parser.parse_args()
+
+    directories = args.directories or select_directories()
+    if not directories:
+        print("No directory selected. Exiting.")
+        sys.exit(1)
+
+    directories = [os.path.normpath(d) for d in directories]
     for directory in directories:
-        load_and_plot_s21(directory)
\ No newline at end of file
+        if not os.path.isdir(directory):
+            print(f"The directory '{directory}' does not exist.")
+            sys.exit(1)
+
+    compare_directories(directories, args.parameter, args.workers, args.output, not args.no_show)
+
+if __name__ == "__main__":
+    main()
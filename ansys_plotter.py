@@ -7,13 +7,17 @@ Created on 2023-10-15
 
 import os
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
 
-# Function to list all CSV files in the directory
+from touchstone import TOUCHSTONE_EXTENSIONS, read_report
+from figure_writer import savefig
+
+# pandas and matplotlib are imported inside the functions that use them
+# so that the script starts quickly (see check_startup_time.py)
+
+# Function to list all CSV (and Touchstone) files in the directory
 def list_csv_files(directory):
     """
-    Lists all CSV files in the given directory.
+    Lists all CSV and Touchstone (.sNp) files in the given directory.
 
     Parameters:
     - directory (str): The directory path where to look for CSV files.
@@ -21,9 +25,9 @@ def list_csv_files(directory):
     Returns:
     - files (list): A list of CSV filenames.
     """
-    files = [f for f in os.listdir(directory) if f.lower().endswith('.csv')]
+    files = [f for f in os.listdir(directory) if f.lower().endswith(('.csv',) + TOUCHSTONE_EXTENSIONS)]
     if not files:
-        print("No CSV files found in the directory.")
+        print("No CSV or Touchstone files found in the directory.")
         return []
     return files
 
@@ -117,6 +121,8 @@ def plot_data(data, x_column, y_column, title, x_scale='linear', y_scale='linear
     - x_label (str): The label for the x-axis.
     - y_label (str): The label for the y-axis.
     """
+    import matplotlib.pyplot as plt
+
     if x_column in data.columns and y_column in data.columns:
         plt.figure(figsize=(10, 6))
         plt.plot(data[x_column], data[y_column], marker='o', label=y_column)
@@ -136,7 +142,7 @@ def plot_data(data, x_column, y_column, title, x_scale='linear', y_scale='linear
             if not save_filename.lower().endswith('.tiff'):
                 save_filename += '.png'
             # Save the plot as TIFF with high DPI
-            plt.savefig(save_filename, format='png', dpi=300)
+            savefig(save_filename, format='png', dpi=300)
             print(f"Plot saved as {save_filename}")
         else:
             # Show the plot
@@ -153,7 +159,8 @@ def plot_csv_file(file_path):
     - file_path (str): The full path to the CSV file.
     """
     try:
-        data = pd.read_csv(file_path)
+        # Touchstone files are read into the same column layout as an HFSS CSV report
+        data = read_report(file_path)
 
         # Display the available columns in the CSV file
         print("\nColumns found in the file:", data.columns.tolist())
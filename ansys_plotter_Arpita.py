@@ -1,16 +1,20 @@
 import os
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-import tkinter as tk
-from math import pi
-from tkinter import filedialog
-
-# Function to recursively find all CSV files in a directory and subdirectories
+import argparse
+
+from stage_profiler import StageProfiler, add_profiler_arguments
+from touchstone import TOUCHSTONE_EXTENSIONS, parameter_label, read_report
+from box_stats import box_statistics, draw_box_plots
+from hfss_pipeline import average_tries, height_frequency_grid, plot_height_heatmap, sweep_location
+from figure_writer import savefig
+
+# pandas, matplotlib, numpy and tkinter are imported inside the functions that
+# use them so that the script starts quickly (see check_startup_time.py)
+
+# Function to recursively find all CSV (and Touchstone) files in a directory and subdirectories
 def find_csv_files(directory):
     """
-    Recursively finds all CSV files in the given directory and subdirectories.
+    Recursively finds all CSV and Touchstone (.sNp) files in the given directory and subdirectories.
 
     Parameters:
     - directory (str): The directory path where to look for CSV files.
@@ -21,10 +25,10 @@ def find_csv_files(directory):
     csv_files = []
     for root, dirs, files in os.walk(directory):
         for file in files:
-            if file.lower().endswith('.csv'):
+            if file.lower().endswith(('.csv',) + TOUCHSTONE_EXTENSIONS):
                 csv_files.append(os.path.join(root, file))
     if not csv_files:
-        print("No CSV files found in the directory and its subdirectories.")
+        print("No CSV or Touchstone files found in the directory and its subdirectories.")
     return csv_files
 
 # Function to select a directory using GUI
@@ -35,6 +39,9 @@ def select_directory():
     Returns:
     - directory (str): The selected directory path.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     root.attributes('-topmost', True)  # Bring the dialog to the front
@@ -47,8 +54,19 @@ def main():
     """
     Main function to execute the script.
     """
-    # Select the directory using GUI
-    directory = select_directory()
+    parser = argparse.ArgumentParser(description='Compare HFSS sweeps of different materials.')
+    parser.add_argument('directory', nargs='?', help='Directory containing the CSV or Touchstone files (a dialog opens if omitted)')
+    add_profiler_arguments(parser)
+    args = parser.parse_args()
+    profiler = StageProfiler('ansys_plotter_Arpita', args.profile_stage, args.profiler,
+                             trace_memory=args.trace_memory, memory_budget=args.memory_budget)
+
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    # Take the directory from the command line, or select it using GUI
+    directory = args.directory or select_directory()
 
     if not directory:
         print("No directory selected. Exiting.")
@@ -66,7 +84,8 @@ def main():
     os.makedirs(plot_folder, exist_ok=True)
 
     # Find all CSV files in the directory and subdirectories
-    csv_files = find_csv_files(directory)
+    with profiler.stage('discover'):
+        csv_files = find_csv_files(directory)
     if not csv_files:
         sys.exit(1)  # Exit if no CSV files are found
 
@@ -84,13 +103,25 @@ def main():
         'TDR-Impedance': {},
         'Z0': {}
     }  # To keep track of consolidated S-parameter, Z-parameter, TDR-Impedance, and Z0 vs height data
+    s11_sweeps = {}  # material -> height -> [(frequency, S11), ...] for the heatmaps
+    profiler.track('material_data', material_data)
+    profiler.track('consolidated_data', consolidated_data)
+    profiler.track('s11_sweeps', s11_sweeps)
 
     # Process each CSV file
     for csv_path in csv_files:
         try:
-            # Load the CSV data using pandas
-            print(f"Loading CSV file: {os.path.basename(csv_path)}")
-            data = pd.read_csv(csv_path)
+            # Load the CSV data using pandas (Touchstone files are laid out like an HFSS report)
+            print(f"Loading file: {os.path.basename(csv_path)}")
+            raw = profiler.read_bytes(csv_path)
+            with profiler.stage('parse', file=csv_path):
+                data = read_report(csv_path, raw)
+            del raw
+
+            # Close to the memory budget, keep the remaining reports as float32 (see memory_budget.py)
+            if profiler.memory_pressure(f"reading {os.path.basename(csv_path)}"):
+                data = data.astype({col: 'float32' for col in data.select_dtypes('float64').columns})
+                profiler.record_fallback(csv_path, 'float32')
 
             # Identify the x-axis column
             x_column = None
@@ -125,77 +156,86 @@ def main():
 
             # Store data for plotting (using the first y-column as per requirement)
             frequency = data[x_column]  # Frequency in GHz
+            height = subfolder_name.split('nm')[0].strip()  # Extract height from folder name
+            height = int(height) if height.isdigit() else None
             for y_column in y_columns:
-                if 's11' in y_column.lower():
+                y_name = parameter_label(y_column).lower()  # 'dB(St(1,1)) []' -> 's11'
+                if 's11' in y_name:
                     s11 = data[y_column]  # S11 parameter in dB
                     material_data.append((frequency, s11, subfolder_name, 'S11'))
                     # Store data for consolidated plot
-                    height = subfolder_name.split('nm')[0].strip()  # Extract height from folder name
-                    if height.isdigit():
-                        height = int(height)
+                    if height is not None:
                         if subfolder_name not in consolidated_data['S11']:
                             consolidated_data['S11'][subfolder_name] = {}
                         consolidated_data['S11'][subfolder_name][height] = s11
-                elif 's12' in y_column.lower():
+                    # Keep the frequency axis of every sweep, grouped by material, for the heatmaps
+                    try:
+                        sweep_height, sweep_material = sweep_location(csv_path)
+                    except (ValueError, IndexError):
+                        sweep_height = sweep_material = None
+                    if sweep_height is not None:
+                        s11_sweeps.setdefault(sweep_material, {}).setdefault(sweep_height, []).append(
+                            (frequency.to_numpy() / (1000.0 if 'mhz' in x_column.lower() else 1.0), s11.to_numpy()))
+                elif 's12' in y_name:
                     s12 = data[y_column]  # S12 parameter in dB
                     material_data.append((frequency, s12, subfolder_name, 'S12'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['S12']:
                             consolidated_data['S12'][subfolder_name] = {}
                         consolidated_data['S12'][subfolder_name][height] = s12
-                elif 's21' in y_column.lower():
+                elif 's21' in y_name:
                     s21 = data[y_column]  # S21 parameter in dB
                     material_data.append((frequency, s21, subfolder_name, 'S21'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['S21']:
                             consolidated_data['S21'][subfolder_name] = {}
                         consolidated_data['S21'][subfolder_name][height] = s21
-                elif 's22' in y_column.lower():
+                elif 's22' in y_name:
                     s22 = data[y_column]  # S22 parameter in dB
                     material_data.append((frequency, s22, subfolder_name, 'S22'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['S22']:
                             consolidated_data['S22'][subfolder_name] = {}
                         consolidated_data['S22'][subfolder_name][height] = s22
-                elif 'z11' in y_column.lower():
+                elif 'z11' in y_name:
                     z11 = data[y_column]  # Z11 parameter
                     material_data.append((frequency, z11, subfolder_name, 'Z11'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['Z11']:
                             consolidated_data['Z11'][subfolder_name] = {}
                         consolidated_data['Z11'][subfolder_name][height] = z11
-                elif 'z12' in y_column.lower():
+                elif 'z12' in y_name:
                     z12 = data[y_column]  # Z12 parameter
                     material_data.append((frequency, z12, subfolder_name, 'Z12'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['Z12']:
                             consolidated_data['Z12'][subfolder_name] = {}
                         consolidated_data['Z12'][subfolder_name][height] = z12
-                elif 'z21' in y_column.lower():
+                elif 'z21' in y_name:
                     z21 = data[y_column]  # Z21 parameter
                     material_data.append((frequency, z21, subfolder_name, 'Z21'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['Z21']:
                             consolidated_data['Z21'][subfolder_name] = {}
                         consolidated_data['Z21'][subfolder_name][height] = z21
-                elif 'z22' in y_column.lower():
+                elif 'z22' in y_name:
                     z22 = data[y_column]  # Z22 parameter
                     material_data.append((frequency, z22, subfolder_name, 'Z22'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['Z22']:
                             consolidated_data['Z22'][subfolder_name] = {}
                         consolidated_data['Z22'][subfolder_name][height] = z22
                 elif 'tdr-impedance' in y_column.lower():
                     tdr_impedance = data[y_column]  # TDR-Impedance parameter
                     material_data.append((frequency, tdr_impedance, subfolder_name, 'TDR-Impedance'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['TDR-Impedance']:
                             consolidated_data['TDR-Impedance'][subfolder_name] = {}
                         consolidated_data['TDR-Impedance'][subfolder_name][height] = tdr_impedance
                 elif 'z0' in y_column.lower():
                     z0 = data[y_column]  # Z0 parameter
                     material_data.append((frequency, z0, subfolder_name, 'Z0'))
-                    if height.isdigit():
+                    if height is not None:
                         if subfolder_name not in consolidated_data['Z0']:
                             consolidated_data['Z0'][subfolder_name] = {}
                         consolidated_data['Z0'][subfolder_name][height] = z0
@@ -208,6 +248,7 @@ def main():
             print(f"Error processing '{csv_path}': {e}. Skipping.")
 
     # Plot S11, S12, S21, S22 parameter against frequency for different materials
+    summary_rows = {}  # param -> [material, max, min] rows of the summary tables
     for param in ['S11', 'S12', 'S21', 'S22']:
         plt.figure(figsize=(10, 6), dpi=400)  # Set the DPI to 400 for high resolution
 
@@ -224,9 +265,10 @@ def main():
 
         # Save the combined plot
         combined_plot_path = os.path.join(plot_folder, f"impedance_match_vs_frequency_{param}.png")
-        plt.savefig(combined_plot_path)
-        plt.show()
-        plt.close()
+        with profiler.stage('write'):
+            savefig(combined_plot_path)
+            plt.show()
+            plt.close()
         print(f"Combined {param} impedance match plot saved: {combined_plot_path}")
 
         # Create a DataFrame to summarize results
@@ -237,6 +279,7 @@ def main():
                 min_value = s_param.min()
                 summary_data.append([material, max_value, min_value])
 
+        summary_rows[param] = summary_data
         summary_df = pd.DataFrame(summary_data, columns=['Material', 'Max Value (dB)', 'Min Value (dB)'])
         summary_path = os.path.join(plot_folder, f"summary_{param}_impedance_match.csv")
         summary_df.to_csv(summary_path, index=False)
@@ -244,15 +287,16 @@ def main():
 
     # Box plot for S11 Min/Max Values Across All Metals
     plt.figure(figsize=(10, 6), dpi=400)
-    s11_min_values = [data[2] for data in summary_data if data[0] == 'S11']
-    s11_max_values = [data[1] for data in summary_data if data[0] == 'S11']
-    plt.boxplot([s11_min_values, s11_max_values], labels=['Min Values', 'Max Values'])
+    s11_min_values = [data[2] for data in summary_rows.get('S11', [])]
+    s11_max_values = [data[1] for data in summary_rows.get('S11', [])]
+    draw_box_plots(plt.gca(), box_statistics([s11_min_values, s11_max_values], ['Min Values', 'Max Values']))
     plt.xlabel('S11 Metrics')
     plt.ylabel('S11 Value (dB)')
     plt.title('Box Plot of S11 Min and Max Values for All Metal Combinations')
-    plt.savefig(os.path.join(plot_folder, 'boxplot_s11_min_max.png'))
-    plt.show()
-    plt.close()
+    with profiler.stage('write'):
+        savefig(os.path.join(plot_folder, 'boxplot_s11_min_max.png'))
+        plt.show()
+        plt.close()
 
     # Bar Chart for Average S11 Values for Each Metal Combination
     avg_s11_values = []
@@ -268,9 +312,10 @@ def main():
     plt.ylabel('Average S11 Value (dB)')
     plt.title('Average S11 Values for Each Metal Combination')
     plt.xticks(rotation=45)
-    plt.savefig(os.path.join(plot_folder, 'bar_chart_avg_s11.png'))
-    plt.show()
-    plt.close()
+    with profiler.stage('write'):
+        savefig(os.path.join(plot_folder, 'bar_chart_avg_s11.png'))
+        plt.show()
+        plt.close()
 
     # Radar Plot for Overall Comparison of Different Metrics
     
@@ -281,13 +326,14 @@ def main():
         for material, height_data in consolidated_data[param].items():
             avg_value = np.mean([data.mean() for height, data in height_data.items()])
             if material not in radar_data:
-                radar_data[material] = []
-            radar_data[material].append(avg_value)
+                radar_data[material] = {}
+            radar_data[material][param] = avg_value
 
     labels = params
     num_vars = len(labels)
 
-    for material, values in radar_data.items():
+    for material, material_values in radar_data.items():
+        values = [material_values.get(param, np.nan) for param in labels]  # Metrics missing for this material stay empty
         angles = np.linspace(0, 2 * np.pi, num_vars, endpoint=False).tolist()
         values += values[:1]
         angles += angles[:1]
@@ -300,33 +346,25 @@ def main():
         ax.set_xticklabels(labels)
         plt.title(f'Radar Plot for {material}')
         radar_plot_path = os.path.join(plot_folder, f'radar_plot_{material}.png')
-        plt.savefig(radar_plot_path)
-        plt.show()
-        plt.close()
-
-    # Heatmap for S11 vs Height vs Frequency
-    heatmap_data = []
-    for material, height_data in consolidated_data['S11'].items():
-        heights = sorted(height_data.keys())
-        if len(frequency_data) > 0:
-          frequency_concat = pd.concat(frequency_data, axis=1).fillna(0).values
-        else:
-          print(f"Warning: No data available for heatmap generation for {material}. Skipping...")
-        continue
-        frequency_data = [height_data[height] for height in heights]
-        frequency_concat = pd.concat(frequency_data, axis=1).values
-        heatmap_data.append((heights, frequency_concat))
-
-        plt.figure(figsize=(12, 6), dpi=400)
-        plt.imshow(frequency_concat, aspect='auto', cmap='viridis', interpolation='none')
-        plt.colorbar(label='S11 Value (dB)')
-        plt.xlabel('Frequency (Index)')
-        plt.ylabel('Height (nm)')
-        plt.title(f'Heatmap of S11 vs Height vs Frequency for {material}')
+        with profiler.stage('write'):
+            savefig(radar_plot_path)
+            plt.show()
+            plt.close()
+
+    # Heatmap for S11 vs Height vs Frequency (tries at the same height are averaged)
+    averaged_s11 = average_tries({'S11': s11_sweeps}, None, profiler).get('S11', {})
+    for material, height_data in averaged_s11.items():
+        with profiler.stage('consolidate'):
+            heights, heatmap_frequency, heatmap_grid = height_frequency_grid(height_data)
         heatmap_path = os.path.join(plot_folder, f'heatmap_s11_{material}.png')
-        plt.savefig(heatmap_path)
-        plt.show()
-        plt.close()
+        with profiler.stage('render'):
+            plot_height_heatmap(heights, heatmap_frequency, heatmap_grid, 'S11', material, heatmap_path,
+                                profiler=profiler, show=True)
+        print(f"Heatmap of S11 for {material} saved: {heatmap_path}")
+    if not averaged_s11:
+        print("Warning: No data available for heatmap generation. Skipping...")
+
+    profiler.finish(args.report or os.path.join(plot_folder, 'run_report.json'))
 
 if __name__ == '__main__':
     main()
@@ -1,31 +1,14 @@
 import os
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-import tkinter as tk
-import scipy.interpolate
-from tkinter import filedialog
+import argparse
 
-# Function to recursively find all CSV files in a directory and subdirectories
-def find_csv_files(directory):
-    """
-    Recursively finds all CSV files in the given directory and subdirectories.
+from stage_profiler import StageProfiler, add_profiler_arguments
+from pipeline import default_cache_dir, discover_files
+from watch_mode import watch, add_watch_arguments
+from hfss_pipeline import REPORT_EXTENSIONS, S_PARAMETERS, build_hfss_pipeline
 
-    Parameters:
-    - directory (str): The directory path where to look for CSV files.
-
-    Returns:
-    - csv_files (list): A list of paths to CSV files.
-    """
-    csv_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.csv'):
-                csv_files.append(os.path.join(root, file))
-    if not csv_files:
-        print("No CSV files found in the directory and its subdirectories.")
-    return csv_files
+# pandas, matplotlib, numpy and tkinter are imported inside the pipeline stages
+# and functions that use them so that the script starts quickly (see check_startup_time.py)
 
 # Function to select a directory using GUI
 def select_directory():
@@ -35,6 +18,9 @@ def select_directory():
     Returns:
     - directory (str): The selected directory path.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     root.attributes('-topmost', True)  # Bring the dialog to the front
@@ -47,8 +33,32 @@ def main():
     """
     Main function to execute the script.
     """
-    # Select the directory using GUI
-    directory = select_directory()
+    parser = argparse.ArgumentParser(description='Plot and summarise HFSS sweeps for every material and height.')
+    parser.add_argument('directory', nargs='?', help='Directory containing the CSV or Touchstone files (a dialog opens if omitted)')
+    parser.add_argument('--summary-only', action='store_true', help='Only write the summary tables: no plots, figures of merit, results store or surrogate')
+    parser.add_argument('--no-cache', action='store_true', help='Do not reuse or store intermediate results')
+    parser.add_argument('--clear-cache', action='store_true', help='Delete the cached intermediate results before running')
+    parser.add_argument('--chunk-rows', type=int, help='Read the CSV reports in blocks of this many rows to bound memory on very large files')
+    parser.add_argument('--compact', action='store_true', help='Store the sweeps as float32 with shared frequency axes (relative error <= 6e-8)')
+    parser.add_argument('--duplicates', choices=['drop', 'count', 'keep'], default='drop',
+                        help='Byte-identical exports: read once and use one of them (drop, default), read once and '
+                             'use all of them as tries (count), or do not check (keep)')
+    parser.add_argument('--store', help='SQLite results store the metrics of the run are added to '
+                                        '(default: results.sqlite in the plots folder; see results_store.py)')
+    parser.add_argument('--band', nargs=2, type=float, action='append', default=[], metavar=('LOW', 'HIGH'),
+                        help='Frequency band in GHz for the insertion loss and ripple in figures_of_merit.csv (repeatable)')
+    parser.add_argument('--threshold', type=float, default=-10.0, help='Level in dB defining a resonance band (default: -10)')
+    parser.add_argument('--predict-heights', nargs='+', type=float, default=[], metavar='H',
+                        help='Heights in nm at which to predict full sweeps from a spline across the simulated heights')
+    parser.add_argument('--surrogate-degree', type=int, default=3, help='Degree of the spline across height (default: 3)')
+    add_watch_arguments(parser)
+    add_profiler_arguments(parser)
+    args = parser.parse_args()
+    profiler = StageProfiler(os.path.splitext(os.path.basename(__file__))[0], args.profile_stage, args.profiler,
+                             trace_memory=args.trace_memory, memory_budget=args.memory_budget)
+
+    # Take the directory from the command line, or select it using GUI
+    directory = args.directory or select_directory()
 
     if not directory:
         print("No directory selected. Exiting.")
@@ -65,126 +75,38 @@ def main():
     plot_folder = os.path.join(directory, "plots")
     os.makedirs(plot_folder, exist_ok=True)
 
-    # Find all CSV files in the directory and subdirectories
-    csv_files = find_csv_files(directory)
-    if not csv_files:
-        sys.exit(1)  # Exit if no CSV files are found
-
-    # Define a list to keep track of different material data for plotting
-    material_data = []
-    consolidated_data = {
-        'S11': {},
-        'S12': {},
-        'S21': {},
-        'S22': {},
-        'Z11': {},
-        'Z12': {},
-        'Z21': {},
-        'Z22': {},
-        'TDR-Impedance': {},
-        'Z0': {}
-    }  # To keep track of consolidated S-parameter, Z-parameter, TDR-Impedance, and Z0 vs height data
-
-    # Process each CSV file
-    for csv_path in csv_files:
-        try:
-            # Load the CSV data using pandas
-            print(f"Loading CSV file: {os.path.basename(csv_path)}")
-            data = pd.read_csv(csv_path)
-
-            # Extract frequency and convert from MHz to GHz
-            if 'Freq [MHz]' in data.columns:
-                frequency = data['Freq [MHz]'] / 1000.0  # Convert MHz to GHz
-            else:
-                print(f"No frequency column found in '{csv_path}'. Skipping.")
-                continue
-
-            # Identify S-parameter columns
-            s_parameters = {
-                'S11': 'dB(St(1,1)) []',
-                'S12': 'dB(St(1,2)) []',
-                'S21': 'dB(St(2,1)) []',
-                'S22': 'dB(St(2,2)) []'
-            }
-
-            # Extract height from the folder name (assuming folder names are like '200', '400', etc.)
-            height_folder = os.path.basename(os.path.dirname(csv_path))
-            try:
-                height = int(height_folder.replace('nm', ''))  # Directly extract height from folder name
-                print(f"Extracted height: {height} nm from folder: {height_folder}")  # Debugging output
-            except ValueError:
-                print(f"Warning: Couldn't determine height from folder name '{height_folder}'. Skipping...")
-                continue
-
-            # Process each S-parameter column if it exists
-            for param, column_name in s_parameters.items():
-                if column_name in data.columns:
-                    s_param_data = data[column_name]
-
-                    # Store data for averaging across multiple tries
-                    material = os.path.dirname(csv_path).split(os.sep)[-3]  # Use grandparent folder name as material identifier
-                    if param not in consolidated_data:
-                        consolidated_data[param] = {}
-                    if material not in consolidated_data[param]:
-                        consolidated_data[param][material] = {}
-                    if height not in consolidated_data[param][material]:
-                        consolidated_data[param][material][height] = []
-                    consolidated_data[param][material][height].append((frequency, s_param_data))
-
-        except pd.errors.EmptyDataError:
-            print(f"Warning: The file '{csv_path}' is empty or contains only headers. Skipping.")
-        except pd.errors.ParserError as e:
-            print(f"Error parsing '{csv_path}': {e}. Skipping.")
-        except Exception as e:
-            print(f"Error processing '{csv_path}': {e}. Skipping.")
-
-    # Plot S11, S12, S21, S22 parameter against frequency for each material with different heights
-    for param in ['S11', 'S12', 'S21', 'S22']:
-        for material, height_data in consolidated_data[param].items():
-            plt.figure(figsize=(10, 6), dpi=400)  # Set the DPI to 400 for high resolution
-
-            # Iterate over each height and plot the average frequency response
-            for height, data_list in sorted(height_data.items()):
-                # Average the data from multiple tries
-                if len(data_list) > 1:
-                    avg_frequency = data_list[0][0]  # Assuming all tries have the same frequency values
-                    avg_s_param_values = np.mean([s_param.values for _, s_param in data_list], axis=0)
-                else:
-                    avg_frequency, avg_s_param_values = data_list[0]
-
-                plt.plot(avg_frequency, avg_s_param_values, label=f'Height: {height} nm')
-
-            # Labels and legend
-            plt.xlabel('Frequency (GHz)')
-            plt.ylabel(f'{param} Parameter (dB)')
-            # plt.title(f'{param} vs Frequency for {material} (Multi-Line Plot for Different Heights)')
-            plt.legend(loc='upper right')
-
-            # Save the consolidated (multi-line) plot
-            consolidated_plot_path = os.path.join(plot_folder, f"{param}_vs_frequency_{material}.png")
-            plt.savefig(consolidated_plot_path)
-            plt.show()
-            plt.close()
-            print(f"Consolidated (Multi-Line) {param} vs Frequency plot saved: {consolidated_plot_path}")
-
-    # Create summary tables for each S-parameter and material combination
-    for param in ['S11', 'S12', 'S21', 'S22']:
-        for material, height_data in consolidated_data[param].items():
-            summary_data = []
-            for height, data_list in height_data.items():
-                # Average the data from multiple tries
-                if len(data_list) > 1:
-                    avg_s_param_values = np.mean([s_param.values for _, s_param in data_list], axis=0)
-                else:
-                    _, avg_s_param_values = data_list[0]
-                max_value = avg_s_param_values.max()
-                min_value = avg_s_param_values.min()
-                summary_data.append([height, max_value, min_value])
-
-            summary_df = pd.DataFrame(summary_data, columns=['Height (nm)', 'Max Value (dB)', 'Min Value (dB)'])
-            summary_path = os.path.join(plot_folder, f"summary_{param}_impedance_match_{material}.csv")
-            summary_df.to_csv(summary_path, index=False)
-            print(f"Summary table for {param} and {material} saved: {summary_path}")
+    # Average the tries of every S-parameter and material, plot them against frequency for the
+    # different heights, write the summary and figure-of-merit tables and fit the height surrogate;
+    # unchanged inputs are read from the cache
+    cache_dir = None if args.no_cache else default_cache_dir(plot_folder)
+    pipeline = build_hfss_pipeline(directory, plot_folder, S_PARAMETERS, unit='dB', show=not args.watch,
+                                   cache_dir=cache_dir, profiler=profiler, name=profiler.name,
+                                   threshold=args.threshold, bands=args.band, chunk_rows=args.chunk_rows,
+                                   compact=args.compact, duplicates=None if args.duplicates == 'keep' else args.duplicates,
+                                   store_path=args.store, predict_heights=args.predict_heights,
+                                   surrogate_degree=args.surrogate_degree)
+    if args.clear_cache and cache_dir:
+        print(f"Cache cleared: {pipeline.cache.clear()} file(s) removed from {cache_dir}")
+    if args.summary_only:
+        targets = ['summary_tables']
+    else:
+        targets = ['plot_multiline', 'summary_tables', 'figures_of_merit', 'store_results', 'surrogate']
+
+    if args.watch:
+        # Re-run on every new export; the multiline plots are rebuilt from the cached per-file results
+        watch(pipeline, targets, args.interval, args.settle)
+    else:
+        # Find all CSV and Touchstone files in the directory and subdirectories
+        with profiler.stage('discover'):
+            csv_files = discover_files(directory, REPORT_EXTENSIONS, recursive=True, exclude_dirs=('plots',))
+        if not csv_files:
+            print("No CSV or Touchstone files found in the directory and its subdirectories.")
+            sys.exit(1)  # Exit if no CSV files are found
+
+        pipeline.run(targets, items=csv_files)
+        print(pipeline.cache_summary())
+
+    profiler.finish(args.report or os.path.join(plot_folder, 'run_report.json'))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# Generates synthetic datasets with synthetic_data.py and times every analysis pipeline on them.
+# Results are stored as JSON so that later runs can be compared against a baseline.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmark_results')
+
+# Ratio above which a benchmark counts as a regression when comparing against a baseline
+REGRESSION_THRESHOLD = 1.2
+
+
+# ---------------------------- Timing Helpers ---------------------------- #
+
+def time_script(script, script_args, repeat=1, stages=None):
+    """
+    Runs an analysis script in a fresh interpreter and returns its best wall time.
+
+    Parameters:
+    - script (str): File name of the script in the repository.
+    - script_args (list): Command line arguments passed to the script.
+    - repeat (int): Number of runs; the fastest one is reported.
+    - stages (dict): If given, filled with the per-stage wall times of the fastest run,
+      taken from the script's run report (see stage_profiler.py).
+
+    Returns:
+    - seconds (float): The fastest wall time, or None if the script failed.
+    """
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONWARNINGS='ignore')
+    report_path = os.path.join(tempfile.mkdtemp(prefix='bench_report_'), 'run_report.json')
+    if stages is not None:
+        script_args = list(script_args) + ['--report', report_path]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(REPO_DIR, script)] + list(script_args),
+                                cwd=REPO_DIR, env=env, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            print(f"Warning: {script} {' '.join(script_args)} failed:\n{result.stderr.strip()[-500:]}", file=sys.stderr)
+            return None
+        if best is None or elapsed < best:
+            best = elapsed
+            if stages is not None:
+                with open(report_path) as f:
+                    stages.update({f"stage_{name}": entry['wall_s'] for name, entry in json.load(f)['stages'].items()})
+    return best
+
+
+def time_call(function, repeat=1):
+    """
+    Calls a function in this interpreter and returns its best wall time.
+
+    Parameters:
+    - function (callable): Function without arguments.
+    - repeat (int): Number of calls; the fastest one is reported.
+
+    Returns:
+    - seconds (float): The fastest wall time, or None if the function raised.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            print(f"Warning: {getattr(function, '__name__', function)} failed: {e}", file=sys.stderr)
+            return None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# ---------------------------- Benchmark Suite ---------------------------- #
+
+def benchmark_comsol(layout, repeat):
+    """
+    Times the COMSOL scripts: ingest and fit only, then the full run including rendering.
+    """
+    results = {}
+    for name, script in [('diamond', 'Comsol_analysis_diamond.py'), ('glass', 'Comsol_analysis_glass.py')]:
+        folder = layout[f'comsol_{name}']
+        stages = {}
+        fit = time_script(script, [folder, '--no-plots', '--no-cache'], repeat)
+        full = time_script(script, [folder, '--no-cache'], repeat, stages)
+        results[script] = {'ingest_fit': fit, 'total': full,
+                           'render': full - fit if fit is not None and full is not None else None, **stages}
+    return results
+
+
+def benchmark_hfss(layout, repeat):
+    """
+    Times the HFSS plotters: ingest and consolidation only, then the full run including rendering.
+    """
+    results = {}
+    for script in ['ansys_plotter_Arpita_new.py', 'ansys_plotter_Z_prameters.py']:
+        stages = {}
+        consolidate = time_script(script, [layout['hfss'], '--summary-only', '--no-cache'], repeat)
+        full = time_script(script, [layout['hfss'], '--no-cache'], repeat, stages)
+        results[script] = {'ingest_consolidate': consolidate, 'total': full,
+                           'render': full - consolidate if consolidate is not None and full is not None else None, **stages}
+    results['ansys_plotter_Arpita.py'] = {'total': time_script('ansys_plotter_Arpita.py', [layout['hfss']], repeat)}
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import ansys_box_plot
+    import ansys_box_plot_comparison
+
+    plot_folder = tempfile.mkdtemp(prefix='bench_plots_')
+    s_parameters = {'S11': 'dB(St(1,1)) []', 'S12': 'dB(St(1,2)) []',
+                    'S21': 'dB(St(2,1)) []', 'S22': 'dB(St(2,2)) []'}
+    results['ansys_box_plot.py'] = {'total': time_call(
+        lambda: ansys_box_plot.create_multiline_plots(layout['hfss'], s_parameters, plot_folder), repeat)}
+    results['ansys_box_plot_comparison.py'] = {'total': time_call(
+        lambda: ansys_box_plot_comparison.load_and_plot_s21(layout['hfss']), repeat)}
+    return results
+
+
+def benchmark_odmr(layout, repeat):
+    """
+    Times the ODMR background subtraction and the averaged cutline plot.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import plot_cutline_vs_simulation
+
+    processing = plot_cutline_vs_simulation.AverageCutlineProcessing(layout['odmr'], layout['odmr_filenames'])
+    ingest = time_call(processing.remove_background_signal, repeat)
+    render = time_call(lambda: processing.plot_averaged_cutlines(conversion_factor=0.6896551724137931), repeat)
+    return {'plot_cutline_vs_simulation.py': {'ingest_subtract': ingest, 'render': render}}
+
+
+def run_suite(scales, repeat, workdir):
+    """
+    Generates a dataset for every scale and runs every benchmark on it.
+
+    Parameters:
+    - scales (list): Names of the synthetic_data.SCALES presets to run.
+    - repeat (int): Number of repetitions per measurement.
+    - workdir (str): Directory where the datasets are generated.
+
+    Returns:
+    - results (dict): scale -> pipeline -> stage -> seconds.
+    """
+    import contextlib
+    import synthetic_data
+
+    results = {}
+    for scale in scales:
+        print(f"Generating {scale} dataset...")
+        layout = synthetic_data.generate(os.path.join(workdir, scale), scale)
+        results[scale] = {}
+        # The scripts print progress for every file; keep the benchmark output readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for benchmark in (benchmark_comsol, benchmark_hfss, benchmark_odmr):
+                results[scale].update(benchmark(layout, repeat))
+        for pipeline, stages in results[scale].items():
+            timings = ', '.join(f"{stage}={seconds:.3f}s" if seconds is not None else f"{stage}=failed"
+                                for stage, seconds in stages.items())
+            print(f"[{scale}] {pipeline}: {timings}")
+    return results
+
+
+# ---------------------------- Baseline Comparison ---------------------------- #
+
+def compare(results, baseline):
+    """
+    Prints the ratio of every timing to the baseline and returns the number of regressions.
+
+    Parameters:
+    - results (dict): Results of the current run.
+    - baseline (dict): Results of a previous run, as stored by this script.
+
+    Returns:
+    - regressions (int): Number of timings slower than REGRESSION_THRESHOLD times the baseline.
+    """
+    regressions = 0
+    for scale, pipelines in results.items():
+        for pipeline, stages in pipelines.items():
+            for stage, seconds in stages.items():
+                reference = baseline.get(scale, {}).get(pipeline, {}).get(stage)
+                if seconds is None or not reference:
+                    continue
+                ratio = seconds / reference
+                flag = ''
+                if ratio > REGRESSION_THRESHOLD:
+                    flag = '  <-- regression'
+                    regressions += 1
+                print(f"[{scale}] {pipeline} {stage}: {reference:.3f}s -> {seconds:.3f}s ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark every analysis pipeline on synthetic data.')
+    parser.add_argument('--scale', action='append', choices=['small', 'medium', 'large'],
+                        help='Dataset scale to run (repeatable, default: small and medium)')
+    parser.add_argument('--repeat', type=int, default=1, help='Repetitions per measurement, the fastest is kept')
+    parser.add_argument('--save', help='Name under which the results are stored in benchmark_results/')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--workdir', help='Directory for the generated datasets (default: a temporary directory)')
+    args = parser.parse_args()
+
+    scales = args.scale or ['small', 'medium']
+    with tempfile.TemporaryDirectory(prefix='bench_data_') as tmp:
+        results = run_suite(scales, args.repeat, args.workdir or tmp)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{args.save}.json")
+        with open(path, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.node(),
+                       'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, indent=2)
+        print(f"Benchmark results saved: {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# Bootstrap confidence intervals of straight-line slopes.
+#
+# For every cutline, the replicates are drawn as one matrix of resampled indices
+# (replicates x points) and all of them are fitted in one batched pass: for ordinary
+# least squares from the row sums of x, y, x^2 and xy of the resampled points; for a
+# robust fit, by passing the resampled stack to robust_fit.robust_line_fit as that many
+# lines. Replicates are drawn in blocks bounded by block_elements.
+#
+# Seeding is reproducible and independent of the process pool: every cutline gets its own
+# child of np.random.SeedSequence(seed), in the order the cutlines are given, so the
+# intervals do not change with the number of workers or the chunking of the work.
+# numpy is imported inside the functions (see check_startup_time.py).
+
+import os
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+from robust_fit import robust_line_fit
+
+# Default number of bootstrap replicates
+DEFAULT_REPLICATES = 10_000
+
+# Default confidence level of the intervals
+DEFAULT_CONFIDENCE = 0.95
+
+
+@dataclass
+class SlopeInterval:
+    """
+    Bootstrap percentile interval of the slope and intercept of one cutline.
+
+    Attributes:
+    - slope, intercept (float): Fit of the original points.
+    - slope_low, slope_high (float): Interval of the slope.
+    - intercept_low, intercept_high (float): Interval of the intercept.
+    - replicates (int): Number of bootstrap replicates.
+    - confidence (float): Confidence level, e.g. 0.95.
+    """
+    slope: float
+    intercept: float
+    slope_low: float
+    slope_high: float
+    intercept_low: float
+    intercept_high: float
+    replicates: int
+    confidence: float
+
+    def __str__(self):
+        return (f"{self.slope:.6g} ({100 * self.confidence:g}% CI {self.slope_low:.6g} to {self.slope_high:.6g}, "
+                f"{self.replicates} replicates)")
+
+
+def _line_from_sums(x, y):
+    """
+    Least-squares line of every row of (replicates, points) arrays. The sums are taken about
+    the row means: x*x - n*mean(x)^2 loses every digit when the positions are far from zero.
+    """
+    import numpy as np
+
+    mean_x = x.mean(axis=-1)
+    mean_y = y.mean(axis=-1)
+    dx = x - mean_x[:, None]
+    sxx = np.einsum('ij,ij->i', dx, dx)
+    sxy = np.einsum('ij,ij->i', dx, y - mean_y[:, None])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)  # A replicate of one repeated x has no slope
+    return slope, mean_y - slope * mean_x
+
+
+# Function to bootstrap the line fit of one cutline
+def bootstrap_slope(x, y, replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, seed=0,
+                    method='ols', block_elements=4_000_000):
+    """
+    Bootstraps the straight-line fit of one cutline by resampling its points with replacement.
+
+    Parameters:
+    - x (ndarray): Positions.
+    - y (ndarray): Values; points where x or y is NaN are left out.
+    - replicates (int): Number of bootstrap replicates.
+    - confidence (float): Confidence level of the percentile intervals.
+    - seed (int or SeedSequence): Seed of the resampling.
+    - method (str): 'ols', or a robust method of robust_fit ('huber', 'tukey', 'ransac').
+    - block_elements (int): Maximum number of resampled points drawn at once.
+
+    Returns:
+    - interval (SlopeInterval): The fit and its intervals.
+
+    Raises:
+    - ValueError: If the cutline is too long for 32-bit resampling indices.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    if len(x) >= 2 ** 31:
+        raise ValueError("Cutlines of 2**31 points or more cannot be bootstrapped.")
+    rng = np.random.default_rng(seed)
+
+    if method == 'ols':
+        fit = lambda xs, ys: _line_from_sums(xs, ys)
+    else:
+        fit = lambda xs, ys: (lambda f: (f.slope, f.intercept))(robust_line_fit(xs, ys, method))
+    slope, intercept = (float(v[0]) for v in fit(x[None], y[None]))
+
+    slopes, intercepts = [], []
+    block = max(1, block_elements // max(len(x), 1))
+    for start in range(0, replicates, block):
+        index = rng.integers(0, len(x), size=(min(block, replicates - start), len(x)), dtype=np.int32)
+        s, b = fit(x[index], y[index])
+        slopes.append(s)
+        intercepts.append(b)
+    slopes, intercepts = np.concatenate(slopes), np.concatenate(intercepts)
+
+    tail = 100 * (1 - confidence) / 2
+    slope_low, slope_high = np.nanpercentile(slopes, [tail, 100 - tail])
+    intercept_low, intercept_high = np.nanpercentile(intercepts, [tail, 100 - tail])
+    return SlopeInterval(slope, intercept, float(slope_low), float(slope_high),
+                         float(intercept_low), float(intercept_high), replicates, confidence)
+
+
+def _bootstrap_chunk(cutlines, seeds, replicates, confidence, method):
+    """
+    Worker: bootstraps a chunk of cutlines with their own seeds.
+    """
+    return [bootstrap_slope(x, y, replicates, confidence, seed, method) for (x, y), seed in zip(cutlines, seeds)]
+
+
+# Function to bootstrap many cutlines over a process pool
+def bootstrap_slopes(cutlines, replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, seed=0,
+                     method='ols', workers=None):
+    """
+    Bootstraps the line fit of every cutline, in chunks spread over a process pool.
+
+    Parameters:
+    - cutlines (list): (x, y) pairs.
+    - replicates (int): Number of bootstrap replicates per cutline.
+    - confidence (float): Confidence level of the percentile intervals.
+    - seed (int): Seed of the campaign; cutline k always uses child k of SeedSequence(seed).
+    - method (str): 'ols' or a robust method of robust_fit.
+    - workers (int): Number of worker processes (default: one per CPU; 1 runs in this process).
+
+    Returns:
+    - intervals (list): One SlopeInterval per cutline, in the given order.
+    """
+    import numpy as np
+
+    cutlines = [(np.asarray(x), np.asarray(y)) for x, y in cutlines]
+    seeds = np.random.SeedSequence(seed).spawn(len(cutlines))
+    workers = min(workers or os.cpu_count() or 1, len(cutlines))
+    if workers <= 1:
+        return _bootstrap_chunk(cutlines, seeds, replicates, confidence, method)
+
+    # A few chunks per worker balance files of different lengths
+    chunk = max(1, -(-len(cutlines) // (4 * workers)))
+    starts = range(0, len(cutlines), chunk)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_bootstrap_chunk, cutlines[s:s + chunk], seeds[s:s + chunk], replicates, confidence, method)
+                   for s in starts]
+        return [interval for future in futures for interval in future.result()]
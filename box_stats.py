@@ -0,0 +1,119 @@
+# Box-plot statistics computed in bulk.
+#
+# plt.boxplot copies and sorts every series it is given, one at a time. Here all
+# series are stacked into one (groups x samples) array and the quartiles of every
+# group come out of a single percentile call; whiskers and outliers are found with
+# masked reductions over the same array. The result is the list of dicts that
+# Axes.bxp draws directly, so rendering no longer depends on the sweep sizes.
+# numpy is imported inside the functions (see check_startup_time.py).
+
+
+# Function to stack series of possibly different lengths into one array
+def stack_rows(rows):
+    """
+    Stacks 1-D series into a (len(rows) x longest) float array, padding short rows with NaN.
+
+    Parameters:
+    - rows (list): Arrays or pandas Series.
+
+    Returns:
+    - stacked (ndarray): The padded array.
+    """
+    import numpy as np
+
+    rows = [np.asarray(row, dtype=float).ravel() for row in rows]
+    lengths = {len(row) for row in rows}
+    if len(lengths) == 1 and 0 not in lengths:
+        return np.stack(rows)
+    stacked = np.full((len(rows), max(max(lengths, default=0), 1)), np.nan)  # Empty series become one NaN
+    for k, row in enumerate(rows):
+        stacked[k, :len(row)] = row
+    return stacked
+
+
+# Function to compute the statistics drawn by a box plot for many groups at once
+def box_statistics(rows, labels=None, whis=1.5):
+    """
+    Computes quartiles, whiskers, means and outliers of every series, as plt.boxplot would.
+
+    Parameters:
+    - rows (list or ndarray): Series (any lengths) or a 2-D array with one group per row.
+    - labels (list): Label of every group.
+    - whis (float): Whisker reach in multiples of the interquartile range.
+
+    Returns:
+    - stats (list): One dict per group with the keys used by Axes.bxp
+      (med, q1, q3, whislo, whishi, mean, fliers, label).
+    """
+    import warnings
+    import numpy as np
+
+    data = stack_rows(rows) if not isinstance(rows, np.ndarray) or rows.ndim != 2 else rows.astype(float, copy=False)
+    n_groups = data.shape[0]
+    if n_groups == 0:
+        return []
+
+    ragged = np.isnan(data).any()
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN (empty) groups simply give NaN statistics
+        percentile = np.nanpercentile if ragged else np.percentile
+        q1, med, q3 = percentile(data, [25, 50, 75], axis=1)
+        mean = np.nanmean(data, axis=1) if ragged else data.mean(axis=1)
+
+        # Whiskers reach the most extreme samples within whis * IQR of the box
+        iqr = q3 - q1
+        low, high = (q1 - whis * iqr)[:, None], (q3 + whis * iqr)[:, None]
+        inside = (data >= low) & (data <= high)
+        whislo = np.minimum(np.where(inside, data, np.inf).min(axis=1), q1)
+        whishi = np.maximum(np.where(inside, data, -np.inf).max(axis=1), q3)
+        outside = (data < low) | (data > high)
+
+    labels = labels if labels is not None else [None] * n_groups
+    stats = []
+    for k in range(n_groups):
+        stats.append({'med': med[k], 'q1': q1[k], 'q3': q3[k], 'whislo': whislo[k], 'whishi': whishi[k],
+                      'mean': mean[k], 'fliers': data[k][outside[k]], 'label': labels[k]})
+    return stats
+
+
+# Function to compute the box-plot statistics of every try in the consolidated data
+def consolidated_box_statistics(consolidated_data, params=None, whis=1.5):
+    """
+    Computes the statistics of every (param, material, height, try) group of a
+    consolidated_data[param][material][height] = [(frequency, values), ...] store in one call.
+
+    Parameters:
+    - consolidated_data (dict): The consolidated store of the HFSS scripts.
+    - params (list): Parameters to include (default: all).
+    - whis (float): Whisker reach in multiples of the interquartile range.
+
+    Returns:
+    - stats (dict): (param, material, height, try_index) -> statistics dict (see box_statistics).
+    """
+    keys, rows = [], []
+    for param in params or list(consolidated_data):
+        for material, height_data in consolidated_data.get(param, {}).items():
+            for height, data_list in sorted(height_data.items()):
+                for try_index, (_, values) in enumerate(data_list):
+                    keys.append((param, material, height, try_index))
+                    rows.append(values)
+    return dict(zip(keys, box_statistics(rows, whis=whis)))
+
+
+# Function to draw precomputed box-plot statistics
+def draw_box_plots(ax, stats, labels=None, **kwargs):
+    """
+    Draws precomputed statistics with Axes.bxp.
+
+    Parameters:
+    - ax (Axes): The axes to draw on.
+    - stats (list): Statistics dicts from box_statistics.
+    - labels (list): Tick labels replacing the stored ones.
+    - kwargs: Passed on to Axes.bxp.
+
+    Returns:
+    - artists (dict): The artists created by Axes.bxp.
+    """
+    if labels is not None:
+        stats = [dict(s, label=label) for s, label in zip(stats, labels)]
+    return ax.bxp(stats, **kwargs)
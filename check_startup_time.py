@@ -0,0 +1,96 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Entry points whose startup cost is checked
+ENTRY_POINTS = [
+    'Comsol_analysis_diamond',
+    'Comsol_analysis_glass',
+    'ansys_box_plot',
+    'ansys_box_plot_comparison',
+    'ansys_plotter',
+    'ansys_plotter_Arpita',
+    'ansys_plotter_Arpita_new',
+    'ansys_plotter_Z_prameters',
+    'comsol_grid',
+    'plot_cutline_vs_simulation',
+    'results_store',
+]
+
+# Dependencies that must only be imported by the code path that needs them
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'sklearn', 'scipy', 'h5py', 'tkinter']
+
+# Import-time budget per entry point, in seconds
+DEFAULT_BUDGET = 0.2
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+# Function to measure the import time of a module with `python -X importtime`
+def measure_import_time(module_name, directory):
+    """
+    Imports a module in a fresh interpreter with `-X importtime` and parses the report.
+
+    Parameters:
+    - module_name (str): The name of the module to import.
+    - directory (str): The directory the module is imported from.
+
+    Returns:
+    - total_seconds (float): Cumulative import time of the module itself.
+    - imported (list): Names of every module imported along the way.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        cwd=directory, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing '{module_name}' failed:\n{result.stderr}")
+
+    total_us = 0
+    imported = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.append(name)
+        if name == module_name and len(indent) == 1:
+            total_us = cumulative_us
+    return total_us / 1e6, imported
+
+
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Check the startup time of every analysis entry point.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='Import-time budget per entry point in seconds')
+    args = parser.parse_args()
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    failures = 0
+    for module_name in ENTRY_POINTS:
+        try:
+            total_seconds, imported = measure_import_time(module_name, directory)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            failures += 1
+            continue
+
+        heavy = sorted({name.split('.')[0] for name in imported if name.split('.')[0] in HEAVY_MODULES})
+        status = 'OK'
+        if total_seconds > args.budget or heavy:
+            status = 'FAIL'
+            failures += 1
+        print(f"{status:4} {module_name}: {total_seconds * 1000:.1f} ms"
+              + (f" (eagerly imports {', '.join(heavy)})" if heavy else ''))
+
+    if failures:
+        print(f"{failures} entry point(s) exceed the startup budget of {args.budget * 1000:.0f} ms.")
+        sys.exit(1)
+    print(f"All entry points start within {args.budget * 1000:.0f} ms.")
+
+if __name__ == '__main__':
+    main()
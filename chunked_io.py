@@ -0,0 +1,237 @@
+# Chunked reading of large exports.
+#
+# Instead of loading a whole file with np.loadtxt or pd.read_csv, the readers below
+# yield blocks of at most chunk_rows rows, and the reducers fold every block into a
+# fixed-size state, so the memory used by a file is bounded by the chunk size:
+#   - PolynomialAccumulator: least-squares polynomial fit, updated with one QR
+#     factorisation per block; accumulators of different files can be merged.
+#   - Decimator: keeps at most max_points evenly strided rows for plotting.
+# numpy and pandas are imported inside the functions (see check_startup_time.py).
+
+import itertools
+
+# Default number of rows per block
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Default number of rows kept per file for plotting
+DEFAULT_MAX_POINTS = 20_000
+
+
+# Function to read a whitespace-separated text export in blocks of rows
+def iter_text_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, skiprows=0, usecols=None):
+    """
+    Reads a text export (e.g. a COMSOL cutline) block by block, as np.loadtxt would read it whole.
+
+    Parameters:
+    - path (str): Path of the file.
+    - chunk_rows (int): Maximum number of lines per block.
+    - skiprows (int): Number of header lines to skip.
+    - usecols (tuple): Columns to keep (default: all).
+
+    Yields:
+    - block (ndarray): Float array of shape (rows, columns); blank blocks are skipped.
+    """
+    import warnings
+    import numpy as np
+
+    with open(path, 'r') as f:
+        for _ in itertools.islice(f, skiprows):
+            pass
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)  # Blocks of blank lines are not an error
+                block = np.loadtxt(lines, usecols=usecols, ndmin=2)
+            if block.size:
+                yield block
+
+
+# Function to read a CSV report in blocks of rows
+def iter_csv_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, usecols=None):
+    """
+    Reads a CSV report (e.g. an HFSS export) block by block.
+
+    Parameters:
+    - path (str): Path of the file.
+    - chunk_rows (int): Maximum number of rows per block.
+    - usecols (list): Columns to keep (default: all).
+
+    Yields:
+    - block (DataFrame): The next rows of the report.
+    """
+    import pandas as pd
+
+    with pd.read_csv(path, chunksize=chunk_rows, usecols=usecols) as reader:
+        yield from reader
+
+
+class PolynomialAccumulator:
+    """
+    Least-squares polynomial fit built up block by block.
+
+    The design matrix of every block is appended to the triangular factor R of the
+    previous blocks and re-factorised, so the state is only (degree + 1)^2 numbers.
+    Powers are taken of x shifted and scaled by the first block, which keeps the
+    factorisation as well conditioned as np.polyfit.
+
+    Parameters:
+    - degree (int): Degree of the polynomial.
+    """
+
+    def __init__(self, degree):
+        self.degree = degree
+        self.count = 0
+        self.shift = 0.0
+        self.scale = 1.0
+        self._r = None
+        self._qty = None
+
+    def _vandermonde(self, x):
+        import numpy as np
+        return np.vander((x - self.shift) / self.scale, self.degree + 1, increasing=True)
+
+    def _absorb(self, a, b):
+        import numpy as np
+
+        if self._r is not None:
+            a = np.vstack([self._r, a])
+            b = np.concatenate([self._qty, b])
+        q, r = np.linalg.qr(a)
+        self._r, self._qty = r, q.T @ b
+
+    def update(self, x, y):
+        """
+        Adds a block of points to the fit.
+
+        Parameters:
+        - x (ndarray): Positions.
+        - y (ndarray): Values.
+        """
+        import numpy as np
+
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        if not len(x):
+            return
+        if self._r is None:
+            self.shift = float(x.mean())
+            self.scale = float(np.ptp(x)) / 2 or max(abs(self.shift), 1.0)
+        self._absorb(self._vandermonde(x), y)
+        self.count += len(x)
+
+    def _rebased_r(self, other):
+        """
+        Returns the R factor of another accumulator expressed in this accumulator's powers:
+        with u = (x - self.shift) / self.scale = alpha * t + beta, column k of the change of
+        basis holds the binomial expansion of u^k in powers of t.
+        """
+        import math
+        import numpy as np
+
+        alpha = other.scale / self.scale
+        beta = (other.shift - self.shift) / self.scale
+        n = self.degree + 1
+        basis = np.zeros((n, n))
+        for k in range(n):
+            for j in range(k + 1):
+                basis[j, k] = math.comb(k, j) * alpha ** j * beta ** (k - j)
+        return other._r @ basis
+
+    def merge(self, other):
+        """
+        Adds the points of another accumulator of the same degree to this one.
+
+        Parameters:
+        - other (PolynomialAccumulator): Accumulator of other points.
+
+        Returns:
+        - self (PolynomialAccumulator): This accumulator, for chaining.
+        """
+        if other.degree != self.degree:
+            raise ValueError(f"Cannot merge fits of degree {other.degree} and {self.degree}.")
+        if other._r is None:
+            return self
+        if self._r is None:
+            self.shift, self.scale = other.shift, other.scale
+            self._r, self._qty, self.count = other._r.copy(), other._qty.copy(), other.count
+            return self
+        self._absorb(self._rebased_r(other), other._qty)
+        self.count += other.count
+        return self
+
+    def coefficients(self):
+        """
+        Solves the accumulated least-squares problem.
+
+        Returns:
+        - coefficients (ndarray): Polynomial coefficients, highest power first (as np.polyfit).
+
+        Raises:
+        - ValueError: If no points were added.
+        """
+        import numpy as np
+        from numpy.polynomial import Polynomial
+
+        if self._r is None:
+            raise ValueError("No points were added to the fit.")
+        scaled = np.linalg.lstsq(self._r, self._qty, rcond=None)[0]
+        # Map the powers of (x - shift) / scale back to powers of x
+        window = [self.shift - self.scale, self.shift + self.scale]
+        return Polynomial(scaled, domain=window).convert().coef[::-1]
+
+
+class Decimator:
+    """
+    Keeps at most max_points rows of a stream, evenly strided. Whenever the buffer
+    overflows, every other kept row is dropped and the stride doubles, so the kept rows
+    depend only on their position in the stream (files of equal length keep the same rows).
+
+    Parameters:
+    - max_points (int): Maximum number of rows kept.
+    """
+
+    def __init__(self, max_points=DEFAULT_MAX_POINTS):
+        self.max_points = max(int(max_points), 2)
+        self.stride = 1
+        self.seen = 0
+        self._index = []
+        self._columns = None
+
+    def update(self, *columns):
+        """
+        Adds a block of rows, given as one array per column.
+        """
+        import numpy as np
+
+        n = len(columns[0])
+        positions = np.arange(self.seen, self.seen + n)
+        keep = positions % self.stride == 0
+        self.seen += n
+        if self._columns is None:
+            self._columns = [[] for _ in columns]
+        self._index.append(positions[keep])
+        for kept, column in zip(self._columns, columns):
+            kept.append(np.asarray(column)[keep])
+        while sum(len(i) for i in self._index) > self.max_points:
+            self._compact()
+
+    def _compact(self):
+        import numpy as np
+
+        self.stride *= 2
+        index = np.concatenate(self._index)
+        keep = index % self.stride == 0
+        self._index = [index[keep]]
+        self._columns = [[np.concatenate(kept)[keep]] for kept in self._columns]
+
+    def result(self):
+        """
+        Returns the kept rows.
+
+        Returns:
+        - columns (tuple): One array per column.
+        """
+        import numpy as np
+        return tuple(np.concatenate(kept) for kept in self._columns or [])
@@ -0,0 +1,448 @@
+import os
+import json
+import argparse
+
+from chunked_io import DEFAULT_CHUNK_ROWS, iter_text_chunks
+from figure_writer import savefig
+
+# Memory-mapped volumes of COMSOL regular-grid exports.
+#
+# A 2D slice or 3D grid exported from COMSOL as a spreadsheet (header lines starting
+# with '%', then one row per point: x y [z] and one column per expression) is far too
+# large for np.loadtxt. convert_grid_export reads it once in blocks of rows and writes
+# the values into a binary .npy volume of shape (len(x), len(y)[, len(z)], fields),
+# with the axes and field names in a .json file next to it. open_grid maps the volume
+# back into memory (np.load with mmap_mode), so slices and cutlines along the grid axes
+# are views that only read the pages they touch, and region averages are reduced slab
+# by slab. COMSOL writes NaN for points outside the geometry; the number of points whose
+# fields are all NaN is kept in the .json file.
+#
+#   python comsol_grid.py gradient_3d.txt --slice z 0
+#   python comsol_grid.py gradient_3d.txt --cutline x --at y=0 z=-2
+#   python comsol_grid.py gradient_3d.txt --region x=-5:5 y=-5:5 z=-3:-1
+# numpy and matplotlib are imported inside the functions (see check_startup_time.py).
+
+# Relative tolerance, in units of the axis span, under which two coordinates are the same grid line
+AXIS_TOLERANCE = 1e-9
+
+
+# Function to read the column names of a COMSOL export
+def read_grid_header(path):
+    """
+    Reads the '%' header of a COMSOL spreadsheet export.
+
+    Parameters:
+    - path (str): Path of the export.
+
+    Returns:
+    - header_rows (int): Number of header lines.
+    - names (list): Column names of the last header line, e.g. ['x', 'y', 'z', 'mf.Bz (T)'],
+      or an empty list if the export has no header.
+    """
+    import re
+
+    header_rows, last = 0, ''
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.startswith('%'):
+                break
+            header_rows += 1
+            last = line
+    # Columns are separated by runs of spaces; names may contain single spaces, e.g. 'mf.Bz (T)'
+    names = [name for name in re.split(r'\s{2,}|\t', last.lstrip('%').strip()) if name]
+    return header_rows, names
+
+
+def _merge_close(values, tolerance):
+    """
+    Sorts coordinates and merges those closer than tolerance into one grid line.
+    """
+    import numpy as np
+
+    values = np.unique(values)
+    if len(values) < 2:
+        return values
+    keep = np.concatenate([[True], np.diff(values) > tolerance])
+    return values[keep]
+
+
+def _metadata_path(volume_path):
+    return os.path.splitext(volume_path)[0] + '.json'
+
+
+# Function to convert a COMSOL grid export into a memory-mapped volume
+def convert_grid_export(path, volume_path=None, dimensions=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Converts a COMSOL regular-grid export into a .npy volume plus a .json file of axes,
+    reading the text twice in blocks of chunk_rows rows: once to find the grid lines of
+    every axis, once to write every row into its cell.
+
+    Parameters:
+    - path (str): Path of the export.
+    - volume_path (str): Path of the .npy volume (default: the export path with .npy).
+    - dimensions (int): Number of coordinate columns, 2 or 3 (default: guessed from the header,
+      i.e. the leading columns named x, y and z).
+    - chunk_rows (int): Rows per block.
+
+    Returns:
+    - volume_path (str): Path of the written volume.
+
+    Raises:
+    - ValueError: If the export is empty or its points do not lie on a regular grid (every
+      point of the grid spanned by its coordinates must appear exactly once).
+    """
+    import numpy as np
+
+    header_rows, names = read_grid_header(path)
+    if dimensions is None:
+        dimensions = 0
+        while dimensions < 3 and dimensions < len(names) and names[dimensions].lower() in ('x', 'y', 'z', 'r'):
+            dimensions += 1
+        dimensions = dimensions if dimensions >= 2 else 3
+    volume_path = volume_path or os.path.splitext(path)[0] + '.npy'
+
+    # Pass 1: grid lines of every axis and number of rows
+    coordinates = [[] for _ in range(dimensions)]
+    rows, columns = 0, None
+    for block in iter_text_chunks(path, chunk_rows, header_rows):
+        columns = block.shape[1]
+        rows += len(block)
+        for k in range(dimensions):
+            coordinates[k] = np.unique(np.concatenate([np.asarray(coordinates[k]), block[:, k]]))
+    if not rows:
+        raise ValueError(f"No data rows in {os.path.basename(path)}.")
+    if columns <= dimensions:
+        raise ValueError(f"{os.path.basename(path)} has no value columns after {dimensions} coordinates.")
+    axes = []
+    for values in coordinates:
+        span = values[-1] - values[0]
+        axes.append(_merge_close(values, AXIS_TOLERANCE * span if span else 0.0))
+    shape = tuple(len(axis) for axis in axes)
+    if rows != int(np.prod(shape)):
+        raise ValueError(f"{os.path.basename(path)} has {rows} rows for a grid of {'x'.join(map(str, shape))} points; "
+                         "it is not a regular-grid export.")
+
+    # Pass 2: every row into its cell; with as many rows as cells, no cell may be hit twice.
+    # The cells already written are tracked one bit per point.
+    fields = columns - dimensions
+    volume = np.lib.format.open_memmap(volume_path, mode='w+', dtype=np.float64, shape=shape + (fields,))
+    volume[...] = np.nan
+    filled = np.zeros((rows + 7) // 8, dtype=np.uint8)
+    missing = 0
+    try:
+        for block in iter_text_chunks(path, chunk_rows, header_rows):
+            index = tuple(_nearest(axis, block[:, k]) for k, axis in enumerate(axes))
+            cells = np.ravel_multi_index(index, shape)
+            if ((filled[cells >> 3] >> (cells & 7)) & 1).any() or len(np.unique(cells)) < len(cells):
+                raise ValueError(f"{os.path.basename(path)} has several rows on the same point of its "
+                                 f"{'x'.join(map(str, shape))} grid; it is not a regular-grid export.")
+            np.bitwise_or.at(filled, cells >> 3, (1 << (cells & 7)).astype(np.uint8))
+            volume[index] = block[:, dimensions:]
+            missing += int(np.isnan(block[:, dimensions:]).all(axis=1).sum())
+        volume.flush()
+    except BaseException:
+        del volume
+        os.remove(volume_path)
+        raise
+    del volume
+
+    default_names = ['x', 'y', 'z'][:dimensions] + [f'field{k + 1}' for k in range(fields)]
+    names = names if len(names) == columns else default_names
+    metadata = {
+        'source': os.path.abspath(path),
+        'size': os.path.getsize(path),
+        'mtime': os.path.getmtime(path),
+        'coordinates': names[:dimensions],
+        'fields': names[dimensions:],
+        'axes': [axis.tolist() for axis in axes],
+        'missing_points': missing,
+    }
+    with open(_metadata_path(volume_path), 'w') as f:
+        json.dump(metadata, f)
+    return volume_path
+
+
+def _nearest(axis, values):
+    """
+    Returns the index of the grid line nearest to every value.
+    """
+    import numpy as np
+
+    index = np.clip(np.searchsorted(axis, values), 1, max(len(axis) - 1, 1))
+    if len(axis) == 1:
+        return np.zeros(len(np.atleast_1d(values)), dtype=int)
+    lower = np.abs(values - axis[index - 1]) <= np.abs(axis[index] - values)
+    return index - lower
+
+
+class GridField:
+    """
+    Memory-mapped volume of a COMSOL grid export. Extractions along the grid axes return
+    views into the mapped file; nothing is read until the values are used.
+
+    Attributes:
+    - coordinates (list): Names of the axes, e.g. ['x', 'y', 'z'].
+    - axes (list): Grid lines of every axis.
+    - fields (list): Names of the exported expressions.
+    - values (memmap): Volume of shape (len(x), len(y)[, len(z)], len(fields)).
+    - missing (int): Number of points whose fields are all NaN (e.g. outside the geometry).
+    """
+
+    def __init__(self, volume_path):
+        import numpy as np
+
+        with open(_metadata_path(volume_path), 'r') as f:
+            metadata = json.load(f)
+        self.path = volume_path
+        self.coordinates = metadata['coordinates']
+        self.fields = metadata['fields']
+        self.axes = [np.asarray(axis) for axis in metadata['axes']]
+        self.missing = metadata.get('missing_points', 0)
+        self.values = np.load(volume_path, mmap_mode='r')
+
+    @property
+    def shape(self):
+        return self.values.shape[:-1]
+
+    def axis_number(self, axis):
+        """
+        Returns the position of an axis given by name ('x') or number.
+        """
+        if isinstance(axis, str):
+            if axis not in self.coordinates:
+                raise ValueError(f"Unknown axis '{axis}'; the grid has {', '.join(self.coordinates)}.")
+            return self.coordinates.index(axis)
+        return axis
+
+    def field_number(self, field=None):
+        """
+        Returns the position of a field given by name, number or None (the first field).
+        """
+        if field is None:
+            return 0
+        if isinstance(field, str):
+            matches = [k for k, name in enumerate(self.fields) if name == field or name.split(' (')[0] == field]
+            if not matches:
+                raise ValueError(f"Unknown field '{field}'; the grid has {', '.join(self.fields)}.")
+            return matches[0]
+        return field
+
+    def index(self, axis, position):
+        """
+        Returns the index of the grid line of an axis nearest to position.
+        """
+        import numpy as np
+        return int(_nearest(self.axes[self.axis_number(axis)], np.atleast_1d(float(position)))[0])
+
+    def field(self, field=None):
+        """
+        Returns the whole volume of one field as a view.
+        """
+        return self.values[..., self.field_number(field)]
+
+    def slice(self, axis, position, field=None):
+        """
+        Extracts the slice of one field at the grid line of an axis nearest to position.
+
+        Returns:
+        - axes (list): Grid lines of the remaining axes.
+        - values (memmap): View of shape given by the remaining axes.
+        - position (float): The grid line actually used.
+        """
+        number = self.axis_number(axis)
+        k = self.index(number, position)
+        selection = [slice(None)] * len(self.shape) + [self.field_number(field)]
+        selection[number] = k
+        remaining = [a for n, a in enumerate(self.axes) if n != number]
+        return remaining, self.values[tuple(selection)], float(self.axes[number][k])
+
+    def cutline(self, axis, at=None, field=None):
+        """
+        Extracts the cutline of one field along an axis, through the grid lines of the other
+        axes nearest to the positions in at (default: the middle of each axis).
+
+        Parameters:
+        - axis (str or int): Axis the cutline runs along.
+        - at (dict): Axis -> position for the other axes.
+        - field (str or int): Field to extract (default: the first).
+
+        Returns:
+        - positions (ndarray): Grid lines along the cutline.
+        - values (memmap): View of the field along the cutline.
+        """
+        number = self.axis_number(axis)
+        at = {self.axis_number(a): p for a, p in (at or {}).items()}
+        selection = []
+        for n, grid_lines in enumerate(self.axes):
+            if n == number:
+                selection.append(slice(None))
+            elif n in at:
+                selection.append(self.index(n, at[n]))
+            else:
+                selection.append(len(grid_lines) // 2)
+        selection.append(self.field_number(field))
+        return self.axes[number], self.values[tuple(selection)]
+
+    def region(self, bounds, field=None):
+        """
+        Extracts the box of one field between the given bounds (inclusive).
+
+        Parameters:
+        - bounds (dict): Axis -> (low, high); axes not given are taken whole.
+
+        Returns:
+        - axes (list): Grid lines of every axis inside the box.
+        - values (memmap): View of the box.
+        """
+        import numpy as np
+
+        bounds = {self.axis_number(a): b for a, b in bounds.items()}
+        selection, axes = [], []
+        for n, grid_lines in enumerate(self.axes):
+            low, high = bounds.get(n, (grid_lines[0], grid_lines[-1]))
+            start = int(np.searchsorted(grid_lines, min(low, high), side='left'))
+            stop = int(np.searchsorted(grid_lines, max(low, high), side='right'))
+            selection.append(slice(start, stop))
+            axes.append(grid_lines[start:stop])
+        selection.append(self.field_number(field))
+        return axes, self.values[tuple(selection)]
+
+    def region_mean(self, bounds, field=None):
+        """
+        Averages one field over a box, ignoring missing points. The box is reduced one slab
+        of the first axis at a time, so only one slab is ever held in memory.
+
+        Returns:
+        - mean (float): Mean of the field in the box (NaN if the box holds no data).
+        - count (int): Number of points averaged.
+        """
+        import numpy as np
+
+        _, box = self.region(bounds, field)
+        total, count = 0.0, 0
+        for slab in box:
+            valid = ~np.isnan(slab)
+            total += float(np.sum(slab, where=valid))
+            count += int(np.count_nonzero(valid))
+        return (total / count if count else float('nan')), count
+
+
+# Function to open a grid export, converting it on first use
+def open_grid(path, dimensions=None, chunk_rows=DEFAULT_CHUNK_ROWS, rebuild=False):
+    """
+    Opens the memory-mapped volume of a COMSOL grid export. The export is converted the first
+    time, and again whenever its size or modification time differs from the converted one.
+
+    Parameters:
+    - path (str): Path of the export (.txt) or of an existing volume (.npy).
+    - dimensions (int): Number of coordinate columns (see convert_grid_export).
+    - chunk_rows (int): Rows per block while converting.
+    - rebuild (bool): Convert again even if the volume is up to date.
+
+    Returns:
+    - grid (GridField): The mapped volume.
+    """
+    if path.endswith('.npy'):
+        return GridField(path)
+    volume_path = os.path.splitext(path)[0] + '.npy'
+    up_to_date = False
+    if not rebuild and os.path.exists(volume_path) and os.path.exists(_metadata_path(volume_path)):
+        with open(_metadata_path(volume_path), 'r') as f:
+            metadata = json.load(f)
+        up_to_date = (metadata.get('size') == os.path.getsize(path) and metadata.get('mtime') == os.path.getmtime(path)
+                      and 'missing_points' in metadata)
+    if not up_to_date:
+        print(f"Converting {os.path.basename(path)} to a memory-mapped volume...")
+        convert_grid_export(path, volume_path, dimensions, chunk_rows)
+    return GridField(volume_path)
+
+
+def _parse_assignments(texts, ranges=False):
+    """
+    Parses 'y=0' (or 'x=-5:5' with ranges set) arguments into a dict.
+    """
+    parsed = {}
+    for text in texts:
+        axis, _, value = text.partition('=')
+        if ranges:
+            low, _, high = value.partition(':')
+            parsed[axis] = (float(low), float(high))
+        else:
+            parsed[axis] = float(value)
+    return parsed
+
+
+# Main function to execute the script
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Extract slices, cutlines and region averages from a COMSOL grid export.')
+    parser.add_argument('export', help='COMSOL regular-grid export (.txt), converted once to a memory-mapped .npy volume')
+    parser.add_argument('--field', help='Exported expression to use (default: the first)')
+    parser.add_argument('--dimensions', type=int, choices=[2, 3], help='Number of coordinate columns (default: from the header)')
+    parser.add_argument('--slice', nargs=2, metavar=('AXIS', 'POSITION'), help='Plot the slice at POSITION along AXIS')
+    parser.add_argument('--cutline', metavar='AXIS', help='Plot and write the cutline along AXIS')
+    parser.add_argument('--at', nargs='+', default=[], metavar='AXIS=POSITION', help='Position of the cutline on the other axes')
+    parser.add_argument('--region', nargs='+', metavar='AXIS=LOW:HIGH', help='Print the mean of the field in this box')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows per block while converting')
+    parser.add_argument('--rebuild', action='store_true', help='Convert the export again even if the volume is up to date')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.export):
+        print(f"The file '{args.export}' does not exist.")
+        raise SystemExit(1)
+    try:
+        grid = open_grid(args.export, args.dimensions, args.chunk_rows, args.rebuild)
+        field = grid.field_number(args.field)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    print(f"Grid {', '.join(f'{c}: {len(a)} points' for a, c in zip(grid.axes, grid.coordinates))}; "
+          f"fields: {', '.join(grid.fields)} ({grid.missing} points outside the geometry)")
+
+    plot_folder = os.path.join(os.path.dirname(os.path.abspath(args.export)), "plots")
+    stem = os.path.splitext(os.path.basename(args.export))[0]
+    if args.slice or args.cutline:
+        os.makedirs(plot_folder, exist_ok=True)
+
+    if args.slice:
+        import matplotlib.pyplot as plt
+
+        axis, position = args.slice
+        (first, second), values, used = grid.slice(axis, float(position), field)
+        names = [c for c in grid.coordinates if c != axis]
+        plt.figure(figsize=(8, 6), dpi=400)  # Set the DPI to 400 for high resolution
+        mesh = plt.pcolormesh(first, second, values.T, shading='nearest')
+        plt.colorbar(mesh, label=grid.fields[field])
+        plt.xlabel(names[0])
+        plt.ylabel(names[1])
+        plt.title(f'{grid.fields[field]} at {axis} = {used:g}')
+        plot_path = os.path.join(plot_folder, f"{stem}_slice_{axis}_{used:g}.png")
+        savefig(plot_path)
+        plt.close()
+        print(f"Slice plot saved: {plot_path}")
+
+    if args.cutline:
+        import numpy as np
+        import matplotlib.pyplot as plt
+
+        positions, values = grid.cutline(args.cutline, _parse_assignments(args.at), field)
+        table_path = os.path.join(plot_folder, f"{stem}_cutline_{args.cutline}.txt")
+        np.savetxt(table_path, np.column_stack([positions, values]),
+                   header=f'{args.cutline}  {grid.fields[field]}', comments='% ')
+        plt.figure(dpi=400)  # Set the DPI to 400 for high resolution
+        plt.plot(positions, values, marker='.')
+        plt.xlabel(args.cutline)
+        plt.ylabel(grid.fields[field])
+        plot_path = os.path.join(plot_folder, f"{stem}_cutline_{args.cutline}.png")
+        savefig(plot_path)
+        plt.close()
+        print(f"Cutline saved: {table_path}, plot saved: {plot_path}")
+
+    if args.region:
+        mean, count = grid.region_mean(_parse_assignments(args.region, ranges=True), field)
+        print(f"Mean of {grid.fields[field]} over {count} points: {mean:.6g}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,564 @@
+import io
+import os
+import re
+from dataclasses import dataclass, field
+
+from pipeline import Pipeline, Stage, discover_files
+from chunked_io import DEFAULT_CHUNK_ROWS, DEFAULT_MAX_POINTS, Decimator, PolynomialAccumulator, iter_text_chunks
+from degree_selection import DEFAULT_FOLDS, select_degrees
+from bootstrap import DEFAULT_CONFIDENCE, DEFAULT_REPLICATES, bootstrap_slopes
+from figure_writer import savefig
+
+# Pipeline stages for COMSOL cutline exports (.txt, x in column 0, field in column 2):
+#   discover -> parse (per file) -> fit (per file) -> plot_file (per file)
+#                                -> consolidate (positive/negative) -> fit_combined -> plot_combined
+# With chunk_rows set, parse streams each export through fixed-size blocks (see chunked_io.py):
+# the fits are accumulated while reading and only a decimated copy of the points is kept.
+# The calibration and the bootstrap intervals can only use the kept points: they warn, and the
+# calibration table and slope_intervals.csv record, which cutlines were decimated.
+# Close to the memory budget (see memory_budget.py), the remaining exports are streamed the same way.
+# The current density in every file name is also parsed as a number, so that the cutlines can
+# be stacked into a (current x position) sweep and calibrated at every position at once:
+#   parse -> sweep -> calibrate -> calibration (lookup table CSV)
+# In model-selection mode, degrees 1..N are cross-validated for every file (see degree_selection.py):
+#   parse -> select_degree -> degree_selection (CSV)
+# Bootstrap intervals of the straight-line slope of every file (see bootstrap.py):
+#   parse -> bootstrap -> slope_intervals (CSV)
+# numpy and matplotlib are imported inside the stage functions (see check_startup_time.py).
+
+
+# Signed number, e.g. '-2e10', '1.5E+10', '0.25' or '3'
+NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+# Function to read the current density from a file name
+def parse_current_density(label):
+    """
+    Reads the first number of a label taken from a file name, e.g. -2e10 from '-2e10' or
+    '-2e10_Am2'.
+
+    Returns:
+    - current (float): The current density, or None if the label holds no number.
+    """
+    match = NUMBER_PATTERN.search(label)
+    return float(match.group()) if match else None
+
+
+# ---------------------------- Intermediates ---------------------------- #
+
+@dataclass
+class Cutline:
+    """
+    One COMSOL cutline export.
+
+    Attributes:
+    - name (str): File name without extension.
+    - current_density (str): Current density label taken from the file name.
+    - x (ndarray): Positions, column 1 of the export.
+    - y (ndarray): Field values, column 3 of the export (decimated when read in chunks).
+    - fits (dict): Degree -> PolynomialAccumulator over all points, set when read in chunks.
+    - rows (int): Number of data rows of the export (more than len(x) if it was decimated).
+    """
+    name: str
+    current_density: str
+    x: object
+    y: object
+    fits: dict = field(default_factory=dict)
+    rows: int = None
+
+    @property
+    def decimated(self):
+        return self.rows is not None and self.rows > len(self.x)
+
+    @property
+    def current(self):
+        return parse_current_density(self.current_density)
+
+    @property
+    def negative(self):
+        current = self.current
+        return current < 0 if current is not None else self.current_density.startswith('-')
+
+
+@dataclass
+class PolynomialFit:
+    """
+    Least-squares polynomial fit of a cutline.
+
+    Attributes:
+    - coefficients (ndarray): Polynomial coefficients, highest power first (as np.polyfit).
+    """
+    coefficients: object
+
+    @property
+    def degree(self):
+        return len(self.coefficients) - 1
+
+    def predict(self, x):
+        import numpy as np
+        return np.polyval(self.coefficients, x)
+
+
+@dataclass
+class CurrentSweep:
+    """
+    Cutlines stacked by current density on a common position axis.
+
+    Attributes:
+    - currents (ndarray): Current densities, ascending; files of equal current are averaged.
+    - positions (ndarray): Common position axis.
+    - field (ndarray): Field values of shape (len(currents), len(positions)).
+    - decimated (list): Names of the cutlines that only contributed their decimated points.
+    """
+    currents: object
+    positions: object
+    field: object
+    decimated: list = field(default_factory=list)
+
+
+@dataclass
+class Calibration:
+    """
+    Polynomial in the current density of the field at every position.
+
+    Attributes:
+    - positions (ndarray): Position axis.
+    - coefficients (ndarray): Shape (degree + 1, len(positions)), highest power first (as np.polyfit).
+    - rms_residual (ndarray): RMS residual of the fit at every position.
+    - decimated (list): Names of the cutlines that only contributed their decimated points.
+    """
+    positions: object
+    coefficients: object
+    rms_residual: object
+    decimated: list = field(default_factory=list)
+
+    @property
+    def field_per_current(self):
+        # Slope of the field against the current density (the linear coefficient)
+        return self.coefficients[-2]
+
+    @property
+    def gradient_per_current(self):
+        import numpy as np
+        return np.gradient(self.field_per_current, self.positions)
+
+    def predict(self, current, positions=None):
+        """
+        Returns the field expected at the given current density, at the calibrated positions
+        or interpolated linearly at other positions.
+        """
+        import numpy as np
+
+        field = np.polyval(self.coefficients, current)
+        if positions is None:
+            return field
+        return np.interp(positions, self.positions, field)
+
+
+# ---------------------------- Stage Functions ---------------------------- #
+
+def parse_cutline(item, _item, profiler, skiprows, chunk_rows=None, degrees=(), max_points=DEFAULT_MAX_POINTS):
+    """
+    Reads and parses one COMSOL export; returns None (with a warning) for empty files and
+    files that cannot be parsed, so one bad export does not stop the run.
+    If chunk_rows is given, or the run is close to its memory budget, the file is read in blocks
+    of that many rows (see parse_cutline_chunked).
+    """
+    import numpy as np
+
+    file_name = os.path.basename(item.path)
+    print(f"Loading file: {file_name}")
+    if not chunk_rows and profiler.memory_pressure(f"reading {file_name}"):
+        chunk_rows = DEFAULT_CHUNK_ROWS
+        profiler.record_fallback(item.path, 'streamed')
+    try:
+        if chunk_rows:
+            return parse_cutline_chunked(item, profiler, skiprows, chunk_rows, degrees, max_points)
+        raw = profiler.read_bytes(item.path)
+        data = np.loadtxt(io.BytesIO(raw), skiprows=skiprows, ndmin=2)
+
+        if data.size == 0:
+            print(f"Warning: File {file_name} seems to be empty after skipping rows. Skipping...")
+            return None
+
+        # Extract x and y
+        x = data[:, 0]  # Column 1 is X
+        y = data[:, 2]  # Column 3 is the magnetic field component
+    except Exception as e:
+        print(f"Error processing {file_name}: {e}")
+        return None
+    if len(x) == 0 or len(y) == 0:
+        print(f"Warning: No data available in file {file_name}. Skipping...")
+        return None
+
+    # Extract current density value from the filename for labeling purposes
+    current_density = file_name.replace('.txt', '')
+    return Cutline(os.path.splitext(file_name)[0], current_density, x, y, rows=len(x))
+
+
+def parse_cutline_chunked(item, profiler, skiprows, chunk_rows, degrees, max_points):
+    """
+    Streams one COMSOL export block by block into a polynomial accumulator per degree
+    and a decimator, so memory is bounded by chunk_rows rather than by the file size.
+    Read errors propagate to parse_cutline, which skips the file.
+    """
+    file_name = os.path.basename(item.path)
+    fits = {degree: PolynomialAccumulator(degree) for degree in degrees if degree is not None}
+    decimator = Decimator(max_points)
+    for block in iter_text_chunks(item.path, chunk_rows, skiprows, usecols=(0, 2)):
+        x, y = block[:, 0], block[:, 1]  # Columns 1 (X) and 3 (magnetic field component)
+        for accumulator in fits.values():
+            accumulator.update(x, y)
+        decimator.update(x, y)
+    profiler.add_bytes(os.path.getsize(item.path), file=item.path)
+
+    if decimator.seen == 0:
+        print(f"Warning: File {file_name} seems to be empty after skipping rows. Skipping...")
+        return None
+    x, y = decimator.result()
+    if decimator.stride > 1:
+        print(f"Read {decimator.seen} rows in blocks of {chunk_rows}, keeping every {decimator.stride}th for plotting")
+    current_density = file_name.replace('.txt', '')
+    return Cutline(os.path.splitext(file_name)[0], current_density, x, y, fits, decimator.seen)
+
+
+def fit_cutline(cutline, _item, profiler, degree):
+    """
+    Fits a polynomial of the given degree to one cutline (to all of its points if it was read in chunks);
+    returns None (with an error message) if the fit fails, which skips the plot of that file.
+    """
+    import numpy as np
+
+    try:
+        if degree in cutline.fits:
+            return PolynomialFit(cutline.fits[degree].coefficients())
+        return PolynomialFit(np.polyfit(cutline.x, cutline.y, degree))
+    except Exception as e:
+        print(f"Error fitting {cutline.name}: {e}")
+        return None
+
+
+def plot_cutline(inputs, _item, profiler, plot_folder, fit_label):
+    """
+    Plots one cutline with its fit and saves it as <name>_plot.png.
+    """
+    import matplotlib.pyplot as plt
+
+    cutline, fit = inputs
+    plt.figure(dpi=400)  # Set the DPI to 400 for high resolution
+    plt.scatter(cutline.x, cutline.y, label='Gradient magnetic field (G/um)', marker='.', color='blue')
+    plt.plot(cutline.x, fit.predict(cutline.x), label=fit_label, color='red')
+    plt.xlabel('um')
+    plt.ylabel('Gradient Magnetic field (G)')
+    plt.legend()
+    plt.title(f'Gradient magnetic field vs spatial resolution - {cutline.current_density} G/um')
+    plot_path = os.path.join(plot_folder, f"{cutline.name.split('.')[0]}_plot.png")
+    with profiler.stage('write'):
+        savefig(plot_path)
+        plt.close()
+    print(f"Plot saved: {os.path.basename(plot_path)}\n")
+    return [plot_path]
+
+
+def split_by_polarity(cutlines, _items, profiler):
+    """
+    Separates the cutlines by whether the file name indicates a positive or negative current.
+    """
+    groups = {'positive': [c for c in cutlines if not c.negative],
+              'negative': [c for c in cutlines if c.negative]}
+    profiler.track('positive_data', groups['positive'])
+    profiler.track('negative_data', groups['negative'])
+    return groups
+
+
+def fit_combined(groups, _items, profiler, degree):
+    """
+    Fits one polynomial to all cutlines of each polarity, or skips it if degree is None.
+    """
+    import numpy as np
+
+    fits = {}
+    for polarity, cutlines in groups.items():
+        if degree is None or not cutlines:
+            fits[polarity] = None
+            continue
+        if all(degree in c.fits for c in cutlines):
+            # Cutlines read in chunks: merge their accumulated fits instead of the decimated points
+            combined = PolynomialAccumulator(degree)
+            for c in cutlines:
+                combined.merge(c.fits[degree])
+            fits[polarity] = PolynomialFit(combined.coefficients())
+            continue
+        x = np.concatenate([c.x for c in cutlines])
+        y = np.concatenate([c.y for c in cutlines])
+        fits[polarity] = PolynomialFit(np.polyfit(x, y, degree))
+    return fits
+
+
+def plot_combined(inputs, _items, profiler, plot_folder, fit_label):
+    """
+    Plots all cutlines of each polarity together, with the combined fit if there is one.
+    """
+    import numpy as np
+    import matplotlib.pyplot as plt
+
+    groups, fits = inputs
+    paths = []
+    for polarity, legend_loc in [('positive', 'upper right'), ('negative', 'lower right')]:
+        cutlines = groups[polarity]
+        if not cutlines:
+            print(f"No data available for {polarity} currents.")
+            continue
+
+        plt.figure(figsize=(12, 8), dpi=400)  # Set the DPI to 400 for high resolution
+        # Plot individual data points
+        for c in cutlines:
+            plt.scatter(c.x, c.y, label=f'{c.current_density} G/um', alpha=0.7)
+
+        # Plot the fitted line for combined data
+        if fits[polarity] is not None:
+            all_x = np.concatenate([c.x for c in cutlines])
+            plt.plot(all_x, fits[polarity].predict(all_x), color='red', label=fit_label, linewidth=2)
+
+        # Labels and legend
+        plt.xlabel('um')
+        plt.ylabel('Gradient Magnetic field (G)')
+        plt.legend(loc=legend_loc)
+        plot_path = os.path.join(plot_folder, f"combined_{polarity}_plot_with_fit.png")
+        with profiler.stage('write'):
+            savefig(plot_path)
+            plt.close()
+        print(f"Combined plot for {polarity} current with fit saved: {plot_path}\n")
+        paths.append(plot_path)
+    return paths
+
+
+def stack_sweep(cutlines, _items, profiler):
+    """
+    Sorts the cutlines by their numeric current density into a dense (current x position) array.
+    Cutlines on other positions than the first are interpolated onto its axis; files whose name
+    holds no number are left out. Cutlines decimated while reading contribute their kept points.
+    """
+    import numpy as np
+
+    by_current = {}
+    for c in cutlines:
+        if c.current is None:
+            print(f"Warning: No current density in the name of {c.name}. Leaving it out of the sweep...")
+            continue
+        by_current.setdefault(c.current, []).append(c)
+    if not by_current:
+        return None
+
+    currents = np.array(sorted(by_current))
+    first = by_current[currents[0]][0]
+    order = np.argsort(first.x)
+    positions = np.asarray(first.x, dtype=float)[order]
+    field = np.empty((len(currents), len(positions)))
+    for row, current in enumerate(currents):
+        rows = []
+        for c in by_current[current]:
+            if len(c.x) == len(positions) and np.array_equal(np.asarray(c.x)[order], positions):
+                rows.append(np.asarray(c.y, dtype=float)[order])
+            else:
+                k = np.argsort(c.x)
+                rows.append(np.interp(positions, np.asarray(c.x, dtype=float)[k], np.asarray(c.y, dtype=float)[k]))
+        field[row] = np.mean(rows, axis=0)
+    decimated = [c.name for current in currents for c in by_current[current] if c.decimated]
+    return CurrentSweep(currents, positions, field, decimated)
+
+
+def calibrate_sweep(sweep, _items, profiler, degree):
+    """
+    Fits the field against the current density at every position in one least-squares solve
+    (the positions are the right-hand sides of a single Vandermonde system).
+    """
+    import numpy as np
+
+    if sweep is None or len(sweep.currents) < 2:
+        print("Not enough current densities for a calibration.")
+        return None
+    degree = min(degree, len(sweep.currents) - 1)
+    # Scale the currents to order one so the Vandermonde matrix stays well conditioned
+    scale = float(np.max(np.abs(sweep.currents))) or 1.0
+    vandermonde = np.vander(sweep.currents / scale, degree + 1)
+    scaled, *_ = np.linalg.lstsq(vandermonde, sweep.field, rcond=None)
+    coefficients = scaled / (scale ** np.arange(degree, -1, -1))[:, None]
+    residual = sweep.field - vandermonde @ scaled
+    return Calibration(sweep.positions, coefficients, np.sqrt(np.mean(residual ** 2, axis=0)), sweep.decimated)
+
+
+def write_calibration(calibration, _items, profiler, plot_folder):
+    """
+    Writes the calibration as a lookup table: for every position, the field per unit current
+    density, the other polynomial coefficients, the gradient per unit current density, the
+    RMS residual and the number of cutlines that were decimated while reading (then the table
+    is calibrated on their kept points only).
+    """
+    import numpy as np
+
+    if calibration is None:
+        return []
+    degree = len(calibration.coefficients) - 1
+    columns = [calibration.positions, calibration.field_per_current, calibration.gradient_per_current]
+    names = ['position_um', 'field_per_current_G', 'gradient_per_current_G_per_um']
+    for power, coefficient in zip(range(degree, -1, -1), calibration.coefficients):
+        if power != 1:
+            columns.append(coefficient)
+            names.append('offset_G' if power == 0 else f'coefficient_power{power}')
+    columns += [calibration.rms_residual, np.full(len(calibration.positions), len(calibration.decimated))]
+    names += ['rms_residual_G', 'decimated_cutlines']
+    table_path = os.path.join(plot_folder, "current_calibration.csv")
+    np.savetxt(table_path, np.column_stack(columns), delimiter=',', header=','.join(names), comments='', fmt='%.10g')
+    print(f"Calibration of {len(calibration.positions)} positions saved: {table_path} "
+          f"(median field per current {np.median(calibration.field_per_current):.4g} G, "
+          f"max RMS residual {np.max(calibration.rms_residual):.3g} G)")
+    if calibration.decimated:
+        print(f"Warning: {len(calibration.decimated)} cutline(s) were decimated while reading "
+              f"({', '.join(calibration.decimated)}); the calibration only uses their kept points.")
+    return [table_path]
+
+
+def select_cutline_degrees(cutlines, _items, profiler, max_degree, folds):
+    """
+    Cross-validates polynomial degrees 1..max_degree for every cutline in batched solves.
+    Cutlines read in chunks are evaluated on their decimated points.
+    """
+    degrees, errors = select_degrees([c.x for c in cutlines], [c.y for c in cutlines], max_degree, folds)
+    return [(c, int(degree), row) for c, degree, row in zip(cutlines, degrees, errors)]
+
+
+def write_degree_selection(selection, _items, profiler, plot_folder, max_degree, folds):
+    """
+    Writes the selected degree and the cross-validated RMS error of every degree for every file.
+    """
+    import collections
+
+    table_path = os.path.join(plot_folder, "degree_selection.csv")
+    with open(table_path, 'w') as f:
+        f.write(','.join(['file', 'current_density', 'points', 'selected_degree']
+                         + [f'cv_rmse_degree{d}' for d in range(1, max_degree + 1)]) + '\n')
+        for cutline, degree, errors in selection:
+            f.write(','.join([cutline.name, cutline.current_density, str(len(cutline.x)), str(degree)]
+                             + [f'{e:.6g}' for e in errors]) + '\n')
+    counts = collections.Counter(degree for _, degree, _ in selection)
+    print(f"Degree selection ({folds}-fold cross-validation) of {len(selection)} files saved: {table_path}")
+    print("Selected degrees: " + ', '.join(f'{d}: {n} file(s)' for d, n in sorted(counts.items())))
+    return [table_path]
+
+
+def bootstrap_cutlines(cutlines, _items, profiler, replicates, confidence, seed, workers):
+    """
+    Bootstraps the straight-line slope and intercept of every cutline over a process pool.
+    The intervals depend on the seed and the order of the files only, not on the workers.
+    Cutlines decimated while reading are resampled from their kept points, so their intervals are
+    not those of the whole export (slope_intervals.csv lists both point counts).
+    """
+    decimated = [c.name for c in cutlines if c.decimated]
+    if decimated:
+        print(f"Warning: {len(decimated)} cutline(s) were decimated while reading ({', '.join(decimated)}); "
+              f"their bootstrap intervals only resample the kept points.")
+    intervals = bootstrap_slopes([(c.x, c.y) for c in cutlines], replicates, confidence, seed, workers=workers)
+    return list(zip(cutlines, intervals))
+
+
+def write_slope_intervals(intervals, _items, profiler, plot_folder):
+    """
+    Writes the slope and intercept of every file with their bootstrap intervals; points is the
+    number of points resampled, rows the number of rows of the export.
+    """
+    table_path = os.path.join(plot_folder, "slope_intervals.csv")
+    with open(table_path, 'w') as f:
+        f.write('file,current_density,points,rows,slope,slope_low,slope_high,intercept,intercept_low,intercept_high,'
+                'confidence,replicates\n')
+        for cutline, i in intervals:
+            rows = cutline.rows if cutline.rows is not None else len(cutline.x)
+            f.write(f'{cutline.name},{cutline.current_density},{len(cutline.x)},{rows},{i.slope:.10g},{i.slope_low:.10g},'
+                    f'{i.slope_high:.10g},{i.intercept:.10g},{i.intercept_low:.10g},{i.intercept_high:.10g},'
+                    f'{i.confidence:g},{i.replicates}\n')
+    print(f"Bootstrap slope intervals of {len(intervals)} files saved: {table_path}")
+    return [table_path]
+
+
+# Function to apply a calibration lookup table to measured currents
+def apply_calibration(table_path, current, positions=None):
+    """
+    Predicts the field at a current density from a lookup table written by the 'calibration' stage.
+
+    Parameters:
+    - table_path (str): Path of current_calibration.csv.
+    - current (float): Current density, in the unit of the file names.
+    - positions (ndarray): Positions in um (default: the positions of the table).
+
+    Returns:
+    - field (ndarray): Field in G at every position.
+    """
+    import numpy as np
+
+    table = np.genfromtxt(table_path, delimiter=',', names=True)
+    names = table.dtype.names
+    powers = {1: table['field_per_current_G'], 0: table['offset_G']}
+    for name in names:
+        if name.startswith('coefficient_power'):
+            powers[int(name[len('coefficient_power'):])] = table[name]
+    coefficients = [powers.get(power, 0.0) for power in range(max(powers), -1, -1)]
+    return Calibration(table['position_um'], np.array(coefficients), None).predict(current, positions)
+
+
+# ---------------------------- Pipeline ---------------------------- #
+
+def build_comsol_pipeline(data_folder, plot_folder, skiprows, degree, combined_degree=None,
+                          fit_label='Fitted data', combined_label='Combined Fit',
+                          cache_dir=None, profiler=None, name='comsol', chunk_rows=None, max_points=DEFAULT_MAX_POINTS,
+                          calibration_degree=1, max_degree=None, folds=DEFAULT_FOLDS,
+                          replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, seed=0, workers=None):
+    """
+    Builds the pipeline for a folder of COMSOL cutline exports.
+
+    Parameters:
+    - data_folder (str): Folder containing the .txt exports.
+    - plot_folder (str): Folder where the plots are saved.
+    - skiprows (int): Number of header lines in each export.
+    - degree (int): Degree of the per-file polynomial fit.
+    - combined_degree (int): Degree of the fit to all files of one polarity, or None for no fit.
+    - fit_label (str): Legend label of the per-file fit.
+    - combined_label (str): Legend label of the combined fit.
+    - cache_dir (str): Directory of the on-disk cache, or None.
+    - profiler (StageProfiler): Collects the per-stage timings.
+    - name (str): Name of the pipeline.
+    - chunk_rows (int): Read the exports in blocks of this many rows, or None to read them whole.
+    - max_points (int): Points kept per export for plotting when reading in blocks.
+    - calibration_degree (int): Degree in the current density of the calibration at every position.
+    - max_degree (int): Highest degree cross-validated by the 'select_degree' stage (default: degree + 3).
+    - folds (int): Number of folds of the cross-validation.
+    - replicates (int): Number of bootstrap replicates of the 'bootstrap' stage.
+    - confidence (float): Confidence level of the bootstrap intervals.
+    - seed (int): Seed of the bootstrap.
+    - workers (int): Number of bootstrap worker processes (default: one per CPU).
+
+    Returns:
+    - pipeline (Pipeline): Stages 'parse', 'fit', 'plot_file', 'consolidate', 'fit_combined', 'plot_combined',
+      'sweep', 'calibrate', 'calibration', 'select_degree', 'degree_selection', 'bootstrap' and 'slope_intervals'.
+    """
+    max_degree = max_degree or degree + 3
+    stages = [
+        Stage('parse', parse_cutline, per_item=True, skiprows=skiprows, chunk_rows=chunk_rows,
+              degrees=(degree, combined_degree), max_points=max_points),
+        Stage('fit', fit_cutline, after='parse', per_item=True, degree=degree),
+        Stage('plot_file', plot_cutline, after=('parse', 'fit'), kind='render', per_item=True,
+              plot_folder=plot_folder, fit_label=fit_label),
+        Stage('consolidate', split_by_polarity, after='parse', cache=False),
+        Stage('fit_combined', fit_combined, after='consolidate', kind='fit', degree=combined_degree),
+        Stage('plot_combined', plot_combined, after=('consolidate', 'fit_combined'), kind='render',
+              plot_folder=plot_folder, fit_label=combined_label),
+        Stage('sweep', stack_sweep, after='parse', kind='consolidate'),
+        Stage('calibrate', calibrate_sweep, after='sweep', kind='fit', degree=calibration_degree),
+        Stage('calibration', write_calibration, after='calibrate', kind='write', plot_folder=plot_folder),
+        Stage('select_degree', select_cutline_degrees, after='parse', kind='fit', max_degree=max_degree, folds=folds),
+        Stage('degree_selection', write_degree_selection, after='select_degree', kind='write',
+              plot_folder=plot_folder, max_degree=max_degree, folds=folds),
+        Stage('bootstrap', bootstrap_cutlines, after='parse', kind='fit', replicates=replicates, confidence=confidence,
+              seed=seed, workers=workers),
+        Stage('slope_intervals', write_slope_intervals, after='bootstrap', kind='write', plot_folder=plot_folder),
+    ]
+    return Pipeline(name, lambda: discover_files(data_folder, ('.txt',)), stages, cache_dir, profiler)
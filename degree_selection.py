@@ -0,0 +1,105 @@
+# Polynomial degree selection by k-fold cross-validation.
+#
+# Every point of a sweep is assigned to fold (index % folds). For fold f, the training
+# system is the Vandermonde matrix of the highest degree with the rows of fold f set to
+# zero, which leaves the least-squares solution of the other rows unchanged. Because the
+# columns are increasing powers, the QR factorisation of the first d + 1 columns is the
+# leading block of the QR factorisation of all columns, so one batched QR per block of
+# sweeps and folds gives the fits of every degree at once:
+#   stacked design (sweeps x folds, points, max_degree + 1) -> np.linalg.qr
+#   -> one batched triangular solve per degree -> held-out residuals
+# Sweeps of equal length are stacked together, in blocks bounded by block_elements.
+# numpy is imported inside the functions (see check_startup_time.py).
+
+# Default number of folds
+DEFAULT_FOLDS = 5
+
+# Default relative margin within which a lower degree is preferred to the best one
+DEFAULT_TOLERANCE = 0.01
+
+
+# Function to compute the cross-validated error of every degree for a stack of sweeps
+def cross_validate_degrees(x, y, max_degree, folds=DEFAULT_FOLDS):
+    """
+    Computes the k-fold cross-validated RMS error of polynomial fits of degree 1..max_degree.
+
+    Parameters:
+    - x (ndarray): Positions of shape (sweeps, points).
+    - y (ndarray): Values of shape (sweeps, points).
+    - max_degree (int): Highest degree evaluated.
+    - folds (int): Number of folds; lowered to the number of points if there are fewer.
+
+    Returns:
+    - errors (ndarray): Shape (sweeps, max_degree), the RMS error of the held-out points for
+      degree 1..max_degree (inf where a degree has more coefficients than training points).
+    """
+    import numpy as np
+
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    sweeps, points = x.shape
+    folds = max(2, min(folds, points))
+
+    # Powers of x scaled to [-1, 1] per sweep keep the Vandermonde matrix well conditioned
+    shift = (x.max(axis=1, keepdims=True) + x.min(axis=1, keepdims=True)) / 2
+    scale = (x.max(axis=1, keepdims=True) - x.min(axis=1, keepdims=True)) / 2
+    scale[scale == 0] = 1.0
+    vandermonde = np.vander(((x - shift) / scale).ravel(), max_degree + 1, increasing=True)
+    vandermonde = vandermonde.reshape(sweeps, points, max_degree + 1)
+
+    fold_of_point = np.arange(points) % folds
+    held_out = fold_of_point[None, :] == np.arange(folds)[:, None]  # (folds, points)
+    train = ~held_out
+    # (sweeps, folds, points, degree + 1) with the held-out rows zeroed
+    design = vandermonde[:, None] * train[None, :, :, None]
+    q, r = np.linalg.qr(design)
+    qty = np.einsum('sfpk,sp->sfk', q, y)
+
+    squared = np.zeros((sweeps, max_degree))
+    training_points = train.sum(axis=1)  # (folds,)
+    for degree in range(1, max_degree + 1):
+        n = degree + 1
+        if n > training_points.min():
+            squared[:, degree - 1] = np.inf
+            continue
+        coefficients = np.linalg.solve(r[..., :n, :n], qty[..., :n, None])[..., 0]  # (sweeps, folds, n)
+        prediction = np.einsum('spk,sfk->sfp', vandermonde[..., :n], coefficients)
+        residual = (prediction - y[:, None, :]) * held_out[None]
+        squared[:, degree - 1] = np.sum(residual ** 2, axis=(1, 2))
+    return np.sqrt(squared / points)
+
+
+# Function to select the degree of every sweep of a campaign
+def select_degrees(x_rows, y_rows, max_degree, folds=DEFAULT_FOLDS, tolerance=DEFAULT_TOLERANCE, block_elements=8_000_000):
+    """
+    Cross-validates degrees 1..max_degree for sweeps of any lengths, stacking the sweeps
+    of equal length into batched solves.
+
+    Parameters:
+    - x_rows (list): Positions of every sweep.
+    - y_rows (list): Values of every sweep.
+    - max_degree (int): Highest degree evaluated.
+    - folds (int): Number of folds.
+    - tolerance (float): Relative margin over the lowest error within which the lowest degree is preferred.
+    - block_elements (int): Maximum number of elements of one stacked design matrix.
+
+    Returns:
+    - degrees (ndarray): Selected degree of every sweep: the lowest degree whose cross-validated
+      error is within tolerance of the lowest error, so noise alone does not add terms.
+    - errors (ndarray): Shape (len(x_rows), max_degree), the cross-validated RMS errors.
+    """
+    import numpy as np
+
+    errors = np.full((len(x_rows), max_degree), np.nan)
+    by_length = {}
+    for index, x in enumerate(x_rows):
+        by_length.setdefault(len(x), []).append(index)
+    for points, indices in by_length.items():
+        per_sweep = max(1, folds * points * (max_degree + 1))
+        step = max(1, block_elements // per_sweep)
+        for start in range(0, len(indices), step):
+            block = indices[start:start + step]
+            errors[block] = cross_validate_degrees(np.stack([x_rows[i] for i in block]),
+                                                   np.stack([y_rows[i] for i in block]), max_degree, folds)
+    best = np.min(errors, axis=1, keepdims=True)
+    return np.argmax(errors <= best * (1 + tolerance), axis=1) + 1, errors
@@ -0,0 +1,183 @@
+# Asynchronous PNG output for the plotting scripts.
+#
+# plt.savefig of a high-dpi figure spends most of its time in zlib compression and in
+# writing the file (often to a network share), during which the script does nothing else.
+# FigureWriter.save renders the figure to a raw RGBA buffer on the calling thread (Agg
+# drawing is not thread-safe, but it is the fast part) and hands the buffer to a thread
+# pool that encodes the PNG and writes it; Pillow releases the GIL while compressing, so
+# the script moves on to the next figure at once. At most max_pending figures are queued
+# (a 12 x 6 in figure at 400 dpi is 46 MB of RGBA): save blocks while the queue is full.
+# Every PNG is written to a temporary file and renamed, so a half-written plot is never
+# seen under its final name. flush() waits for the queued writes and reports the ones that
+# failed; the shared writer of savefig() is flushed at exit.
+# Formats other than PNG, and tight bounding boxes (whose pixel size is only known after
+# drawing), are saved synchronously.
+# numpy and matplotlib are imported inside the functions (see check_startup_time.py).
+
+import io
+import os
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of encoding threads
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _encode_png(rgba, path, dpi, metadata, pil_kwargs):
+    """
+    Worker: compresses an RGBA buffer to PNG and writes it through a temporary file.
+    """
+    from matplotlib.image import imsave
+
+    encoded = io.BytesIO()
+    imsave(encoded, rgba, format='png', dpi=dpi, metadata=metadata, pil_kwargs=pil_kwargs)
+    partial = f"{path}.part"
+    with open(partial, 'wb') as f:
+        f.write(encoded.getbuffer())
+    os.replace(partial, path)
+    return path
+
+
+class FigureWriter:
+    """
+    Saves figures as PNG with the encoding and writing done on background threads.
+
+    Parameters:
+    - workers (int): Number of encoding threads (0 saves synchronously, like fig.savefig).
+    - max_pending (int): Maximum number of figures rendered but not yet written (default: 2 per worker).
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=None):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='figure_writer') if workers else None
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * max(workers, 1))
+        self.pending = []  # (path, future) of the queued writes
+        self.written = 0
+
+    def save(self, fig, path, **kwargs):
+        """
+        Renders the figure and queues its PNG for writing; returns as soon as the figure is rendered.
+
+        Parameters:
+        - fig (Figure): The figure; it can be closed or reused as soon as save returns.
+        - path (str): Output path; formats other than PNG are saved synchronously.
+        - **kwargs: Keyword arguments of fig.savefig (dpi, facecolor, metadata, pil_kwargs, ...).
+        """
+        import numpy as np
+        import matplotlib
+
+        png = str(kwargs.get('format') or os.path.splitext(str(path))[1][1:] or 'png').lower() == 'png'
+        if self.pool is None or not png or kwargs.get('bbox_inches') is not None:
+            fig.savefig(path, **kwargs)
+            self.written += 1
+            return
+
+        kwargs.pop('format', None)
+        metadata = kwargs.pop('metadata', None)
+        pil_kwargs = kwargs.pop('pil_kwargs', None)
+        dpi = kwargs.get('dpi') or matplotlib.rcParams['savefig.dpi']
+        dpi = fig.dpi if dpi == 'figure' else dpi
+        raw = io.BytesIO()
+        fig.savefig(raw, format='rgba', **kwargs)
+        width, height = (int(v) for v in fig.get_size_inches() * dpi)
+        if raw.getbuffer().nbytes != width * height * 4:
+            fig.savefig(path, metadata=metadata, pil_kwargs=pil_kwargs, **kwargs)  # Size changed while drawing
+            self.written += 1
+            return
+        rgba = np.frombuffer(raw.getbuffer(), dtype=np.uint8).reshape(height, width, 4)
+
+        self.slots.acquire()  # Bounded queue: wait for a write to finish when it is full
+        try:
+            future = self.pool.submit(_encode_png, rgba, path, dpi, metadata, pil_kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append((path, future))
+
+    def flush(self):
+        """
+        Waits for every queued figure to be written and reports the ones that failed.
+
+        Returns:
+        - errors (list): (path, exception) of every figure that could not be written.
+        """
+        pending, self.pending = self.pending, []
+        errors = []
+        for path, future in pending:
+            try:
+                future.result()
+                self.written += 1
+            except Exception as e:
+                print(f"Error writing {path}: {e}")
+                errors.append((path, e))
+        return errors
+
+    def close(self):
+        """
+        Flushes the queued figures and stops the threads.
+
+        Returns:
+        - errors (list): (path, exception) of every figure that could not be written.
+        """
+        errors = self.flush()
+        if self.pool is not None:
+            self.pool.shutdown()
+        return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _flush_at_exit():
+    if _writer is not None:
+        errors = _writer.close()
+        if errors:
+            print(f"{len(errors)} figure(s) could not be written.")
+
+
+# Function to get the writer shared by the scripts
+def get_writer():
+    """
+    Returns the shared FigureWriter, created on first use and flushed when the interpreter exits.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FigureWriter()
+            atexit.register(_flush_at_exit)
+        return _writer
+
+
+# Function to save a figure without waiting for the PNG to be written
+def savefig(path, fig=None, **kwargs):
+    """
+    Drop-in replacement of plt.savefig that queues the PNG on the shared writer.
+
+    Parameters:
+    - path (str): Output path.
+    - fig (Figure): The figure to save (default: the current figure).
+    - **kwargs: Keyword arguments of fig.savefig.
+    """
+    if fig is None:
+        import matplotlib.pyplot as plt
+        fig = plt.gcf()
+    get_writer().save(fig, path, **kwargs)
+
+
+# Function to wait for the queued figures
+def flush_figures():
+    """
+    Waits for the figures queued by savefig to be written (e.g. before reading them back).
+
+    Returns:
+    - errors (list): (path, exception) of every figure that could not be written.
+    """
+    return _writer.flush() if _writer is not None else []
@@ -0,0 +1,135 @@
+# Surrogate model of a sweep as a function of the height.
+#
+# The averaged sweeps of one material are put on a common frequency axis (see
+# hfss_pipeline.height_frequency_grid) and a spline through the simulated heights
+# is fitted to every frequency at once (one B-spline with vector-valued coefficients,
+# along axis 0 of the height x frequency matrix). Evaluating it at a new height is a
+# single small matrix product, so a full sweep at an unseen height takes well under
+# a millisecond. Leaving each simulated height out in turn and predicting it from the
+# others estimates how far the surrogate can be trusted between the simulated heights.
+# Heights swept over different frequency ranges leave NaN in the grid where a height does
+# not reach; the spline is fitted on the frequencies that every height covers.
+# numpy and scipy are imported inside the functions (see check_startup_time.py).
+
+
+class HeightSurrogate:
+    """
+    Spline interpolant across height of the sweeps of one parameter and material.
+
+    Parameters:
+    - heights (ndarray): Simulated heights in nm, ascending.
+    - frequency (ndarray): Common frequency axis in GHz; only the frequencies where no height is NaN are kept.
+    - grid (ndarray): Values of shape (len(heights), len(frequency)), real (e.g. dB) or complex.
+    - degree (int): Spline degree across height; lowered to len(heights) - 1 if there are fewer heights.
+
+    Raises:
+    - ValueError: If no frequency is covered by every height.
+    """
+
+    def __init__(self, heights, frequency, grid, degree=3):
+        import numpy as np
+        from scipy.interpolate import make_interp_spline
+
+        self.heights = np.asarray(heights, dtype=float)
+        grid = np.asarray(grid)
+        covered = ~np.isnan(grid).any(axis=0)  # Frequencies reached by every height
+        if not covered.any():
+            raise ValueError("no frequency is covered by every height")
+        self.frequency = np.asarray(frequency, dtype=float)[covered]
+        self.grid = grid[:, covered]
+        self.degree = max(0, min(degree, len(self.heights) - 1))
+        if len(self.heights) == 1:
+            self._spline = None  # A single height can only be predicted as itself
+        else:
+            self._spline = make_interp_spline(self.heights, self.grid, k=self.degree, axis=0)
+
+    def predict(self, heights, frequency=None):
+        """
+        Predicts full sweeps at the given heights.
+
+        Parameters:
+        - heights (float or list): Heights in nm.
+        - frequency (ndarray): Frequencies in GHz to evaluate at (default: the fitted axis);
+          other frequencies are interpolated linearly.
+
+        Returns:
+        - sweeps (ndarray): Shape (len(heights), len(frequency)).
+        """
+        import numpy as np
+
+        heights = np.atleast_1d(np.asarray(heights, dtype=float))
+        if self._spline is None:
+            sweeps = np.repeat(self.grid[:1], len(heights), axis=0)
+        else:
+            sweeps = self._spline(heights)
+        if frequency is None:
+            return sweeps
+        frequency = np.asarray(frequency, dtype=float)
+        if np.iscomplexobj(sweeps):
+            return np.array([np.interp(frequency, self.frequency, s.real) + 1j * np.interp(frequency, self.frequency, s.imag)
+                             for s in sweeps])
+        return np.array([np.interp(frequency, self.frequency, s) for s in sweeps])
+
+    def extrapolates(self, heights):
+        """
+        Returns a boolean array telling which heights lie outside the simulated range.
+        """
+        import numpy as np
+        heights = np.atleast_1d(np.asarray(heights, dtype=float))
+        return (heights < self.heights[0]) | (heights > self.heights[-1])
+
+    def leave_one_out(self):
+        """
+        Predicts every simulated height from a surrogate fitted to the other heights.
+
+        Returns:
+        - errors (list): One dict per height with 'height', 'rms_error', 'max_error'
+          (absolute, in the unit of the values) and 'extrapolated' (True for the lowest and
+          highest height, which are predicted from one side only).
+        """
+        import numpy as np
+
+        errors = []
+        if len(self.heights) < 2:
+            return errors
+        for k, height in enumerate(self.heights):
+            others = np.arange(len(self.heights)) != k
+            reduced = HeightSurrogate(self.heights[others], self.frequency, self.grid[others], self.degree)
+            difference = np.abs(reduced.predict(height)[0] - self.grid[k])
+            valid = ~np.isnan(difference)
+            errors.append({
+                'height': height,
+                'rms_error': float(np.sqrt(np.mean(difference[valid] ** 2))) if valid.any() else float('nan'),
+                'max_error': float(difference[valid].max()) if valid.any() else float('nan'),
+                'extrapolated': bool(reduced.extrapolates(height)[0]),
+            })
+        return errors
+
+
+# Function to fit the surrogates of every parameter and material
+def fit_height_surrogates(averaged, params=None, degree=3, frequency_points=None):
+    """
+    Fits one HeightSurrogate per (param, material) of averaged[param][material][height] = (frequency, values).
+
+    Parameters:
+    - averaged (dict): Averaged sweeps, e.g. the output of hfss_pipeline.average_tries.
+    - params (list): Parameters to model (default: all).
+    - degree (int): Spline degree across height.
+    - frequency_points (int): Number of points of the common frequency axis if the sweeps must be
+      interpolated onto one (see hfss_pipeline.height_frequency_grid).
+
+    Returns:
+    - surrogates (dict): (param, material) -> HeightSurrogate; pairs that cannot be fitted are
+      reported and left out.
+    """
+    from hfss_pipeline import height_frequency_grid
+
+    surrogates = {}
+    for param in params or list(averaged):
+        for material, height_data in averaged.get(param, {}).items():
+            try:
+                heights, frequency, grid = height_frequency_grid(height_data, frequency_points)
+                surrogates[(param, material)] = HeightSurrogate(heights, frequency, grid, degree)
+            except Exception as e:
+                print(f"Error fitting the height surrogate of {param} for {material}: {e}. Skipping.")
+    return surrogates
@@ -0,0 +1,759 @@
+import io
+import os
+from dataclasses import dataclass, field
+
+from pipeline import Pipeline, Stage, content_digest, discover_files
+from touchstone import TOUCHSTONE_EXTENSIONS, is_touchstone, network_from_report, ports_from_name, read_touchstone, report_column
+from box_stats import stack_rows
+from rf_metrics import StreamingMetrics, figures_of_merit, sweep_metrics
+from chunked_io import DEFAULT_CHUNK_ROWS, DEFAULT_MAX_POINTS, Decimator, iter_csv_chunks
+from compact_arrays import AxisInterner, compact_array, memory_report
+from results_store import DEFAULT_STORE_NAME, write_run
+from height_surrogate import fit_height_surrogates
+from figure_writer import savefig
+
+# Pipeline stages for HFSS exports (CSV reports or Touchstone files) laid out as
+# <material>/<try>/<height>nm/*.csv|*.sNp:
+#   discover -> read (per unique file) -> parse (per file) -> consolidate -> average -> plot_multiline
+#                                                           -> extrema      (average, extrema) -> summary_tables
+#                                                           (parse, consolidate) -> figures_of_merit
+#                                      (parse, average, extrema) -> store_results (SQLite, see results_store.py)
+# With chunk_rows set, CSV reports are streamed through fixed-size blocks and decimated (see chunked_io.py).
+# The decimated sweeps are only plotted and averaged: the max, min, mean and figures of merit of
+# every try are reduced exactly from all blocks (see rf_metrics.StreamingMetrics), and the 'extrema'
+# stage streams the tries again to find the exact max and min of their average.
+# With compact set, sweeps are stored as float32 and the tries share their frequency axes (see compact_arrays.py).
+# Close to the memory budget (see memory_budget.py), the remaining CSV reports are streamed in blocks,
+# which keeps their statistics exact and only decimates the plotted sweeps.
+# pandas, numpy and matplotlib are imported inside the stage functions (see check_startup_time.py).
+
+# S-parameter columns of the "Terminal S Parameter" report
+S_PARAMETERS = {
+    'S11': 'dB(St(1,1)) []',
+    'S12': 'dB(St(1,2)) []',
+    'S21': 'dB(St(2,1)) []',
+    'S22': 'dB(St(2,2)) []'
+}
+
+# Z-parameter columns of the "Terminal Z Parameter" report
+Z_PARAMETERS = {
+    'Z12': 're(Zt(1,2)) []',
+    'Z21': 're(Zt(2,1)) []',
+    'Z11': 're(Zt(1,1)) []',
+    'Z22': 're(Zt(2,2)) []'
+}
+
+# Extensions of the exports read by the pipeline
+REPORT_EXTENSIONS = ('.csv',) + TOUCHSTONE_EXTENSIONS
+
+# (store path, script, directory) -> run id written by this process; later updates of a --watch
+# session replace that run instead of adding one per update
+_stored_runs = {}
+
+
+# ---------------------------- Intermediates ---------------------------- #
+
+@dataclass
+class Sweep:
+    """
+    One HFSS report.
+
+    Attributes:
+    - path (str): Path of the export.
+    - material (str): Material, taken from the grandparent of the height folder.
+    - height (int): Height in nm, taken from the '<height>nm' folder name.
+    - frequency (ndarray): Frequency axis in GHz.
+    - values (dict): Parameter name (e.g. 'S21') -> ndarray of values.
+    - exact (dict): Parameter name -> max, min, mean and figures of merit of the whole report
+      (see rf_metrics.StreamingMetrics) if the values were decimated while reading, else empty.
+    """
+    path: str
+    material: str
+    height: int
+    frequency: object
+    values: dict = field(default_factory=dict)
+    exact: dict = field(default_factory=dict)
+
+
+# Function to extract the height and material from the path of a report
+def sweep_location(csv_path):
+    """
+    Extracts the height and material of a report from its path.
+
+    Parameters:
+    - csv_path (str): Path of the CSV file, .../<material>/<try>/<height>nm/<file>.csv.
+
+    Returns:
+    - height (int): Height in nm.
+    - material (str): Material name.
+
+    Raises:
+    - ValueError: If the height folder is not a number of nanometres.
+    """
+    height_folder = os.path.basename(os.path.dirname(csv_path))
+    height = int(height_folder.replace('nm', ''))  # Directly extract height from folder name
+    material = os.path.dirname(csv_path).split(os.sep)[-3]  # Use grandparent folder name as material identifier
+    return height, material
+
+
+# ---------------------------- Stage Functions ---------------------------- #
+
+def report_values(data, columns):
+    """
+    Extracts the frequency axis in GHz and the requested columns of an HFSS report (or of a block of one).
+    Missing Z/Y/S columns are derived from the complex parameters of the report, if it holds them.
+
+    Returns:
+    - frequency (ndarray): Frequency in GHz, or None if the report has no 'Freq [MHz]' column.
+    - values (dict): Parameter name -> ndarray, for the columns that are available.
+    """
+    # Extract frequency and convert from MHz to GHz
+    if 'Freq [MHz]' not in data.columns:
+        return None, {}
+    frequency = data['Freq [MHz]'].to_numpy() / 1000.0  # Convert MHz to GHz
+    values = {param: data[column_name].to_numpy() for param, column_name in columns.items()
+              if column_name in data.columns}
+
+    # Missing Z/Y/S columns can be derived from a report that holds complex parameters
+    missing = {param: column_name for param, column_name in columns.items() if param not in values}
+    network = network_from_report(data) if missing else None
+    if network is not None:
+        for param, column_name in missing.items():
+            try:
+                values[param] = report_column(network, column_name)
+            except ValueError:
+                pass
+    return frequency, values
+
+
+def read_report_chunked(csv_path, columns, chunk_rows, max_points, profiler, threshold=-10.0, bands=()):
+    """
+    Reads a CSV report in blocks of chunk_rows rows and keeps at most max_points evenly
+    strided rows for plotting, so memory is bounded by the block size rather than by the file
+    size. Every block also goes through exact reducers of the statistics of each column.
+    Only the frequency and requested columns are parsed when the report has all of them.
+
+    Returns:
+    - frequency (ndarray): Decimated frequency in GHz, or None if the report has no frequency column.
+    - values (dict): Parameter name -> decimated ndarray.
+    - exact (dict): Parameter name -> max, min, mean and figures of merit of all rows
+      (see rf_metrics.StreamingMetrics; threshold and bands as in sweep_metrics), or empty if
+      every row was kept, since the values are then exact themselves.
+    """
+    import pandas as pd
+
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    wanted = ['Freq [MHz]'] + list(columns.values())
+    usecols = wanted if all(c in header for c in wanted) else None  # Derived columns need the whole report
+    decimator, params, reducers = Decimator(max_points), None, {}
+    for block in iter_csv_chunks(csv_path, chunk_rows, usecols):
+        frequency, values = report_values(block, columns)
+        if frequency is None:
+            return None, {}, {}
+        if params is None:
+            params = list(values)
+            reducers = {param: StreamingMetrics(threshold, bands) for param in params}
+        decimator.update(frequency, *[values[param] for param in params])
+        for param in params:
+            reducers[param].update(frequency, values[param])
+    profiler.add_bytes(os.path.getsize(csv_path), file=csv_path)
+    if params is None:
+        raise pd.errors.EmptyDataError("No rows after the header")
+    frequency, *kept = decimator.result()
+    if decimator.stride > 1:
+        print(f"Read {decimator.seen} rows in blocks of {chunk_rows}, keeping every {decimator.stride}th")
+    exact = {param: reducer.result() for param, reducer in reducers.items()} if decimator.stride > 1 else {}
+    return frequency, dict(zip(params, kept)), exact
+
+
+def read_sweep(item, _item, profiler, columns, chunk_rows=None, max_points=DEFAULT_MAX_POINTS, compact=False,
+               threshold=-10.0, bands=()):
+    """
+    Reads the frequency axis and the requested columns of one HFSS export; returns None
+    (with a warning) if it cannot be used. The result only depends on the file contents,
+    so byte-identical exports share it (see Pipeline duplicates).
+    Touchstone files are evaluated with the same report expressions as the CSV columns, so
+    Z-parameters can be derived from an S-parameter export (see network_params.py).
+    If chunk_rows is given, CSV reports are read in blocks of that many rows (see read_report_chunked);
+    threshold and bands set the figures of merit reduced from the blocks.
+    If compact is set, the frequency axis and values are stored as float32.
+    Close to the memory budget, a CSV report is read in blocks whatever the settings; its statistics
+    are still reduced from all rows, so only the plotted and averaged sweeps are decimated.
+    """
+    import pandas as pd
+
+    csv_path = item.path
+    if profiler.memory_pressure(f"reading {os.path.basename(csv_path)}"):
+        chunk_rows = chunk_rows or DEFAULT_CHUNK_ROWS
+        profiler.record_fallback(csv_path, 'streamed')
+    print(f"Loading {'Touchstone' if is_touchstone(csv_path) else 'CSV'} file: {os.path.basename(csv_path)}")
+    exact = {}
+    try:
+        if is_touchstone(csv_path):
+            network = read_touchstone(profiler.read_bytes(csv_path), ports_from_name(csv_path))
+            frequency = network.frequency_ghz
+            values = {}
+            for param, column_name in columns.items():
+                try:
+                    values[param] = report_column(network, column_name)
+                except ValueError:
+                    pass  # Quantity not available from this network, like a missing CSV column
+        else:
+            if chunk_rows:
+                frequency, values, exact = read_report_chunked(csv_path, columns, chunk_rows, max_points, profiler,
+                                                               threshold, bands)
+            else:
+                frequency, values = report_values(pd.read_csv(io.BytesIO(profiler.read_bytes(csv_path))), columns)
+            if frequency is None:
+                print(f"No frequency column found in '{csv_path}'. Skipping.")
+                return None
+
+        if compact:
+            frequency = compact_array(frequency)
+            values = {param: compact_array(v) for param, v in values.items()}
+        return frequency, values, exact
+
+    except pd.errors.EmptyDataError:
+        print(f"Warning: The file '{csv_path}' is empty or contains only headers. Skipping.")
+    except pd.errors.ParserError as e:
+        print(f"Error parsing '{csv_path}': {e}. Skipping.")
+    except Exception as e:
+        print(f"Error processing '{csv_path}': {e}. Skipping.")
+    return None
+
+
+def parse_sweep(payload, item, profiler):
+    """
+    Attaches the material and height taken from the path to the contents of one export;
+    returns None (with a warning) if the path does not follow the tree layout.
+    """
+    csv_path = item.path
+    frequency, values, exact = payload
+
+    # Extract height from the folder name (assuming folder names are like '200nm', '400nm', etc.)
+    height_folder = os.path.basename(os.path.dirname(csv_path))
+    try:
+        height, material = sweep_location(csv_path)
+        print(f"Extracted height: {height} nm from folder: {height_folder}")  # Debugging output
+    except ValueError:
+        print(f"Warning: Couldn't determine height from folder name '{height_folder}'. Skipping...")
+        return None
+    return Sweep(csv_path, material, height, frequency, values, exact)
+
+
+def consolidate_sweeps(sweeps, _items, profiler, params, compact=False):
+    """
+    Groups the sweeps as consolidated_data[param][material][height] = [(frequency, values), ...],
+    one entry per try. If compact is set (or the run is close to its memory budget), identical
+    frequency axes are stored once and the memory usage is reported.
+    """
+    compact = compact or profiler.memory_pressure('consolidating the sweeps')
+    axes = AxisInterner() if compact else None
+    consolidated_data = {param: {} for param in params}
+    for sweep in sweeps:
+        frequency = axes.intern(sweep.frequency) if compact else sweep.frequency
+        for param, values in sweep.values.items():
+            if param in consolidated_data:
+                heights = consolidated_data[param].setdefault(sweep.material, {})
+                heights.setdefault(sweep.height, []).append((frequency, values))
+    if compact:
+        print(memory_report("Consolidated data", consolidated_data))
+    profiler.track('consolidated_data', consolidated_data)
+    return consolidated_data
+
+
+def average_tries(consolidated_data, _items, profiler):
+    """
+    Averages the tries of every (param, material, height). Tries with different frequency
+    axes (other sweep settings, or decimated while reading) are interpolated onto the axis of
+    the one with the most points, over the range that all of them cover.
+
+    Returns:
+    - averaged (dict): averaged[param][material][height] = (frequency, mean values).
+    """
+    import numpy as np
+
+    averaged = {}
+    for param, material_data in consolidated_data.items():
+        for material, height_data in material_data.items():
+            for height, data_list in sorted(height_data.items()):
+                if len(data_list) > 1:
+                    axes = [frequency for frequency, _ in data_list]
+                    if all(len(f) == len(axes[0]) and np.array_equal(f, axes[0]) for f in axes[1:]):
+                        avg_frequency = axes[0]
+                        tries = [values for _, values in data_list]
+                    else:
+                        avg_frequency = max(axes, key=len)
+                        tries = interpolate_rows(axes, [values for _, values in data_list], avg_frequency)
+                        common = ~np.isnan(tries).any(axis=0)
+                        if not common.any():
+                            print(f"Warning: The tries of {param} for {material} at {height} nm share no "
+                                  f"frequency range. Skipping...")
+                            continue
+                        avg_frequency, tries = avg_frequency[common], tries[:, common]
+                    # Accumulate in float64 and store in the dtype of the tries (float32 in compact mode)
+                    avg_values = np.mean(tries, axis=0, dtype=np.float64)
+                    avg_values = avg_values.astype(data_list[0][1].dtype, copy=False)
+                else:
+                    avg_frequency, avg_values = data_list[0]
+                averaged.setdefault(param, {}).setdefault(material, {})[height] = (avg_frequency, avg_values)
+    return averaged
+
+
+def _stream_tries(sweeps, columns, chunk_rows):
+    """
+    Yields the values of the tries of one (material, height) block by block, in step: the tries
+    that were decimated while reading are read again, the others are sliced.
+
+    Raises:
+    - ValueError: If the tries do not have the same number of rows.
+    """
+    import itertools
+    import pandas as pd
+
+    readers = []
+    for sweep in sweeps:
+        if sweep.exact:
+            header = list(pd.read_csv(sweep.path, nrows=0).columns)
+            wanted = ['Freq [MHz]'] + list(columns.values())
+            usecols = wanted if all(c in header for c in wanted) else None
+            readers.append(report_values(block, columns)[1] for block in iter_csv_chunks(sweep.path, chunk_rows, usecols))
+        else:
+            length = len(sweep.frequency)
+            readers.append({param: values[start:start + chunk_rows] for param, values in sweep.values.items()}
+                           for start in range(0, length, chunk_rows))
+    for blocks in itertools.zip_longest(*readers):
+        if any(block is None for block in blocks):
+            raise ValueError("the tries have different numbers of rows")
+        yield blocks
+
+
+def exact_extrema(sweeps, _items, profiler, columns, chunk_rows=None):
+    """
+    Finds the exact max and min of the average of the tries of every (param, material, height)
+    with a try that was decimated while reading: from its reducers if it is the only try, else by
+    streaming all tries again in blocks of chunk_rows rows and averaging them block by block.
+    Tries with different numbers of rows are averaged after interpolation (see average_tries),
+    so their summary keeps the values of the decimated sweeps.
+
+    Returns:
+    - extrema (dict): extrema[param][material][height] = (max, min), only for those heights.
+    """
+    import numpy as np
+
+    # Tries of every (material, height) and parameter, in the order of consolidate_sweeps
+    groups = {}
+    for sweep in sweeps:
+        for param in sweep.values:
+            if param in columns:
+                groups.setdefault((sweep.material, sweep.height), {}).setdefault(param, []).append(sweep)
+    extrema = {}
+    for (material, height), param_tries in sorted(groups.items()):
+        together = {}  # Parameters held by the same tries are streamed together
+        for param, tries in param_tries.items():
+            if any(param in sweep.exact for sweep in tries):
+                together.setdefault(tuple(map(id, tries)), (tries, []))[1].append(param)
+        for tries, params in together.values():
+            if len(tries) == 1:
+                found = {param: (tries[0].exact[param]['max'], tries[0].exact[param]['min']) for param in params}
+            else:
+                found = {param: (-np.inf, np.inf) for param in params}
+                try:
+                    for blocks in _stream_tries(tries, columns, chunk_rows or DEFAULT_CHUNK_ROWS):
+                        for param in params:
+                            rows = [block[param] for block in blocks]
+                            if len({len(values) for values in rows}) > 1:
+                                raise ValueError("the tries have different numbers of rows")
+                            mean = np.mean(rows, axis=0, dtype=np.float64)
+                            high, low = found[param]
+                            found[param] = (max(high, float(mean.max())), min(low, float(mean.min())))
+                except Exception as e:
+                    print(f"Warning: The tries of {', '.join(params)} for {material} at {height} nm cannot be "
+                          f"averaged exactly ({e}); the summary uses the decimated sweeps.")
+                    continue
+            for param, (high, low) in found.items():
+                extrema.setdefault(param, {}).setdefault(material, {})[height] = (high, low)
+    return extrema
+
+
+def _average_extrema(extrema, param, material, height, avg_values):
+    """
+    Returns the exact (max, min) of an averaged sweep if they are known, else those of its values.
+    """
+    import numpy as np
+
+    found = extrema.get(param, {}).get(material, {}).get(height)
+    return found if found is not None else (float(np.max(avg_values)), float(np.min(avg_values)))
+
+
+def plot_multiline(averaged, _items, profiler, params, plot_folder, unit, show):
+    """
+    Plots the averaged sweep of every height for each parameter and material.
+    """
+    import matplotlib.pyplot as plt
+
+    paths = []
+    for param in params:
+        for material, height_data in averaged.get(param, {}).items():
+            plt.figure(figsize=(10, 6), dpi=400)  # Set the DPI to 400 for high resolution
+
+            # Iterate over each height and plot the average frequency response
+            for height, (avg_frequency, avg_values) in sorted(height_data.items()):
+                plt.plot(avg_frequency, avg_values, label=f'Height: {height} nm')
+
+            # Labels and legend
+            plt.xlabel('Frequency (GHz)')
+            plt.ylabel(f'{param} Parameter ({unit})')
+            plt.legend(loc='upper right')
+
+            # Save the consolidated (multi-line) plot
+            consolidated_plot_path = os.path.join(plot_folder, f"{param}_vs_frequency_{material}.png")
+            with profiler.stage('write'):
+                savefig(consolidated_plot_path)
+                if show:
+                    plt.show()
+                plt.close()
+            print(f"Consolidated (Multi-Line) {param} vs Frequency plot saved: {consolidated_plot_path}")
+            paths.append(consolidated_plot_path)
+    return paths
+
+
+def write_summary_tables(inputs, _items, profiler, params, plot_folder, unit):
+    """
+    Writes the max and min of the averaged sweep of every height, one CSV per parameter and material
+    (exact for the sweeps decimated while reading, see exact_extrema).
+    """
+    import pandas as pd
+
+    averaged, extrema = inputs
+    paths = []
+    for param in params:
+        for material, height_data in averaged.get(param, {}).items():
+            summary_data = [[height, *_average_extrema(extrema, param, material, height, avg_values)]
+                            for height, (_, avg_values) in sorted(height_data.items())]
+            summary_df = pd.DataFrame(summary_data, columns=['Height (nm)', f'Max Value ({unit})', f'Min Value ({unit})'])
+            summary_path = os.path.join(plot_folder, f"summary_{param}_impedance_match_{material}.csv")
+            summary_df.to_csv(summary_path, index=False)
+            print(f"Summary table for {param} and {material} saved: {summary_path}")
+            paths.append(summary_path)
+    return paths
+
+
+def write_figures_of_merit(inputs, _items, profiler, params, plot_folder, threshold, bands):
+    """
+    Writes the resonance, bandwidth, cut-off, insertion loss and ripple of every try of every
+    dB parameter as one table (see rf_metrics.py); the metrics of the tries decimated while
+    reading are those reduced from all their rows.
+    """
+    sweeps, consolidated_data = inputs
+
+    # Tries numbered in the order of consolidate_sweeps
+    exact, tries = {}, {}
+    for sweep in sweeps:
+        for param in sweep.values:
+            key = (param, sweep.material, sweep.height)
+            tries[key] = tries.get(key, 0) + 1
+            if param in sweep.exact:
+                exact[key + (tries[key],)] = sweep.exact[param]
+    table = figures_of_merit(consolidated_data, params, threshold, bands, exact)
+    metrics_path = os.path.join(plot_folder, "figures_of_merit.csv")
+    table.to_csv(metrics_path, index=False)
+    print(f"Figures of merit of {len(table)} sweeps saved: {metrics_path}")
+    return [metrics_path]
+
+
+def store_results(inputs, items, profiler, store_path, script, directory, columns, threshold, bands):
+    """
+    Records the run in the SQLite results store: for every try, the max, min and mean of each
+    parameter plus the figures of merit of the dB parameters, keyed by the hash of its source
+    file; for every averaged sweep, its max and min (as in the summary tables). The statistics
+    of the tries decimated while reading are those reduced from all their rows. A process
+    records one run: later updates of a --watch session replace it.
+    """
+    import numpy as np
+
+    sweeps, averaged, extrema = inputs
+    digests = {item.path: item.digest or content_digest(item.path) for item in items}
+    rows = []
+
+    # Per try, numbered in the order of consolidate_sweeps
+    tries = {}
+    by_param = {}
+    for sweep in sweeps:
+        for param, values in sweep.values.items():
+            if param not in columns:
+                continue
+            key = (param, sweep.material, sweep.height)
+            tries[key] = tries.get(key, 0) + 1
+            keys = (param, sweep.material, int(sweep.height), tries[key], digests.get(sweep.path))
+            values64 = np.asarray(values, dtype=np.float64)
+            exact = sweep.exact.get(param, {})
+            rows += [keys + (name, float(exact[name] if name in exact else getattr(values64, name)()))
+                     for name in ('max', 'min', 'mean')]
+            by_param.setdefault(param, []).append((keys, sweep.frequency, values64, exact))
+    for param, entries in by_param.items():
+        if not columns[param].startswith('dB('):
+            continue
+        metrics = sweep_metrics(stack_rows([f for _, f, _, _ in entries]), stack_rows([v for _, _, v, _ in entries]),
+                                threshold, bands)
+        for name, column in metrics.items():
+            rows += [keys + (name, float(exact.get(name, value))) for (keys, _, _, exact), value in zip(entries, column)]
+
+    # Averaged over the tries
+    for param, material_data in averaged.items():
+        for material, height_data in material_data.items():
+            for height, (_, avg_values) in sorted(height_data.items()):
+                high, low = _average_extrema(extrema, param, material, height, avg_values)
+                rows += [(param, material, int(height), None, None, 'average_max', float(high)),
+                         (param, material, int(height), None, None, 'average_min', float(low))]
+
+    session = (os.path.abspath(store_path), script, directory)
+    run_id, count = write_run(store_path, script, directory, rows,
+                              {'columns': columns, 'threshold': threshold, 'bands': bands}, replace=_stored_runs.get(session))
+    _stored_runs[session] = run_id
+    print(f"Run {run_id}: {count} metrics stored in {store_path}")
+    return [store_path]
+
+
+def write_surrogate(averaged, _items, profiler, params, plot_folder, unit, predict_heights, degree):
+    """
+    Fits a spline across height to the averaged sweeps of every parameter and material (see
+    height_surrogate.py) and writes its leave-one-height-out errors. With predict_heights, also
+    writes the predicted sweeps as CSV and plots them (dashed) over the simulated ones.
+    """
+    import time
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    with profiler.stage('fit'):
+        surrogates = fit_height_surrogates(averaged, params, degree)
+        errors = []
+        for (param, material), surrogate in surrogates.items():
+            try:
+                errors += [dict(param=param, material=material, degree=surrogate.degree, **e)
+                           for e in surrogate.leave_one_out()]
+            except Exception as e:
+                print(f"Error validating the height surrogate of {param} for {material}: {e}. Skipping.")
+    errors_path = os.path.join(plot_folder, "surrogate_errors.csv")
+    pd.DataFrame(errors, columns=['param', 'material', 'degree', 'height', 'rms_error', 'max_error',
+                                  'extrapolated']).to_csv(errors_path, index=False)
+    print(f"Leave-one-height-out errors of {len(surrogates)} surrogates saved: {errors_path}")
+    paths = [errors_path]
+    if not predict_heights:
+        return paths
+
+    for (param, material), surrogate in surrogates.items():
+        try:
+            start = time.perf_counter()
+            predicted = surrogate.predict(predict_heights)
+            elapsed = time.perf_counter() - start
+            for height in [h for h, outside in zip(predict_heights, surrogate.extrapolates(predict_heights)) if outside]:
+                print(f"Warning: {height} nm lies outside the simulated heights of {param} {material}; the prediction is extrapolated.")
+            table = pd.DataFrame(predicted.T, columns=[f'{height:g} nm' for height in predict_heights])
+            table.insert(0, 'Frequency (GHz)', surrogate.frequency)
+            table_path = os.path.join(plot_folder, f"predicted_{param}_{material}.csv")
+            table.to_csv(table_path, index=False)
+            print(f"{param} of {material} predicted at {len(predict_heights)} height(s) in {elapsed * 1e3:.2f} ms: {table_path}")
+
+            with profiler.stage('render'):
+                plt.figure(figsize=(10, 6), dpi=400)  # Set the DPI to 400 for high resolution
+                for height, values in zip(surrogate.heights, surrogate.grid):
+                    plt.plot(surrogate.frequency, values, label=f'Height: {height:g} nm')
+                for height, values in zip(predict_heights, predicted):
+                    plt.plot(surrogate.frequency, values, linestyle='--', label=f'Predicted: {height:g} nm')
+                plt.xlabel('Frequency (GHz)')
+                plt.ylabel(f'{param} Parameter ({unit})')
+                plt.legend(loc='upper right')
+                plot_path = os.path.join(plot_folder, f"predicted_{param}_vs_frequency_{material}.png")
+                with profiler.stage('write'):
+                    savefig(plot_path)
+                    plt.close()
+        except Exception as e:
+            plt.close()
+            print(f"Error predicting {param} of {material}: {e}. Skipping.")
+            continue
+        print(f"Predicted {param} vs Frequency plot saved: {plot_path}")
+        paths += [table_path, plot_path]
+    return paths
+
+
+# ---------------------------- Height x Frequency Grids ---------------------------- #
+
+# Function to interpolate ragged sweeps onto one frequency axis
+def interpolate_rows(x_rows, y_rows, x_new, block_elements=4_000_000):
+    """
+    Linearly interpolates every (x, y) sweep onto x_new at once. The sweeps are shifted
+    into disjoint intervals and concatenated, so a single searchsorted finds the neighbours
+    of every output point of every row. Points outside a row's own range are NaN.
+
+    Parameters:
+    - x_rows (list): Ascending frequency arrays, one per row (lengths may differ).
+    - y_rows (list): Value arrays matching x_rows.
+    - x_new (ndarray): Common frequency axis.
+    - block_elements (int): Rows are processed in blocks of about this many output values to bound memory.
+
+    Returns:
+    - grid (ndarray): Shape (len(x_rows), len(x_new)).
+    """
+    import numpy as np
+
+    x_new = np.asarray(x_new, dtype=float)
+    lengths = np.array([len(x) for x in x_rows])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    x_all = np.concatenate([np.asarray(x, dtype=float) for x in x_rows])
+    y_all = np.concatenate([np.asarray(y, dtype=float) for y in y_rows])
+    lo = min(x_all.min(), x_new.min())
+    span = (max(x_all.max(), x_new.max()) - lo) or 1.0
+
+    # Row r occupies [2r, 2r + 1] after normalisation, so the concatenation is sorted
+    rows = np.arange(len(x_rows))
+    x_all = (x_all - lo) / span + 2.0 * np.repeat(rows, lengths)
+    q = (x_new - lo) / span
+
+    grid = np.empty((len(x_rows), len(x_new)))
+    block = max(1, block_elements // max(1, len(x_new)))
+    for first in range(0, len(x_rows), block):
+        r = rows[first:first + block, None]
+        start, end = offsets[r], offsets[r + 1] - 1
+        q_rows = q[None, :] + 2.0 * r
+        right = np.clip(np.searchsorted(x_all, q_rows, side='right'), start, end)
+        left = np.clip(right - 1, start, end)
+        x0, x1, y0, y1 = x_all[left], x_all[right], y_all[left], y_all[right]
+        weight = np.divide(q_rows - x0, x1 - x0, out=np.zeros_like(q_rows), where=x1 > x0)
+        values = y0 + weight * (y1 - y0)
+        values[(q_rows < x_all[start]) | (q_rows > x_all[end])] = np.nan
+        grid[first:first + block] = values
+    return grid
+
+
+# Function to assemble the (height x frequency) matrix of one material
+def height_frequency_grid(height_data, frequency_points=None):
+    """
+    Assembles the sweeps of one material into a (height x frequency) matrix. Sweeps that
+    share one frequency axis are stacked as they are; otherwise they are interpolated onto
+    a common linear axis spanning all sweeps.
+
+    Parameters:
+    - height_data (dict): height -> (frequency, values), e.g. averaged[param][material].
+    - frequency_points (int): Number of points of the common axis; forces interpolation if given.
+
+    Returns:
+    - heights (ndarray): Sorted heights in nm.
+    - frequency (ndarray): Common frequency axis.
+    - grid (ndarray): Values of shape (len(heights), len(frequency)); NaN where a sweep has no data.
+    """
+    import numpy as np
+
+    heights = np.array(sorted(height_data))
+    x_rows = [np.asarray(height_data[h][0], dtype=float) for h in heights]
+    y_rows = [np.asarray(height_data[h][1], dtype=float) for h in heights]
+    first = x_rows[0]
+    if frequency_points is None and all(len(x) == len(first) and np.array_equal(x, first) for x in x_rows):
+        return heights, first, np.stack(y_rows)
+    lo = min(x.min() for x in x_rows)
+    hi = max(x.max() for x in x_rows)
+    frequency = np.linspace(lo, hi, frequency_points or max(len(x) for x in x_rows))
+    return heights, frequency, interpolate_rows(x_rows, y_rows, frequency)
+
+
+# Function to plot a (height x frequency) matrix with real axes
+def plot_height_heatmap(heights, frequency, grid, param, material, plot_path, unit='dB', profiler=None, show=False):
+    """
+    Renders a (height x frequency) matrix with frequency in GHz and height in nm on the axes.
+    Unevenly spaced heights or frequencies are drawn at their true positions.
+
+    Parameters:
+    - heights (ndarray): Heights in nm (rows).
+    - frequency (ndarray): Frequency axis in GHz (columns).
+    - grid (ndarray): Values, shape (len(heights), len(frequency)).
+    - param (str): Parameter name for the labels, e.g. 'S11'.
+    - material (str): Material name for the title.
+    - plot_path (str): Where the figure is saved.
+    - unit (str): Unit of the values.
+    - profiler (StageProfiler): Times the savefig under 'write', if given.
+    - show (bool): Whether the plot is also shown on screen.
+    """
+    import contextlib
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from matplotlib.image import NonUniformImage
+
+    def half_step(axis):
+        return np.min(np.diff(axis)) / 2 if len(axis) > 1 else 0.5
+
+    fig, ax = plt.subplots(figsize=(12, 6), dpi=400)
+    image = NonUniformImage(ax, interpolation='nearest', cmap='viridis')
+    image.set_data(frequency, heights, np.ma.masked_invalid(grid))
+    ax.add_image(image)
+    ax.set_xlim(frequency[0] - half_step(frequency), frequency[-1] + half_step(frequency))
+    ax.set_ylim(heights[0] - half_step(heights), heights[-1] + half_step(heights))
+    fig.colorbar(image, ax=ax, label=f'{param} Value ({unit})')
+    ax.set_xlabel('Frequency (GHz)')
+    ax.set_ylabel('Height (nm)')
+    ax.set_title(f'Heatmap of {param} vs Height vs Frequency for {material}')
+    with profiler.stage('write') if profiler is not None else contextlib.nullcontext():
+        savefig(plot_path, fig=fig)
+        if show:
+            plt.show()
+        plt.close(fig)
+
+
+# ---------------------------- Pipeline ---------------------------- #
+
+def build_hfss_pipeline(directory, plot_folder, columns, unit='dB', show=False,
+                        cache_dir=None, profiler=None, name='hfss', threshold=-10.0, bands=(),
+                        chunk_rows=None, max_points=DEFAULT_MAX_POINTS, compact=False, duplicates=None,
+                        store_path=None, predict_heights=(), surrogate_degree=3):
+    """
+    Builds the pipeline for a tree of HFSS reports.
+
+    Parameters:
+    - directory (str): Root of the <material>/<try>/<height>nm tree of CSV or Touchstone exports.
+    - plot_folder (str): Folder where the plots and summary tables are saved.
+    - columns (dict): Parameter name -> report column, e.g. S_PARAMETERS.
+    - unit (str): Unit shown in the axis labels and summary headers.
+    - show (bool): Whether every plot is also shown on screen.
+    - cache_dir (str): Directory of the on-disk cache, or None.
+    - profiler (StageProfiler): Collects the per-stage timings.
+    - name (str): Name of the pipeline.
+    - threshold (float): Level in dB defining a resonance band in the figures of merit.
+    - bands (list): (low, high) ranges in GHz for the insertion loss and ripple in the figures of merit.
+    - chunk_rows (int): Read the CSV reports in blocks of this many rows, or None to read them whole.
+    - max_points (int): Rows kept per report when reading in blocks.
+    - compact (bool): Store the sweeps as float32 with shared frequency axes.
+    - duplicates (str): None, or 'count' / 'drop' to read byte-identical exports once and
+      use all of them / only one of them as tries (see Pipeline).
+    - store_path (str): SQLite results store written by the 'store_results' stage (default: results.sqlite
+      in the plot folder).
+    - predict_heights (list): Heights in nm at which the 'surrogate' stage predicts full sweeps.
+    - surrogate_degree (int): Degree of the spline across height of the 'surrogate' stage.
+
+    Returns:
+    - pipeline (Pipeline): Stages 'read', 'parse', 'consolidate', 'average', 'extrema', 'plot_multiline',
+      'summary_tables', 'figures_of_merit' (dB columns only), 'store_results' and 'surrogate'.
+    """
+    params = list(columns)
+    db_params = [param for param, column_name in columns.items() if column_name.startswith('dB(')]
+    stages = [
+        Stage('read', read_sweep, per_item=True, kind='parse', by_content=True, columns=columns,
+              chunk_rows=chunk_rows, max_points=max_points, compact=compact, threshold=threshold,
+              bands=[tuple(b) for b in bands]),
+        Stage('parse', parse_sweep, after='read', per_item=True),
+        Stage('consolidate', consolidate_sweeps, after='parse', cache=False, params=params, compact=compact),
+        Stage('average', average_tries, after='consolidate', kind='consolidate'),
+        Stage('plot_multiline', plot_multiline, after='average', kind='render',
+              params=params, plot_folder=plot_folder, unit=unit, show=show),
+        Stage('extrema', exact_extrema, after='parse', kind='consolidate', columns=columns, chunk_rows=chunk_rows),
+        Stage('summary_tables', write_summary_tables, after=('average', 'extrema'), kind='write',
+              params=params, plot_folder=plot_folder, unit=unit),
+        Stage('figures_of_merit', write_figures_of_merit, after=('parse', 'consolidate'), kind='write',
+              params=db_params, plot_folder=plot_folder, threshold=threshold, bands=[tuple(b) for b in bands]),
+        Stage('store_results', store_results, after=('parse', 'average', 'extrema'), kind='write',
+              store_path=store_path or os.path.join(plot_folder, DEFAULT_STORE_NAME), script=name,
+              directory=os.path.abspath(directory), columns=columns, threshold=threshold,
+              bands=[tuple(b) for b in bands]),
+        Stage('surrogate', write_surrogate, after='average', kind='write', params=params, plot_folder=plot_folder,
+              unit=unit, predict_heights=[float(h) for h in predict_heights], degree=surrogate_degree),
+    ]
+    discover = lambda: discover_files(directory, REPORT_EXTENSIONS, recursive=True, exclude_dirs=(os.path.basename(plot_folder),))
+    return Pipeline(name, discover, stages, cache_dir, profiler, duplicates)
@@ -0,0 +1,131 @@
+# Memory budget of a run.
+#
+# Large HFSS trees and dense COMSOL exports can outgrow the memory of a shared node. With
+# --memory-budget, the profiler checks the resident memory of the process at the end of
+# every stage and whenever an ingestion step asks for it (StageProfiler.memory_pressure).
+# Once the resident memory passes threshold x budget, the ingestion steps switch to their
+# low-memory mode instead of letting the run be killed: the pipelines stream the exports in
+# blocks (see chunked_io.py), reducing their statistics from every block, and
+# ansys_plotter_Arpita.py stores them as float32 (see compact_arrays.py). A warning names the
+# largest of the structures registered with track(), e.g. consolidated_data, so the user
+# knows what filled the memory. Outputs computed in low-memory mode are not cached, so a
+# later run with enough memory recomputes them in full.
+# numpy is imported inside the functions (see check_startup_time.py).
+
+import os
+import re
+import sys
+
+from compact_arrays import array_memory
+
+# Fraction of the budget at which ingestion switches to its low-memory mode
+DEFAULT_THRESHOLD = 0.8
+
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+# Function to read a memory size given on the command line
+def parse_size(text):
+    """
+    Reads a memory size such as '4G', '512M', '1.5GB' or '1000000' (bytes).
+
+    Returns:
+    - size (int): Size in bytes.
+
+    Raises:
+    - ValueError: If the text is not a size.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*([KMGT]?)(?:I?B)?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid memory size '{text}' (expected e.g. 4G, 512M or a number of bytes).")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+# Function to read the current resident memory of this process
+def current_rss_bytes():
+    """
+    Returns the current resident set size of this process (unlike peak_rss_bytes, it goes
+    down again when memory is released).
+
+    Returns:
+    - rss (int): Resident memory in bytes, or None if it cannot be determined on this platform.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def _format_bytes(n_bytes):
+    return f"{n_bytes / 1e9:.2f} GB" if n_bytes >= 1e9 else f"{n_bytes / 1e6:.1f} MB"
+
+
+class MemoryBudget:
+    """
+    Watches the resident memory of the run against a budget.
+
+    Parameters:
+    - limit (int): Budget in bytes.
+    - threshold (float): Fraction of the budget at which memory_pressure starts returning True.
+    """
+
+    def __init__(self, limit, threshold=DEFAULT_THRESHOLD):
+        self.limit = limit
+        self.threshold = threshold
+        self.structures = {}  # name -> registered structure
+        self.peak_rss = 0
+        self.warned = set()  # Levels already warned about: 'threshold', 'limit', 'unmeasurable'
+
+    def track(self, name, obj):
+        """
+        Registers (or replaces) a structure whose size is reported when the budget is approached.
+        """
+        self.structures[name] = obj
+
+    def dominating(self):
+        """
+        Returns the largest registered structure.
+
+        Returns:
+        - name (str): Its name, or None if nothing is registered.
+        - n_bytes (int): Bytes held by its arrays.
+        """
+        sizes = {name: array_memory(obj)[0] for name, obj in self.structures.items()}
+        if not sizes:
+            return None, 0
+        name = max(sizes, key=sizes.get)
+        return name, sizes[name]
+
+    def check(self, context=None):
+        """
+        Measures the resident memory and warns the first time it passes the threshold and the budget.
+
+        Parameters:
+        - context (str): What was running, for the warning (e.g. "stage 'read'").
+
+        Returns:
+        - pressure (bool): Whether the resident memory is above threshold x budget.
+        """
+        rss = current_rss_bytes()
+        if rss is None:
+            if 'unmeasurable' not in self.warned:
+                self.warned.add('unmeasurable')
+                print("Warning: the memory budget cannot be enforced, the resident memory of this process cannot be read.")
+            return False
+        self.peak_rss = max(self.peak_rss, rss)
+        level = 'limit' if rss >= self.limit else 'threshold' if rss >= self.threshold * self.limit else None
+        if level is not None and level not in self.warned:
+            self.warned.add(level)
+            name, n_bytes = self.dominating()
+            largest = f"; the largest structure is {name} ({_format_bytes(n_bytes)})" if name else ''
+            print(f"Warning: memory use {_format_bytes(rss)} is {100 * rss / self.limit:.0f}% of the "
+                  f"{_format_bytes(self.limit)} budget{f' after {context}' if context else ''}{largest}. "
+                  f"The remaining exports are read in low-memory mode.")
+        return level is not None
@@ -0,0 +1,224 @@
+# Conversions between S, Z, Y and ABCD network parameters.
+#
+# Every function works on stacks of matrices of shape (..., ports, ports), so one
+# call converts a whole sweep - or every frequency of every height, material and
+# try at once - with batched np.linalg.solve instead of per-frequency loops.
+# Reference impedances are real and may differ per port: z0 is a scalar or an
+# array of shape (ports,) or (..., ports) broadcast against the matrices.
+# numpy is imported inside the functions (see check_startup_time.py).
+
+PARAMETERS = ('S', 'Z', 'Y', 'ABCD')
+
+
+def _reference(z0, nports):
+    """
+    Returns sqrt(z0) per port with shape (..., ports), and its inverse.
+    """
+    import numpy as np
+
+    z0 = np.asarray(z0, dtype=float)
+    if np.any(z0 <= 0):
+        raise ValueError("Reference impedances must be positive and real.")
+    root = np.sqrt(np.broadcast_to(z0, z0.shape[:-1] + (nports,) if z0.ndim else (nports,)))
+    return root, 1.0 / root
+
+
+def _identity(m):
+    import numpy as np
+    return np.broadcast_to(np.eye(m.shape[-1], dtype=complex), m.shape)
+
+
+# Function to convert S-parameters to Z-parameters
+def s_to_z(s, z0=50.0):
+    """
+    Converts S-parameters to impedance parameters: Z = sqrt(z0) (I - S)^-1 (I + S) sqrt(z0).
+
+    Parameters:
+    - s (ndarray): S matrices, shape (..., ports, ports).
+    - z0 (float or ndarray): Reference impedance(s) in Ohm.
+
+    Returns:
+    - z (ndarray): Z matrices in Ohm, same shape as s.
+    """
+    import numpy as np
+
+    s = np.asarray(s, dtype=complex)
+    eye = _identity(s)
+    root, _ = _reference(z0, s.shape[-1])
+    z_normalised = np.linalg.solve(eye - s, eye + s)
+    return root[..., :, None] * z_normalised * root[..., None, :]
+
+
+# Function to convert Z-parameters to S-parameters
+def z_to_s(z, z0=50.0):
+    """
+    Converts impedance parameters to S-parameters: S = (Zn + I)^-1 (Zn - I) with Zn the normalised Z.
+
+    Parameters:
+    - z (ndarray): Z matrices in Ohm, shape (..., ports, ports).
+    - z0 (float or ndarray): Reference impedance(s) in Ohm.
+
+    Returns:
+    - s (ndarray): S matrices, same shape as z.
+    """
+    import numpy as np
+
+    z = np.asarray(z, dtype=complex)
+    eye = _identity(z)
+    _, inverse_root = _reference(z0, z.shape[-1])
+    z_normalised = inverse_root[..., :, None] * z * inverse_root[..., None, :]
+    return np.linalg.solve(z_normalised + eye, z_normalised - eye)
+
+
+# Function to convert S-parameters to Y-parameters
+def s_to_y(s, z0=50.0):
+    """
+    Converts S-parameters to admittance parameters: Y = sqrt(y0) (I + S)^-1 (I - S) sqrt(y0).
+
+    Parameters:
+    - s (ndarray): S matrices, shape (..., ports, ports).
+    - z0 (float or ndarray): Reference impedance(s) in Ohm.
+
+    Returns:
+    - y (ndarray): Y matrices in Siemens, same shape as s.
+    """
+    import numpy as np
+
+    s = np.asarray(s, dtype=complex)
+    eye = _identity(s)
+    _, inverse_root = _reference(z0, s.shape[-1])
+    y_normalised = np.linalg.solve(eye + s, eye - s)
+    return inverse_root[..., :, None] * y_normalised * inverse_root[..., None, :]
+
+
+# Function to convert Y-parameters to S-parameters
+def y_to_s(y, z0=50.0):
+    """
+    Converts admittance parameters to S-parameters: S = (I + Yn)^-1 (I - Yn) with Yn the normalised Y.
+
+    Parameters:
+    - y (ndarray): Y matrices in Siemens, shape (..., ports, ports).
+    - z0 (float or ndarray): Reference impedance(s) in Ohm.
+
+    Returns:
+    - s (ndarray): S matrices, same shape as y.
+    """
+    import numpy as np
+
+    y = np.asarray(y, dtype=complex)
+    eye = _identity(y)
+    root, _ = _reference(z0, y.shape[-1])
+    y_normalised = root[..., :, None] * y * root[..., None, :]
+    return np.linalg.solve(eye + y_normalised, eye - y_normalised)
+
+
+# Function to convert two-port Z-parameters to ABCD (chain) parameters
+def z_to_abcd(z):
+    """
+    Converts two-port impedance parameters to ABCD parameters:
+    A = Z11/Z21, B = det(Z)/Z21, C = 1/Z21, D = Z22/Z21.
+
+    Parameters:
+    - z (ndarray): Z matrices in Ohm, shape (..., 2, 2).
+
+    Returns:
+    - abcd (ndarray): [[A, B], [C, D]] matrices, shape (..., 2, 2).
+    """
+    import numpy as np
+
+    z = np.asarray(z, dtype=complex)
+    if z.shape[-2:] != (2, 2):
+        raise ValueError("ABCD parameters are defined for two-port networks only.")
+    z21 = z[..., 1, 0]
+    abcd = np.empty_like(z)
+    abcd[..., 0, 0] = z[..., 0, 0] / z21
+    abcd[..., 0, 1] = np.linalg.det(z) / z21
+    abcd[..., 1, 0] = 1.0 / z21
+    abcd[..., 1, 1] = z[..., 1, 1] / z21
+    return abcd
+
+
+# Function to convert ABCD (chain) parameters to two-port Z-parameters
+def abcd_to_z(abcd):
+    """
+    Converts ABCD parameters to two-port impedance parameters:
+    Z11 = A/C, Z12 = det(ABCD)/C, Z21 = 1/C, Z22 = D/C.
+
+    Parameters:
+    - abcd (ndarray): [[A, B], [C, D]] matrices, shape (..., 2, 2).
+
+    Returns:
+    - z (ndarray): Z matrices in Ohm, shape (..., 2, 2).
+    """
+    import numpy as np
+
+    abcd = np.asarray(abcd, dtype=complex)
+    if abcd.shape[-2:] != (2, 2):
+        raise ValueError("ABCD parameters are defined for two-port networks only.")
+    c = abcd[..., 1, 0]
+    z = np.empty_like(abcd)
+    z[..., 0, 0] = abcd[..., 0, 0] / c
+    z[..., 0, 1] = np.linalg.det(abcd) / c
+    z[..., 1, 0] = 1.0 / c
+    z[..., 1, 1] = abcd[..., 1, 1] / c
+    return z
+
+
+# Function to change the reference impedance of S-parameters
+def renormalize_s(s, z0_old, z0_new):
+    """
+    Re-expresses S-parameters measured against z0_old for the reference impedance(s) z0_new.
+
+    Parameters:
+    - s (ndarray): S matrices, shape (..., ports, ports).
+    - z0_old (float or ndarray): Current reference impedance(s) in Ohm.
+    - z0_new (float or ndarray): New reference impedance(s) in Ohm.
+
+    Returns:
+    - s (ndarray): Renormalised S matrices.
+    """
+    return z_to_s(s_to_z(s, z0_old), z0_new)
+
+
+# Function to convert between any two parameter sets
+def convert(data, source, target, z0=50.0):
+    """
+    Converts network parameters from one representation to another.
+
+    Parameters:
+    - data (ndarray): Matrices of shape (..., ports, ports) in the source representation.
+    - source (str): One of 'S', 'Z', 'Y', 'ABCD'.
+    - target (str): One of 'S', 'Z', 'Y', 'ABCD'.
+    - z0 (float or ndarray): Reference impedance(s) of the S-parameters in Ohm.
+
+    Returns:
+    - converted (ndarray): Matrices in the target representation.
+    """
+    import numpy as np
+
+    source, target = source.upper(), target.upper()
+    for name in (source, target):
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown network parameter '{name}' (expected one of {', '.join(PARAMETERS)}).")
+    if source == target:
+        return np.asarray(data, dtype=complex)
+
+    # Go through Z (or S, for Y) so that every pair needs at most two steps
+    if source == 'S':
+        z = s_to_z(data, z0) if target != 'Y' else None
+    elif source == 'Z':
+        z = np.asarray(data, dtype=complex)
+    elif source == 'Y':
+        if target == 'S':
+            return y_to_s(data, z0)
+        z = np.linalg.inv(data)
+    else:
+        z = abcd_to_z(data)
+
+    if target == 'Y':
+        return s_to_y(data, z0) if source == 'S' else np.linalg.inv(z)
+    if target == 'Z':
+        return z
+    if target == 'S':
+        return z_to_s(z, z0)
+    return z_to_abcd(z)
@@ -0,0 +1,126 @@
+# Cutlines at any angle through ODMR field maps.
+#
+# A cutline is a segment from (row, column) start to end in pixel coordinates, sampled at
+# sub-pixel positions and averaged across a band of the given width perpendicular to it.
+# The sample positions of all lines are built as one coordinate array of shape
+# (lines, width_samples, samples), and every map is sampled at all of them in one call:
+# order 1 gathers the four neighbours of every position from a stack of maps at once
+# (bilinear interpolation, NaN where a neighbour is NaN or outside the map); higher orders
+# use scipy.ndimage.map_coordinates (spline interpolation), one call per map.
+# numpy and scipy are imported inside the functions (see check_startup_time.py).
+
+
+# Function to build the sample positions of a set of cutlines
+def cutline_coordinates(lines, samples=None, width=0.0, width_samples=None):
+    """
+    Returns the sub-pixel positions sampled along and across every cutline.
+
+    Parameters:
+    - lines (list): ((row0, col0), (row1, col1)) segments in pixels.
+    - samples (int): Samples along every line (default: one per pixel of the longest line, plus one).
+    - width (float): Width in pixels of the band averaged across the line (0 for a single line).
+    - width_samples (int): Samples across the band (default: one per pixel of width, plus one).
+
+    Returns:
+    - rows, cols (ndarray): Positions of shape (lines, width_samples, samples).
+    - lengths (ndarray): Length of every line in pixels.
+    """
+    import numpy as np
+
+    segments = np.asarray(lines, dtype=float).reshape(-1, 2, 2)
+    start, end = segments[:, 0], segments[:, 1]
+    direction = end - start
+    lengths = np.hypot(direction[:, 0], direction[:, 1])
+    samples = samples or int(np.ceil(lengths.max())) + 1
+    width_samples = width_samples or (int(np.ceil(width)) + 1 if width > 0 else 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unit = np.where(lengths[:, None] > 0, direction / lengths[:, None], 0.0)
+    normal = np.stack([-unit[:, 1], unit[:, 0]], axis=1)  # Perpendicular to the line
+    along = np.linspace(0.0, 1.0, samples)
+    across = np.linspace(-width / 2, width / 2, width_samples) if width_samples > 1 else np.zeros(1)
+    # (lines, width_samples, samples, 2)
+    positions = (start[:, None, None, :] + along[None, None, :, None] * direction[:, None, None, :]
+                 + across[None, :, None, None] * normal[:, None, None, :])
+    return positions[..., 0], positions[..., 1], lengths
+
+
+def _bilinear(maps, rows, cols):
+    """
+    Bilinear interpolation of a stack of maps (maps, height, width) at the given positions;
+    NaN outside the maps.
+    """
+    import numpy as np
+
+    height, width = maps.shape[-2:]
+    inside = (rows >= 0) & (rows <= height - 1) & (cols >= 0) & (cols <= width - 1)
+    r0 = np.clip(np.floor(rows).astype(int), 0, max(height - 2, 0))
+    c0 = np.clip(np.floor(cols).astype(int), 0, max(width - 2, 0))
+    r1 = np.minimum(r0 + 1, height - 1)
+    c1 = np.minimum(c0 + 1, width - 1)
+    fr = np.clip(rows - r0, 0.0, 1.0)
+    fc = np.clip(cols - c0, 0.0, 1.0)
+    values = ((1 - fr) * (1 - fc) * maps[:, r0, c0] + (1 - fr) * fc * maps[:, r0, c1]
+              + fr * (1 - fc) * maps[:, r1, c0] + fr * fc * maps[:, r1, c1])
+    return np.where(inside, values, np.nan)
+
+
+# Function to sample many cutlines from many maps at once
+def sample_cutlines(maps, lines, samples=None, width=0.0, width_samples=None, order=1):
+    """
+    Samples every map along every cutline and averages across the width of the band.
+
+    Parameters:
+    - maps (ndarray): One map (height, width) or a stack (maps, height, width).
+    - lines (list): ((row0, col0), (row1, col1)) segments in pixels.
+    - samples (int): Samples along every line (see cutline_coordinates).
+    - width (float): Width in pixels of the band averaged across the line.
+    - width_samples (int): Samples across the band.
+    - order (int): 1 for bilinear interpolation, 3 for cubic splines (scipy.ndimage.map_coordinates).
+
+    Returns:
+    - distances (ndarray): Distance in pixels of every sample from the start, shape (lines, samples).
+    - profiles (ndarray): Shape (maps, lines, samples), or (lines, samples) for a single map;
+      NaN where the whole band lies outside the map or on missing data.
+    """
+    import warnings
+    import numpy as np
+
+    maps = np.asarray(maps, dtype=np.float64)
+    single = maps.ndim == 2
+    maps = maps[None] if single else maps
+    rows, cols, lengths = cutline_coordinates(lines, samples, width, width_samples)
+
+    if order == 1:
+        values = _bilinear(maps, rows, cols)
+    else:
+        from scipy.ndimage import map_coordinates
+
+        coordinates = np.stack([rows.ravel(), cols.ravel()])
+        values = np.stack([map_coordinates(m, coordinates, order=order, mode='constant', cval=np.nan)
+                           for m in maps]).reshape((len(maps),) + rows.shape)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Bands entirely outside the map average to NaN
+        profiles = np.nanmean(values, axis=2)
+
+    fraction = np.linspace(0.0, 1.0, rows.shape[-1])
+    distances = lengths[:, None] * fraction[None, :]
+    return distances, (profiles[0] if single else profiles)
+
+
+# Function to compute the gradient of a field map
+def gradient_map(B, pixel_size=1.0):
+    """
+    Computes the spatial gradient of a field map by central differences.
+
+    Parameters:
+    - B (ndarray): Field map (height, width).
+    - pixel_size (float): Pixel size, e.g. in µm.
+
+    Returns:
+    - gradient (ndarray): Shape (3, height, width): dB/drow, dB/dcol and the magnitude, per unit of pixel_size.
+    """
+    import numpy as np
+
+    d_row, d_col = np.gradient(np.asarray(B, dtype=np.float64), pixel_size)
+    return np.stack([d_row, d_col, np.hypot(d_row, d_col)])
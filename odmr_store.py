@@ -0,0 +1,184 @@
+# HDF5 store of processed ODMR results.
+#
+# Layout of the file:
+#   /maps/<current>/B, background, signal   background-subtracted field map and its inputs
+#   /cutlines/<name>/distances, lines        cutlines extracted from the maps (see odmr_cutlines.py)
+#   /cutlines/<name>/<current>               profiles, shape (lines, samples)
+#   /fits/<method>/<current>/slope, ...      line fits of the map rows (see robust_fit.py, bootstrap.py)
+# The maps are stored in chunks of band_rows full rows, so reading a band of rows (the
+# usual cutline average) decompresses only the chunks it overlaps, and compressed with
+# LZF after a byte shuffle, which is fast to write and read. Every map group records the
+# raw measurement files it was computed from (path, size and modification time), the
+# conversion_factor and the divisor turning the fitted frequencies into the field, so a
+# later analysis can open the store instead of re-reading and subtracting the raw files.
+# numpy and h5py are imported inside the functions (see check_startup_time.py).
+
+import os
+import json
+
+# Version of the layout, stored as an attribute of the file
+STORE_VERSION = 1
+
+# Rows per chunk of the stored maps
+DEFAULT_BAND_ROWS = 16
+
+
+def _file_stamp(path):
+    return [os.path.getsize(path), os.path.getmtime(path)] if os.path.exists(path) else None
+
+
+def _write_array(group, name, values, band_rows=None, compression='lzf'):
+    """
+    Writes one dataset, replacing an existing one; 2D arrays are chunked in bands of full rows.
+    """
+    import numpy as np
+
+    values = np.asarray(values)
+    if name in group:
+        del group[name]
+    if values.ndim == 2 and values.size:
+        chunks = (max(1, min(band_rows or DEFAULT_BAND_ROWS, values.shape[0])), values.shape[1])
+        return group.create_dataset(name, data=values, chunks=chunks, compression=compression, shuffle=True)
+    return group.create_dataset(name, data=values)
+
+
+# Function to write the processed maps of a measurement set
+def write_odmr_store(path, B, sources, conversion_factor, field_divisor, background=None, signal=None,
+                     band_rows=DEFAULT_BAND_ROWS, compression='lzf'):
+    """
+    Writes the background-subtracted maps to a new HDF5 store (an existing file is replaced).
+
+    Parameters:
+    - path (str): Path of the store.
+    - B (dict): Current label -> field map.
+    - sources (dict): Current label -> {role: raw file path}, e.g. {'background_right': ...}.
+    - conversion_factor (float): Pixel size in µm.
+    - field_divisor (float): Divisor turning the fitted frequency difference into the field (28e3).
+    - background, signal (dict): Current label -> right-minus-left maps, stored alongside B if given.
+    - band_rows (int): Rows per chunk.
+    - compression (str): h5py compression filter ('lzf', or 'gzip' for smaller, slower files).
+    """
+    import h5py
+
+    with h5py.File(path, 'w') as f:
+        f.attrs['version'] = STORE_VERSION
+        f.attrs['conversion_factor'] = conversion_factor
+        f.attrs['field_divisor'] = field_divisor
+        maps = f.create_group('maps')
+        for key, values in B.items():
+            group = maps.create_group(key)
+            _write_array(group, 'B', values, band_rows, compression)
+            for name, extra in (('background', background), ('signal', signal)):
+                if extra is not None and key in extra:
+                    _write_array(group, name, extra[key], band_rows, compression)
+            files = sources.get(key, {})
+            group.attrs['sources'] = json.dumps({role: os.path.abspath(p) for role, p in files.items()})
+            group.attrs['source_stamps'] = json.dumps({os.path.abspath(p): _file_stamp(p) for p in files.values()})
+            group.attrs['conversion_factor'] = conversion_factor
+            group.attrs['field_divisor'] = field_divisor
+            group.attrs['formula'] = 'B = (signal - background) / field_divisor'
+
+
+# Function to check whether a store still matches its raw files
+def store_is_current(path, sources, field_divisor=None):
+    """
+    Tells whether the store holds every current of sources, computed from the same raw files
+    (same paths, sizes and modification times) and with the same field divisor.
+    """
+    import h5py
+
+    if not os.path.exists(path):
+        return False
+    try:
+        with h5py.File(path, 'r') as f:
+            if field_divisor is not None and f.attrs.get('field_divisor') != field_divisor:
+                return False
+            for key, files in sources.items():
+                if key not in f.get('maps', {}):
+                    return False
+                stamps = json.loads(f['maps'][key].attrs.get('source_stamps', '{}'))
+                for p in files.values():
+                    if stamps.get(os.path.abspath(p)) != _file_stamp(p):
+                        return False
+    except OSError:
+        return False  # Not an HDF5 file, or left incomplete by an interrupted run
+    return True
+
+
+# Function to read maps back from a store
+def read_odmr_maps(path, keys=None, rows=None, name='B'):
+    """
+    Reads stored maps, optionally only a band of rows (which reads only the chunks it overlaps).
+
+    Parameters:
+    - path (str): Path of the store.
+    - keys (list): Current labels to read (default: all).
+    - rows (slice): Band of rows to read, e.g. slice(20, 30) (default: all).
+    - name (str): 'B', 'background' or 'signal'.
+
+    Returns:
+    - maps (dict): Current label -> array.
+    - attributes (dict): 'conversion_factor' and 'field_divisor' of the store.
+    """
+    import h5py
+
+    maps = {}
+    with h5py.File(path, 'r') as f:
+        for key in keys or list(f['maps']):
+            dataset = f['maps'][key].get(name)
+            if dataset is not None:
+                maps[key] = dataset[rows if rows is not None else slice(None)]
+        attributes = {'conversion_factor': f.attrs.get('conversion_factor'), 'field_divisor': f.attrs.get('field_divisor')}
+    return maps, attributes
+
+
+# Function to add extracted cutlines to a store
+def write_cutlines(path, name, lines, width, distances, profiles):
+    """
+    Adds (or replaces) a set of cutlines in the store.
+
+    Parameters:
+    - path (str): Path of the store.
+    - name (str): Name of the set, e.g. 'B_width10'.
+    - lines (list): ((row0, col0), (row1, col1)) segments in pixels.
+    - width (float): Width in pixels of the averaged band.
+    - distances (ndarray): Distance in µm along every line, shape (lines, samples).
+    - profiles (dict): Current label -> array (lines, samples).
+    """
+    import numpy as np
+    import h5py
+
+    with h5py.File(path, 'a') as f:
+        group = f.require_group('cutlines').require_group(name)
+        _write_array(group, 'lines', np.asarray(lines, dtype=float).reshape(-1, 4))
+        _write_array(group, 'distances', distances)
+        for key, values in profiles.items():
+            _write_array(group, key, values)
+        group.attrs['width'] = width
+
+
+# Function to add line fits to a store
+def write_line_fits(path, method, fits, intervals=None):
+    """
+    Adds (or replaces) the line fits of the map rows, with their bootstrap intervals if given.
+
+    Parameters:
+    - path (str): Path of the store.
+    - method (str): Fit method, used as the group name.
+    - fits (dict): Current label -> LineFit.
+    - intervals (dict): Current label -> list of SlopeInterval, one per row.
+    """
+    import numpy as np
+    import h5py
+
+    with h5py.File(path, 'a') as f:
+        group = f.require_group('fits').require_group(method)
+        for key, fit in fits.items():
+            fit_group = group.require_group(key)
+            for name in ('slope', 'intercept', 'scale'):
+                _write_array(fit_group, name, np.atleast_1d(getattr(fit, name)))
+            if intervals and key in intervals:
+                for name in ('slope_low', 'slope_high', 'intercept_low', 'intercept_high'):
+                    _write_array(fit_group, name, [getattr(i, name) for i in intervals[key]])
+                fit_group.attrs['confidence'] = intervals[key][0].confidence if intervals[key] else float('nan')
+                fit_group.attrs['replicates'] = intervals[key][0].replicates if intervals[key] else 0
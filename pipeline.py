@@ -0,0 +1,558 @@
+import os
+import re
+import pickle
+import hashlib
+import inspect
+import functools
+from dataclasses import dataclass, replace
+
+from stage_profiler import StageProfiler
+
+# A small staged pipeline shared by the COMSOL, cutline and HFSS scripts.
+#
+# A pipeline starts with a discover function that lists the source files and is
+# followed by named stages. Per-item stages run once for every source file;
+# aggregate stages run once over the outputs of their input stage. Every output
+# is cached under a key that hashes the stage code, its parameters and the keys
+# of its inputs, so changing a plot setting only re-runs the plotting stages and
+# changing a fit only re-runs the fit and what depends on it. The stage code is the
+# source of the stage's module and of every module of this repository it imports
+# (also inside functions), so fixing a numeric helper invalidates the stages using it.
+# After every run, the entries of the evaluated stages that the run did not use are
+# dropped from memory and from disk, so superseded outputs (e.g. the consolidated data
+# of an older set of files) do not pile up.
+#
+# With duplicates='count' or 'drop', files of equal size are fingerprinted by their
+# contents; stages marked by_content are then keyed by the contents instead of the
+# path, so byte-identical exports are parsed once, and 'drop' ingests only one of them.
+
+
+# Version of every cache key; bump it when cached results must be recomputed for a reason
+# the source of the modules does not show (e.g. a changed pickle layout of an intermediate).
+CACHE_VERSION = 1
+
+IMPORT_LINE = re.compile(r'^\s*(?:from\s+(\w+)[\w.]*\s+import|import\s+([\w., ]+))', re.MULTILINE)
+
+
+# ---------------------------- Intermediates ---------------------------- #
+
+@dataclass(frozen=True)
+class SourceFile:
+    """
+    A discovered input file.
+
+    Attributes:
+    - path (str): Path of the file.
+    - size (int): Size in bytes.
+    - mtime_ns (int): Modification time in nanoseconds.
+    - digest (str): Hash of the contents, set by fingerprint_contents for files that may have a twin.
+    """
+    path: str
+    size: int
+    mtime_ns: int
+    digest: str = None
+
+    @classmethod
+    def from_path(cls, path):
+        stat = os.stat(path)
+        return cls(path, stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def key(self):
+        """Fingerprint of the file; changes whenever the file is rewritten."""
+        return hash_key('file', self.path, self.size, self.mtime_ns)
+
+    @property
+    def content_key(self):
+        """Fingerprint of the contents; equal for byte-identical files (the path key if no digest was taken)."""
+        return hash_key('content', self.size, self.digest) if self.digest else self.key
+
+
+# Function to hash any number of values into a cache key
+def hash_key(*parts):
+    """
+    Hashes the repr of the given values into a short hex key.
+
+    Returns:
+    - key (str): 32-character hex digest.
+    """
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Function to hash a source file together with the local modules it depends on
+@functools.lru_cache(maxsize=None)
+def module_fingerprint(path):
+    """
+    Hashes a source file and every module of its directory that it imports, transitively.
+    Imports inside functions count too, since the scripts import their helpers lazily.
+
+    Parameters:
+    - path (str): Path of a .py file.
+
+    Returns:
+    - key (str): 32-character hex digest.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    sources, pending = {}, [os.path.abspath(path)]
+    while pending:
+        current = pending.pop()
+        if current in sources:
+            continue
+        with open(current, 'rb') as f:
+            sources[current] = f.read()
+        for match in IMPORT_LINE.finditer(sources[current].decode('utf-8', 'replace')):
+            names = [match.group(1)] if match.group(1) else [n.split()[0].split('.')[0] for n in match.group(2).split(',') if n.strip()]
+            for name in names:
+                candidate = os.path.join(directory, f"{name}.py")
+                if os.path.isfile(candidate):
+                    pending.append(candidate)
+    return hash_key(*[(os.path.basename(p), hashlib.blake2b(sources[p], digest_size=16).hexdigest()) for p in sorted(sources)])
+
+
+def function_fingerprint(function):
+    """
+    Hashes the source code of a stage function and of the modules it can call (see
+    module_fingerprint), so that editing either invalidates its cache.
+    """
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = getattr(getattr(function, '__code__', None), 'co_code', repr(function))
+    try:
+        modules = module_fingerprint(inspect.getsourcefile(function))
+    except (OSError, TypeError):
+        modules = None
+    return hash_key(getattr(function, '__qualname__', repr(function)), source, modules)
+
+
+# ---------------------------- Cache ---------------------------- #
+
+class PipelineCache:
+    """
+    Pickle cache of stage outputs, held in memory and optionally mirrored to a directory.
+
+    Parameters:
+    - directory (str): Directory for the cache files, or None to keep the cache in memory only.
+    - namespace (str): Prefix of the cache files, so pipelines sharing a directory do not prune
+      each other's entries (e.g. the pipeline name).
+    """
+
+    MISSING = object()
+
+    def __init__(self, directory=None, namespace=None):
+        self.directory = directory
+        self.namespace = namespace
+        self.memory = {}  # (stage name, key) -> value
+        self.used = {}  # Stage name -> keys read or written since the last prune
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _file_name(self, stage_name, key):
+        return f"{self.namespace}.{stage_name}-{key}.pkl" if self.namespace else f"{stage_name}-{key}.pkl"
+
+    def _path(self, stage_name, key):
+        return os.path.join(self.directory, self._file_name(stage_name, key))
+
+    def get(self, stage_name, key):
+        if (stage_name, key) in self.memory:
+            self.used.setdefault(stage_name, set()).add(key)
+            return self.memory[stage_name, key]
+        if self.directory:
+            try:
+                with open(self._path(stage_name, key), 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return self.MISSING
+            self.memory[stage_name, key] = value
+            self.used.setdefault(stage_name, set()).add(key)
+            return value
+        return self.MISSING
+
+    def put(self, stage_name, key, value):
+        self.memory[stage_name, key] = value
+        self.used.setdefault(stage_name, set()).add(key)
+        if self.directory:
+            path = self._path(stage_name, key)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+
+    def prune(self, stage_names):
+        """
+        Drops the entries of the given stages that were neither read nor written since the last
+        prune, from memory and from disk, and starts recording the used entries anew.
+
+        Parameters:
+        - stage_names (list): Stages whose entries were all looked up since the last prune.
+
+        Returns:
+        - removed (int): Number of cache files deleted.
+        """
+        stage_names = set(stage_names)
+        used = self.used
+        self.used = {}
+        for entry in [entry for entry in self.memory if entry[0] in stage_names and entry[1] not in used.get(entry[0], ())]:
+            del self.memory[entry]
+        removed = 0
+        if self.directory:
+            prefix = f"{self.namespace}." if self.namespace else ''
+            for file_name in os.listdir(self.directory):
+                name, _, key = file_name[:-len('.pkl')].rpartition('-')
+                stage_name = name[len(prefix):]
+                if (file_name.endswith('.pkl') and name.startswith(prefix) and stage_name in stage_names
+                        and file_name == self._file_name(stage_name, key) and key not in used.get(stage_name, ())):
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+    def clear(self):
+        """
+        Empties the cache: every entry in memory and every cache file of the directory, whatever
+        its namespace.
+
+        Returns:
+        - removed (int): Number of cache files deleted.
+        """
+        self.memory.clear()
+        self.used = {}
+        removed = 0
+        if self.directory:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(('.pkl', '.pkl.tmp')):
+                    os.remove(os.path.join(self.directory, file_name))
+                    removed += 1
+        return removed
+
+
+# ---------------------------- Stages ---------------------------- #
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Parameters:
+    - name (str): Unique name of the stage within its pipeline.
+    - function (callable): per-item stages are called as function(value, item, profiler=..., **params),
+      aggregate stages as function(value, items, profiler=..., **params). A per-item input gives an
+      aggregate stage the list of values of the items that produced one (and items is that list of
+      items); an aggregate input gives its single output. With several inputs, value is a tuple.
+    - after (str or tuple): Name(s) of the input stage(s); None means the stage consumes the discovered files.
+    - kind (str): Profiler stage the work is reported under (see stage_profiler.STAGES).
+    - per_item (bool): Whether the stage runs once per source file.
+    - cache (bool): Whether outputs are cached. Stages that write files return the written
+      paths and are re-run when any of them is missing.
+    - by_content (bool): For per-item stages that only depend on the file contents: outputs are keyed by
+      the content fingerprint, so byte-identical files share one evaluation. Stages after a by_content
+      stage that are not by_content themselves are keyed by the path again.
+    - params: Keyword arguments passed to the function; they are part of the cache key.
+    """
+
+    def __init__(self, name, function, after=None, kind=None, per_item=False, cache=True, by_content=False, **params):
+        self.name = name
+        self.function = function
+        self.inputs = () if after is None else ((after,) if isinstance(after, str) else tuple(after))
+        self.kind = kind or name
+        self.per_item = per_item
+        self.cache = cache
+        self.by_content = by_content
+        self.params = params
+        self.fingerprint = hash_key(CACHE_VERSION, name, function_fingerprint(function),
+                                    sorted(params.items(), key=lambda p: p[0]))
+
+
+class Pipeline:
+    """
+    Runs a discover function followed by a set of stages, reusing cached outputs.
+
+    Parameters:
+    - name (str): Name of the pipeline, used for the default profiler.
+    - discover (callable): Returns the list of SourceFile items to process.
+    - stages (list): Stage objects; each stage's inputs must come before it.
+    - cache_dir (str): Directory of the on-disk cache, or None for an in-memory cache.
+    - profiler (StageProfiler): Collects the per-stage timings.
+    - duplicates (str): None to ingest every file as it is; 'count' to fingerprint the contents so
+      byte-identical files are parsed once but still all used; 'drop' to also ingest only the first
+      file (by path) of every set of identical files.
+    """
+
+    def __init__(self, name, discover, stages, cache_dir=None, profiler=None, duplicates=None):
+        if duplicates not in (None, 'count', 'drop'):
+            raise ValueError(f"Unknown duplicates mode '{duplicates}' (expected 'count' or 'drop').")
+        self.name = name
+        self.discover = discover
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name '{stage.name}'.")
+            for after in stage.inputs:
+                if after not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' runs after unknown stage '{after}'.")
+                if stage.per_item and not self.stages[after].per_item:
+                    raise ValueError(f"Per-item stage '{stage.name}' cannot follow aggregate stage '{after}'.")
+            self.stages[stage.name] = stage
+        self.cache = PipelineCache(cache_dir, name)
+        self.profiler = profiler or StageProfiler(name)
+        self.duplicates = duplicates
+        self.items = []
+        self.stats = {}
+        self.duplicate_groups = []
+        self.results = {}  # Stage name -> {path: output} of the per-item stages of the last run
+        self.degraded = set()  # Paths of the items ingested in a low-memory mode during the last run
+
+    # ---- keys ---- #
+
+    def _item_key(self, stage, item):
+        if not stage.inputs:
+            return hash_key(stage.fingerprint, item.content_key if stage.by_content else item.key)
+        upstream = [self._item_key(self.stages[after], item) for after in stage.inputs]
+        if not stage.by_content and any(self.stages[after].by_content for after in stage.inputs):
+            upstream.append(item.key)  # Location-dependent results of identical files differ
+        return hash_key(stage.fingerprint, upstream)
+
+    def _aggregate_key(self, stage, items):
+        upstream = []
+        for after in stage.inputs or (None,):
+            if after is None:
+                upstream.append([item.key for item in items])
+            elif self.stages[after].per_item:
+                upstream.append([self._item_key(self.stages[after], item) for item in items])
+            else:
+                upstream.append(self._aggregate_key(self.stages[after], items))
+        return hash_key(stage.fingerprint, upstream)
+
+    # ---- evaluation ---- #
+
+    def _lookup(self, stage, key):
+        if not stage.cache:
+            return PipelineCache.MISSING
+        value = self.cache.get(stage.name, key)
+        if value is not PipelineCache.MISSING and stage.kind in ('render', 'write'):
+            if not all(os.path.exists(path) for path in (value or [])):
+                return PipelineCache.MISSING
+        return value
+
+    def _count(self, stage, hit):
+        counts = self.stats.setdefault(stage.name, {'computed': 0, 'cached': 0})
+        counts['cached' if hit else 'computed'] += 1
+
+    def _run_item(self, stage, item, memo):
+        memo_key = (stage.name, item.content_key if stage.by_content else item.path)
+        if memo_key in memo:
+            return memo[memo_key]
+        key = self._item_key(stage, item)
+        value = self._lookup(stage, key)
+        self._count(stage, value is not PipelineCache.MISSING)
+        if value is PipelineCache.MISSING:
+            if stage.inputs:
+                upstream = tuple(self._run_item(self.stages[after], item, memo) for after in stage.inputs)
+            else:
+                upstream = (item,)
+            fallbacks = len(self.profiler.fallbacks)
+            if any(v is None for v in upstream):
+                value = None
+            else:
+                with self.profiler.stage(stage.kind, file=item.path):
+                    value = stage.function(upstream[0] if len(upstream) == 1 else upstream, item,
+                                           profiler=self.profiler, **stage.params)
+            # Outputs of a low-memory fallback (see memory_budget.py), and everything computed from
+            # them, are not cached so that they are recomputed in full next time
+            if len(self.profiler.fallbacks) > fallbacks:
+                self.degraded.add(item.path)
+            if stage.cache and item.path not in self.degraded:
+                self.cache.put(stage.name, key, value)
+        memo[memo_key] = value
+        if value is not None:
+            self.results.setdefault(stage.name, {})[item.path] = value
+            self.profiler.track(f"'{stage.name}' results", self.results[stage.name])
+        return value
+
+    def _run_aggregate(self, stage, items, memo):
+        if stage.name in memo:
+            return memo[stage.name]
+        key = self._aggregate_key(stage, items)
+        value = self._lookup(stage, key)
+        self._count(stage, value is not PipelineCache.MISSING)
+        if value is PipelineCache.MISSING:
+            used = items
+            upstream = []
+            for after in stage.inputs or (None,):
+                if after is None:
+                    upstream.append(items)
+                elif self.stages[after].per_item:
+                    pairs = [(item, self._run_item(self.stages[after], item, memo)) for item in items]
+                    used = [item for item, v in pairs if v is not None]
+                    upstream.append([v for _, v in pairs if v is not None])
+                else:
+                    upstream.append(self._run_aggregate(self.stages[after], items, memo))
+            fallbacks = len(self.profiler.fallbacks)
+            with self.profiler.stage(stage.kind):
+                value = stage.function(upstream[0] if len(upstream) == 1 else tuple(upstream), used,
+                                       profiler=self.profiler, **stage.params)
+            if stage.cache and not self.degraded and len(self.profiler.fallbacks) == fallbacks:
+                self.cache.put(stage.name, key, value)
+        memo[stage.name] = value
+        return value
+
+    def run(self, targets=None, items=None):
+        """
+        Evaluates the requested stages, computing only what is not cached, then drops the cache
+        entries of the evaluated stages that this run did not use (see PipelineCache.prune).
+
+        Parameters:
+        - targets (list): Names of the stages to evaluate (default: all stages).
+        - items (list): SourceFile items to process instead of calling discover.
+
+        Returns:
+        - results (dict): Stage name -> output. Per-item stages map to a list of
+          (item, value) pairs for the items that produced a value.
+        """
+        if items is None:
+            with self.profiler.stage('discover'):
+                items = self.discover()
+        self.items = list(items)
+        self.stats = {}
+        self.results = {}
+        self.degraded = set()
+        if self.duplicates:
+            self.items, self.duplicate_groups = deduplicate(self.items, self.duplicates, self.cache, self.profiler)
+
+        memo = {}
+        results = {}
+        for name in targets or list(self.stages):
+            stage = self.stages[name]
+            if stage.per_item:
+                pairs = [(item, self._run_item(stage, item, memo)) for item in self.items]
+                results[name] = [(item, value) for item, value in pairs if value is not None]
+            else:
+                results[name] = self._run_aggregate(stage, self.items, memo)
+        self.cache.prune(list(self.stats) + (['digest'] if self.duplicates else []))
+        return results
+
+    def cache_summary(self):
+        """
+        Returns a one-line description of how many stage outputs were computed and reused.
+        """
+        parts = [f"{name} {counts['computed']} computed/{counts['cached']} cached"
+                 for name, counts in self.stats.items()]
+        return 'Pipeline cache: ' + (', '.join(parts) if parts else 'nothing evaluated')
+
+
+# ---------------------------- Discovery Helpers ---------------------------- #
+
+# Function to hash the contents of a file
+def content_digest(path, block_size=1 << 20):
+    """
+    Hashes the contents of a file in blocks with BLAKE2b.
+
+    Parameters:
+    - path (str): Path of the file.
+    - block_size (int): Bytes read at a time.
+
+    Returns:
+    - digest (str): 32-character hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to fingerprint the files that may have byte-identical twins
+def fingerprint_contents(items, cache=None, profiler=None):
+    """
+    Sets the content digest of every file that shares its size with another file; files of
+    a unique size cannot have a twin and are not read. Digests are kept in the cache under
+    the file's path key, so unchanged files are only hashed once.
+
+    Parameters:
+    - items (list): SourceFile items.
+    - cache (PipelineCache): Cache for the digests, or None.
+    - profiler (StageProfiler): Times the hashing under 'read', if given.
+
+    Returns:
+    - items (list): The items, with digest set where it was needed, in the same order.
+    """
+    sizes = {}
+    for item in items:
+        sizes[item.size] = sizes.get(item.size, 0) + 1
+    fingerprinted = []
+    for item in items:
+        if sizes[item.size] > 1:
+            digest = cache.get('digest', item.key) if cache is not None else PipelineCache.MISSING
+            if digest is PipelineCache.MISSING:
+                if profiler is not None:
+                    with profiler.stage('read', file=item.path):
+                        digest = content_digest(item.path)
+                    profiler.add_bytes(item.size, file=item.path)
+                else:
+                    digest = content_digest(item.path)
+                if cache is not None:
+                    cache.put('digest', item.key, digest)
+            item = replace(item, digest=digest)
+        fingerprinted.append(item)
+    return fingerprinted
+
+
+# Function to find and optionally drop byte-identical files
+def deduplicate(items, mode='drop', cache=None, profiler=None):
+    """
+    Fingerprints the files and reports every set of byte-identical files.
+
+    Parameters:
+    - items (list): SourceFile items.
+    - mode (str): 'count' keeps every file; 'drop' keeps only the first file (by path) of every set.
+    - cache (PipelineCache): Cache for the digests, or None.
+    - profiler (StageProfiler): Times the hashing, if given.
+
+    Returns:
+    - items (list): The fingerprinted items that are ingested.
+    - groups (list): Lists of paths of identical files, the kept file first.
+    """
+    items = fingerprint_contents(items, cache, profiler)
+    by_digest = {}
+    for item in items:
+        if item.digest:
+            by_digest.setdefault(item.content_key, []).append(item)
+    groups = [sorted(group, key=lambda i: i.path) for group in by_digest.values() if len(group) > 1]
+    dropped = {item.path for group in groups for item in group[1:]} if mode == 'drop' else set()
+    for group in groups:
+        action = 'dropped' if mode == 'drop' else 'parsed once, counted'
+        print(f"Identical exports ({action}): {', '.join(item.path for item in group)}")
+    if groups:
+        copies = sum(len(group) - 1 for group in groups)
+        print(f"{copies} duplicate file(s) in {len(groups)} set(s) of identical exports")
+    return [item for item in items if item.path not in dropped], [[item.path for item in group] for group in groups]
+
+
+def discover_files(directory, extensions, recursive=False, exclude_dirs=()):
+    """
+    Lists the files with the given extensions as SourceFile items, in a stable order.
+
+    Parameters:
+    - directory (str): Directory to search.
+    - extensions (tuple): Lower-case file extensions, e.g. ('.csv',).
+    - recursive (bool): Whether to search subdirectories.
+    - exclude_dirs (tuple): Directory names that are skipped when searching recursively.
+
+    Returns:
+    - items (list): SourceFile items sorted by path.
+    """
+    paths = []
+    if recursive:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if d not in exclude_dirs]
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(extensions))
+    else:
+        paths = [os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(extensions)]
+    return [SourceFile.from_path(path) for path in sorted(paths)]
+
+
+def default_cache_dir(plot_folder):
+    """
+    Returns the cache directory used by the scripts for a given plot folder.
+    """
+    return os.path.join(plot_folder, '.pipeline_cache')
@@ -6,60 +6,255 @@ Created on Sun Dec  1 19:07:24 2024
 """
 
 import os
-import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-import h5py
 import argparse
 
+from pipeline import Pipeline, SourceFile, Stage
+from compact_arrays import compact_array, memory_report
+from robust_fit import ROBUST_METHODS, robust_line_fit
+from bootstrap import DEFAULT_REPLICATES, bootstrap_slope, bootstrap_slopes
+from odmr_cutlines import gradient_map, sample_cutlines
+from odmr_store import read_odmr_maps, store_is_current, write_cutlines, write_line_fits, write_odmr_store
+
+# numpy, matplotlib, sklearn and h5py are imported inside the methods that use
+# them so that the script starts quickly (see check_startup_time.py)
+
+# Divisor turning the fitted frequency difference (signal - background) into the field B
+FIELD_DIVISOR = 28e3
+
+
+# Function to read the fitted ODMR parameters of one measurement
+def read_fit_params(file_path):
+    """
+    Reads the 'data/fit_param' array of an ODMR measurement.
+
+    Parameters:
+    - file_path (str): Path of the .hdf5 file.
+
+    Returns:
+    - data (ndarray): The fitted parameters, or None if the file could not be read.
+    """
+    import numpy as np
+    import h5py
+
+    try:
+        with h5py.File(file_path, 'r') as f:
+            data = np.array(f['data']['fit_param'])
+        return data
+    except Exception as e:
+        print(f"Error opening {file_path}: {e}")
+        return None
+
+
+def load_stage(item, _item, profiler):
+    """
+    Pipeline stage: reads one measurement (cached per file).
+    """
+    return read_fit_params(item.path)
+
+
+def subtract_stage(arrays, items, profiler, filenames, file_paths, compact=False):
+    """
+    Pipeline stage: right-minus-left differences of background and signal, and the field B.
+    The differences are taken in float64; with compact set the resulting maps are stored as float32.
+    """
+    import numpy as np
+
+    store = compact_array if compact else (lambda values: values)
+    loaded = {item.path: data for item, data in zip(items, arrays)}
+    data_background, data_signal, B = {}, {}, {}
+    for key, files in filenames.items():
+        parts = [loaded.get(file_paths[files[role]]) for role in
+                 ('background_right', 'background_left', 'signal_right', 'signal_left')]
+        if any(part is None for part in parts):
+            print(f"One or more data files could not be loaded for {key}.")
+            continue
+        data_bg_right, data_bg_left, data_signal_right, data_signal_left = [np.asarray(part, dtype=np.float64) for part in parts]
+        background = data_bg_right - data_bg_left
+        signal = data_signal_right - data_signal_left
+        data_background[key] = store(background)
+        data_signal[key] = store(signal)
+        B[key] = store((signal - background) / FIELD_DIVISOR)
+    if compact:
+        print(memory_report("ODMR maps", [data_background, data_signal, B]))
+    return data_background, data_signal, B
+
+
+def gradient_stage(subtracted, items, profiler, pixel_size):
+    """
+    Pipeline stage: the gradient of every field map B (cached, so it is computed once per map).
+    """
+    _, _, B = subtracted
+    return {key: gradient_map(values, pixel_size) for key, values in B.items()}
+
 
 class AverageCutlineProcessing:
-    def __init__(self, base_measurement_folder, filenames):
+    def __init__(self, base_measurement_folder, filenames, cache_dir=None, compact=False, store_path=None):
         self.base_measurement_folder = base_measurement_folder
         self.filenames = filenames
+        self.cache_dir = cache_dir
+        self.compact = compact  # Keep the background, signal and B maps as float32 (see compact_arrays.py)
+        self.store_path = store_path  # HDF5 store of the processed maps, cutlines and fits (see odmr_store.py)
         self.data_background = {}
         self.data_signal = {}
         self.B = {}
 
+    def file_path(self, name):
+        return os.path.join(self.base_measurement_folder, name, f'{name}.hdf5')
+
     def load_data(self, name):
-        measurement_folder = os.path.join(self.base_measurement_folder, name)
-        file_path = os.path.join(measurement_folder, f'{name}.hdf5')
-
-        try:
-            with h5py.File(file_path, 'r') as f:
-                data = np.array(f['data']['fit_param'])
-            return data
-        except Exception as e:
-            print(f"Error opening {file_path}: {e}")
-            return None
-
-    def remove_background_signal(self):
-        for key, files in self.filenames.items():
-            data_bg_right = self.load_data(files['background_right'])
-            data_bg_left = self.load_data(files['background_left'])
-            data_signal_right = self.load_data(files['signal_right'])
-            data_signal_left = self.load_data(files['signal_left'])
-
-            if data_bg_right is None or data_bg_left is None or data_signal_left is None or data_signal_right is None:
-                print(f"One or more data files could not be loaded for {key}.")
-                continue
-
-            self.data_background[key] = data_bg_right - data_bg_left
-            self.data_signal[key] = data_signal_right - data_signal_left
-            self.B[key] = (self.data_signal[key] - self.data_background[key]) / 28e3
+        return read_fit_params(self.file_path(name))
+
+    def discover(self):
+        items = []
+        for name in sorted({name for files in self.filenames.values() for name in files.values()}):
+            file_path = self.file_path(name)
+            if os.path.exists(file_path):
+                items.append(SourceFile.from_path(file_path))
+            else:
+                print(f"Error opening {file_path}: file does not exist")
+        return items
+
+    def build_pipeline(self, pixel_size=1.0):
+        file_paths = {name: self.file_path(name) for files in self.filenames.values() for name in files.values()}
+        stages = [
+            Stage('load', load_stage, kind='read', per_item=True),
+            Stage('subtract', subtract_stage, after='load', kind='consolidate',
+                  filenames=self.filenames, file_paths=file_paths, compact=self.compact),
+            Stage('gradient', gradient_stage, after='subtract', kind='consolidate', pixel_size=pixel_size),
+        ]
+        return Pipeline('plot_cutline_vs_simulation', self.discover, stages, self.cache_dir)
+
+    def remove_background_signal(self, conversion_factor=float('nan')):
+        sources = {key: {role: self.file_path(name) for role, name in files.items()}
+                   for key, files in self.filenames.items()}
+        if self.store_path and store_is_current(self.store_path, sources, FIELD_DIVISOR):
+            # The store was written from the same raw files: skip the raw loads and subtractions
+            self.B = read_odmr_maps(self.store_path, list(self.filenames))[0]
+            self.data_background = read_odmr_maps(self.store_path, list(self.filenames), name='background')[0]
+            self.data_signal = read_odmr_maps(self.store_path, list(self.filenames), name='signal')[0]
+            print(f"Processed maps loaded from {self.store_path}")
+            return
+
+        # Each measurement is read once and reused from the cache while the file is unchanged
+        results = self.build_pipeline().run(['subtract'])
+        self.data_background, self.data_signal, self.B = results['subtract']
+        if self.store_path:
+            write_odmr_store(self.store_path, self.B, {key: sources[key] for key in self.B}, conversion_factor,
+                             FIELD_DIVISOR, self.data_background, self.data_signal)
+            print(f"Processed maps saved: {self.store_path}")
 
     def plot_averaged_cutlines(self, conversion_factor):
+        import numpy as np
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 5))
         for key, B in self.B.items():
             x_axis = np.arange(B.shape[1]) * conversion_factor  # Convert x-axis from pixels to µm
-            plt.plot(x_axis, B[20:30, :].mean(axis=0), label=key)
+            plt.plot(x_axis, B[20:30, :].mean(axis=0, dtype=np.float64), label=key)
         plt.title('Averaged Data Cutlines Comparison')
         plt.xlabel('Position (µm)')
         plt.ylabel('uT')
         plt.legend()
         plt.show()
 
-def plot_data(file_path, conversion_factor, averaged_cutline_data):
+    def gradient_maps(self, conversion_factor):
+        """
+        Returns the gradient of every field map: current label -> array (3, height, width) with
+        dB/drow, dB/dcol and the magnitude in uT/µm. Computed once and then read from the cache.
+        """
+        return self.build_pipeline(pixel_size=conversion_factor).run(['gradient'])['gradient']
+
+    def extract_cutlines(self, lines, conversion_factor, width=0.0, samples=None, order=1, source='B', store_name=None):
+        """
+        Samples every map along cutlines at any angle, averaged across a band (see odmr_cutlines.py).
+        Maps of the same shape are sampled together in one call.
+
+        Parameters:
+        - lines (list): ((row0, col0), (row1, col1)) segments in pixels.
+        - conversion_factor (float): Pixel size in µm.
+        - width (float): Width of the averaged band in pixels.
+        - samples (int): Samples along every line (default: about one per pixel).
+        - order (int): 1 for bilinear interpolation, 3 for cubic splines.
+        - source (str): 'B' for the field maps, 'gradient' for the magnitude of their gradient.
+        - store_name (str): Name under which the cutlines are added to the HDF5 store, if there is one.
+
+        Returns:
+        - distances (ndarray): Distance in µm of every sample from the start of its line, shape (lines, samples).
+        - profiles (dict): Current label -> array (lines, samples).
+        """
+        import numpy as np
+
+        maps = self.B if source == 'B' else {key: g[2] for key, g in self.gradient_maps(conversion_factor).items()}
+        by_shape = {}
+        for key, values in maps.items():
+            by_shape.setdefault(np.shape(values), []).append(key)
+        profiles = {}
+        for keys in by_shape.values():
+            distances, sampled = sample_cutlines(np.stack([maps[key] for key in keys]), lines, samples, width, order=order)
+            profiles.update(zip(keys, sampled))
+        if self.store_path and store_name:
+            write_cutlines(self.store_path, store_name, lines, width, distances * conversion_factor, profiles)
+        return distances * conversion_factor, profiles
+
+    def plot_cutlines(self, lines, conversion_factor, width=0.0, order=1, source='B'):
+        """
+        Plots the cutlines of every map (see extract_cutlines), one panel per line.
+        """
+        import matplotlib.pyplot as plt
+
+        distances, profiles = self.extract_cutlines(lines, conversion_factor, width, order=order, source=source,
+                                                    store_name=f'{source}_width{width:g}')
+        fig, axes = plt.subplots(len(lines), 1, figsize=(10, 4 * len(lines)), squeeze=False)
+        for k, ((r0, c0), (r1, c1)) in enumerate(lines):
+            ax = axes[k, 0]
+            for key, sampled in profiles.items():
+                ax.plot(distances[k], sampled[k], label=key)
+            ax.set_title(f'Cutline ({r0:g}, {c0:g}) to ({r1:g}, {c1:g}) px, width {width:g} px')
+            ax.set_xlabel('Position along the cutline (µm)')
+            ax.set_ylabel('uT' if source == 'B' else 'uT/µm')
+            ax.legend()
+        fig.tight_layout()
+        plt.show()
+
+    def fit_cutline_slopes(self, conversion_factor, method='huber', replicates=0, seed=0):
+        """
+        Fits a straight line to every row of every field map at once, so that fit-failure
+        spikes of the ODMR data do not drag the slopes (see robust_fit.py).
+
+        Parameters:
+        - conversion_factor (float): Pixel size in µm.
+        - method (str): 'ols', 'huber', 'tukey' or 'ransac'.
+        - replicates (int): If non-zero, also bootstrap a 95% interval of the slope of every row
+          with this many replicates (see bootstrap.py).
+        - seed (int): Seed of the bootstrap.
+
+        Returns:
+        - fits (dict): Current label -> LineFit with one slope per row of the map.
+        - intervals (dict): Current label -> one SlopeInterval per row (empty without replicates).
+        """
+        import numpy as np
+
+        fits, intervals = {}, {}
+        for key, B in self.B.items():
+            x_axis = np.arange(B.shape[1]) * conversion_factor  # Convert x-axis from pixels to µm
+            fit = robust_line_fit(x_axis, B, method)
+            print(f"{key}: median {method} slope {np.nanmedian(fit.slope):.4g} uT/µm over {len(fit.slope)} cutlines, "
+                  f"{int(fit.outliers.sum())} outlying points down-weighted")
+            fits[key] = fit
+            if replicates:
+                intervals[key] = bootstrap_slopes([(x_axis, row) for row in B], replicates, seed=seed, method=method)
+                widths = [i.slope_high - i.slope_low for i in intervals[key]]
+                print(f"{key}: median 95% interval width of the row slopes {np.nanmedian(widths):.4g} uT/µm "
+                      f"({replicates} replicates)")
+        if self.store_path:
+            write_line_fits(self.store_path, method, fits, intervals)
+        return fits, intervals
+
+def plot_data(file_path, conversion_factor, averaged_cutline_data, method='huber', replicates=DEFAULT_REPLICATES):
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from sklearn.linear_model import LinearRegression
+
     try:
         print(f"Loading file: {file_path}")
         data = np.loadtxt(file_path, skiprows=1)
@@ -81,14 +276,17 @@ def plot_data(file_path, conversion_factor, averaged_cutline_data):
         x_um = (x - x.mean()) * conversion_factor
         x_um_range = np.linspace(-15, 15, len(x_um))  # Adjust the range to match simulation data
 
-        # Linear regression for experimental data
-        model_exp = LinearRegression()
-        model_exp.fit(x_um, y)
-        y_pred_exp = model_exp.predict(x_um)
+        # Robust linear regression for experimental data (spikes from failed fits are down-weighted)
+        fit_exp = robust_line_fit(x_um.ravel(), y, method)
+        y_pred_exp = fit_exp.predict(x_um.ravel())
 
         print(f"File: {file_path}")
-        print("Experimental Data Slope (m):", model_exp.coef_[0])
-        print("Experimental Data Intercept (b):", model_exp.intercept_)
+        print("Experimental Data Slope (m):", fit_exp.slope)
+        print("Experimental Data Intercept (b):", fit_exp.intercept)
+        print(f"Outlying points down-weighted ({method}):", int(fit_exp.outliers))
+        if replicates:
+            interval = bootstrap_slope(x_um.ravel(), y, replicates, method=method)
+            print(f"Experimental Data Slope 95% interval: [{interval.slope_low}, {interval.slope_high}] ({replicates} replicates)")
 
         # Define endpoints for simulated data and create linear fit
         x_sim_points = np.array([[-15], [15]])
@@ -121,7 +319,7 @@ def plot_data(file_path, conversion_factor, averaged_cutline_data):
         # Plot averaged cutline data from simulation
         for key, B in averaged_cutline_data.items():
             x_axis_simulation = np.linspace(-15, 15, B.shape[1])
-            averaged_data = B[20:30, :].mean(axis=0) * conversion_factor
+            averaged_data = B[20:30, :].mean(axis=0, dtype=np.float64) * conversion_factor
 
             if len(x_axis_simulation) == len(averaged_data):  # Ensure x and y have the same length
                 plt.plot(x_axis_simulation, averaged_data, label=f'Averaged Cutline {key}')
@@ -139,8 +337,16 @@ def plot_data(file_path, conversion_factor, averaged_cutline_data):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Plot cutline vs simulation.')
-    parser.add_argument('file_path', type=str, help='Path to the .txt file for plotting')
-    args = argparse.Namespace(file_path=r'/home/sparks/Documents/diamond/1e10.txt')
+    parser.add_argument('file_path', type=str, nargs='?', default=r'/home/sparks/Documents/diamond/1e10.txt',
+                        help='Path to the .txt file for plotting')
+    parser.add_argument('--fit', choices=ROBUST_METHODS, default='huber', help='Line fit of the cutlines (default: huber)')
+    parser.add_argument('--bootstrap', type=int, default=0,
+                        help=f'Bootstrap replicates of the slope intervals, e.g. {DEFAULT_REPLICATES} (default: 0, none; '
+                             f'every row of the maps is bootstrapped, which takes seconds per row with the robust fits)')
+    parser.add_argument('--line', nargs=4, type=float, action='append', default=[], metavar=('ROW0', 'COL0', 'ROW1', 'COL1'),
+                        help='Also plot the cutline between these pixel positions (repeatable)')
+    parser.add_argument('--width', type=float, default=10.0, help='Width in pixels of the band averaged across each cutline')
+    args = parser.parse_args()
 
     base_measurement_folder = r'/home/sparks/Documents/'
 
@@ -153,7 +359,15 @@ if __name__ == "__main__":
         }
     }
 
-    average_cutline_processing = AverageCutlineProcessing(base_measurement_folder, filenames_average_cutlines)
-    average_cutline_processing.remove_background_signal()
-
-    plot_data(args.file_path, conversion_factor=0.6896551724137931, averaged_cutline_data=average_cutline_processing.B)
\ No newline at end of file
+    average_cutline_processing = AverageCutlineProcessing(base_measurement_folder, filenames_average_cutlines,
+                                                          cache_dir=os.path.join(base_measurement_folder, '.pipeline_cache'),
+                                                          store_path=os.path.join(base_measurement_folder, 'odmr_processed.hdf5'))
+    average_cutline_processing.remove_background_signal(conversion_factor=0.6896551724137931)
+    average_cutline_processing.fit_cutline_slopes(conversion_factor=0.6896551724137931, method=args.fit,
+                                                  replicates=args.bootstrap)
+    if args.line:
+        average_cutline_processing.plot_cutlines([((r0, c0), (r1, c1)) for r0, c0, r1, c1 in args.line],
+                                                 conversion_factor=0.6896551724137931, width=args.width)
+
+    plot_data(args.file_path, conversion_factor=0.6896551724137931, averaged_cutline_data=average_cutline_processing.B,
+              method=args.fit, replicates=args.bootstrap)
\ No newline at end of file
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+
+# Local SQLite store of summary metrics across runs.
+#
+# Every run that writes results gets a row in `runs`; its metrics are bulk-inserted
+# into `metrics` in long form, one row per (param, material, height, try, metric),
+# together with the hash of the source file and the run id. try and source_hash are
+# NULL for metrics of the sweep averaged over the tries. Indexes on those keys make
+# cross-run questions ("best S21 of every material over the last month") answer
+# without re-reading any export:
+#
+#   python results_store.py results.sqlite runs
+#   python results_store.py results.sqlite query --param S21 --metric average_max --since 30d --best 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    script TEXT,
+    directory TEXT,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    param TEXT NOT NULL,
+    material TEXT NOT NULL,
+    height INTEGER,
+    try INTEGER,
+    source_hash TEXT,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS metrics_by_key ON metrics (param, metric, material, height);
+CREATE INDEX IF NOT EXISTS metrics_by_run ON metrics (run_id);
+CREATE INDEX IF NOT EXISTS metrics_by_source ON metrics (source_hash);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (started);
+"""
+
+# Default file name of the store inside a plot folder
+DEFAULT_STORE_NAME = 'results.sqlite'
+
+
+# Function to open (and create if needed) a results store
+def connect(path):
+    """
+    Opens the SQLite results store, creating the tables and indexes if needed.
+
+    Parameters:
+    - path (str): Path of the database file.
+
+    Returns:
+    - connection (sqlite3.Connection): The open connection; rows can be read by column name.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')  # Readers do not block a run that is writing
+    connection.executescript(SCHEMA)
+    return connection
+
+
+# Function to record a run and its metrics
+def write_run(path, script, directory, rows, options=None, replace=None):
+    """
+    Records one run and bulk-inserts its metrics in a single transaction.
+
+    Parameters:
+    - path (str): Path of the database file.
+    - script (str): Name of the script that produced the metrics.
+    - directory (str): Data directory of the run.
+    - rows (iterable): (param, material, height, try, source_hash, metric, value) tuples.
+    - options (dict): Settings of the run, stored as JSON.
+    - replace (int): Id of an earlier run whose metrics are replaced by these (e.g. the previous
+      update of a --watch session), or None to record a new run.
+
+    Returns:
+    - run_id (int): Id of the run.
+    - count (int): Number of metric rows inserted.
+    """
+    connection = connect(path)
+    try:
+        with connection:
+            started = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            arguments = (started, script, directory, json.dumps(options or {}, sort_keys=True))
+            cursor = connection.execute('UPDATE runs SET started = ?, script = ?, directory = ?, options = ? '
+                                        'WHERE run_id = ?', arguments + (replace,)) if replace is not None else None
+            if cursor is not None and cursor.rowcount:
+                run_id = replace
+                connection.execute('DELETE FROM metrics WHERE run_id = ?', (run_id,))
+            else:
+                cursor = connection.execute('INSERT INTO runs (started, script, directory, options) VALUES (?, ?, ?, ?)',
+                                            arguments)
+                run_id = cursor.lastrowid
+            cursor = connection.executemany(
+                'INSERT INTO metrics (run_id, param, material, height, try, source_hash, metric, value) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((run_id,) + tuple(row) for row in rows))
+            count = cursor.rowcount
+    finally:
+        connection.close()
+    return run_id, count
+
+
+# Function to turn '30d', '12h' or an ISO date into a timestamp
+def parse_since(since):
+    """
+    Converts a relative age ('30d', '12h', '45m') or an ISO date/time into the UTC
+    timestamp format of the runs table.
+
+    Raises:
+    - ValueError: If the value cannot be interpreted.
+    """
+    units = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+    if since[-1:] in units and since[:-1].replace('.', '', 1).isdigit():
+        moment = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(**{units[since[-1]]: float(since[:-1])})
+    else:
+        moment = datetime.datetime.fromisoformat(since)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(datetime.timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+# Function to query metrics across runs
+def query_metrics(connection, param=None, metric=None, material=None, height=None, since=None,
+                  run_id=None, latest=False, best=None, lowest=False, limit=None):
+    """
+    Selects metrics joined with their run.
+
+    Parameters:
+    - connection (sqlite3.Connection): An open store (see connect).
+    - param, metric, material (str): Filters on the keys (None for any).
+    - height (int): Filter on the height in nm.
+    - since (str): Only runs started after this moment (see parse_since).
+    - run_id (int): Only this run.
+    - latest (bool): Only the most recent run with matching metrics.
+    - best (int): Return this many rows with the highest values (lowest if lowest is set).
+    - lowest (bool): Rank ascending instead of descending.
+    - limit (int): Maximum number of rows.
+
+    Returns:
+    - rows (list): sqlite3.Row objects with run_id, started, script, param, material, height, try,
+      source_hash, metric and value.
+    """
+    clauses, arguments = [], []
+    for column, value in (('m.param', param), ('m.metric', metric), ('m.material', material),
+                          ('m.height', height), ('m.run_id', run_id)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            arguments.append(value)
+    if since is not None:
+        clauses.append('r.started >= ?')
+        arguments.append(parse_since(since))
+    if latest:
+        # The most recent run that has metrics matching the other filters
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        clauses.append(f'm.run_id = (SELECT MAX(m.run_id) FROM metrics m JOIN runs r ON r.run_id = m.run_id{where})')
+        arguments = arguments * 2
+    if best is not None:
+        clauses.append('m.value IS NOT NULL')
+    sql = ('SELECT m.run_id, r.started, r.script, m.param, m.material, m.height, m.try, m.source_hash, m.metric, m.value '
+           'FROM metrics m JOIN runs r ON r.run_id = m.run_id')
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    if best is not None:
+        sql += f" ORDER BY m.value {'ASC' if lowest else 'DESC'}"
+        limit = best
+    else:
+        sql += ' ORDER BY m.run_id, m.param, m.material, m.height, m.try, m.metric'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        arguments.append(int(limit))
+    return connection.execute(sql, arguments).fetchall()
+
+
+def print_table(rows, columns):
+    """
+    Prints rows as an aligned text table.
+    """
+    cells = [[('' if row[c] is None else f'{row[c]:.6g}' if isinstance(row[c], float) else str(row[c])) for c in columns]
+             for row in rows]
+    widths = [max([len(c)] + [len(r[k]) for r in cells]) for k, c in enumerate(columns)]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print('  '.join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+# Main function to execute the script
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Query the SQLite store of summary metrics across runs.')
+    parser.add_argument('store', help='Path of the results database (e.g. <data>/plots/results.sqlite)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('runs', help='List the recorded runs')
+    commands.add_parser('metrics', help='List the stored parameters and metric names')
+    query = commands.add_parser('query', help='Select metrics across runs')
+    query.add_argument('--param', help='Parameter, e.g. S21')
+    query.add_argument('--metric', help='Metric, e.g. average_max or resonance_db')
+    query.add_argument('--material', help='Material, e.g. Ti-Au')
+    query.add_argument('--height', type=int, help='Height in nm')
+    query.add_argument('--since', help="Only runs after this moment: '30d', '12h' or an ISO date")
+    query.add_argument('--run', type=int, help='Only this run id')
+    query.add_argument('--latest', action='store_true', help='Only the most recent run with matching metrics')
+    query.add_argument('--best', type=int, metavar='N', help='Show the N highest values')
+    query.add_argument('--lowest', action='store_true', help='With --best, show the N lowest values instead')
+    query.add_argument('--limit', type=int, help='Maximum number of rows')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        print(f"The results store '{args.store}' does not exist.")
+        sys.exit(1)
+    connection = connect(args.store)
+
+    if args.command == 'runs':
+        rows = connection.execute('SELECT r.run_id, r.started, r.script, r.directory, COUNT(m.run_id) AS metrics '
+                                  'FROM runs r LEFT JOIN metrics m ON m.run_id = r.run_id '
+                                  'GROUP BY r.run_id ORDER BY r.run_id').fetchall()
+        print_table(rows, ['run_id', 'started', 'script', 'directory', 'metrics'])
+    elif args.command == 'metrics':
+        rows = connection.execute('SELECT param, metric, COUNT(*) AS n FROM metrics '
+                                  'GROUP BY param, metric ORDER BY param, metric').fetchall()
+        print_table(rows, ['param', 'metric', 'n'])
+    else:
+        try:
+            rows = query_metrics(connection, args.param, args.metric, args.material, args.height, args.since,
+                                 args.run, args.latest, args.best, args.lowest, args.limit)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print_table(rows, ['run_id', 'started', 'param', 'material', 'height', 'try', 'metric', 'value'])
+        print(f"{len(rows)} row(s)")
+    connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# RF figures of merit of every sweep in the consolidated HFSS store.
+#
+# All sweeps of a parameter are stacked into NaN-padded (sweeps x points) frequency
+# and value arrays, and every metric is found with whole-array operations: threshold
+# crossings are the sign changes of (values - level), located with boolean masks and
+# argmax/argmin over the index axis, then refined by linear interpolation between the
+# two samples around the crossing; minima are refined with a three-point parabola.
+# Values are expected in dB (the dB(St(i,j)) report columns).
+# StreamingMetrics gives the same metrics for a sweep read block by block (see chunked_io.py),
+# keeping only the samples they depend on.
+# numpy and pandas are imported inside the functions (see check_startup_time.py).
+
+from box_stats import stack_rows
+
+# Columns of the figure-of-merit table, besides the per-band insertion loss and ripple
+METRIC_COLUMNS = ['resonance_ghz', 'resonance_db', 'resonances', 'bandwidth_low_ghz', 'bandwidth_high_ghz',
+                  'bandwidth_ghz', 'peak_db', 'cutoff_3db_ghz']
+
+
+def _take(a, idx):
+    """
+    Returns a[row, idx[row]] for every row, NaN where idx is out of range.
+    """
+    import numpy as np
+
+    valid = (idx >= 0) & (idx < a.shape[1])
+    picked = np.take_along_axis(a, np.clip(idx, 0, a.shape[1] - 1)[:, None], axis=1)[:, 0]
+    return np.where(valid, picked, np.nan)
+
+
+def _crossing(frequency, values, left, level):
+    """
+    Interpolates the frequency where every row passes `level` between samples left and left + 1.
+    Rows whose crossing is not bracketed by two samples give NaN.
+    """
+    import numpy as np
+
+    f0, f1 = _take(frequency, left), _take(frequency, left + 1)
+    v0, v1 = _take(values, left), _take(values, left + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(v1 != v0, (level - v0) / (v1 - v0), 0.0)
+    return f0 + fraction * (f1 - f0)
+
+
+# Function to compute the figures of merit of many sweeps at once
+def sweep_metrics(frequency, values, threshold=-10.0, bands=()):
+    """
+    Computes resonance, bandwidth, cut-off, insertion loss and ripple of every sweep.
+
+    Parameters:
+    - frequency (ndarray): Ascending frequencies in GHz, shape (sweeps, points), NaN-padded.
+    - values (ndarray): Values in dB with the same shape, NaN-padded.
+    - threshold (float): Level in dB defining a resonance band (e.g. -10 dB return loss).
+    - bands (list): (low, high) frequency ranges in GHz for the insertion loss and ripple.
+
+    Returns:
+    - metrics (dict): Column name -> ndarray with one value per sweep:
+      - resonance_ghz, resonance_db: Frequency and depth of the deepest minimum.
+      - resonances: Number of separate bands below threshold.
+      - bandwidth_low_ghz, bandwidth_high_ghz, bandwidth_ghz: Edges and width of the band
+        below threshold around the deepest minimum (NaN if it runs past the sweep).
+      - peak_db, cutoff_3db_ghz: Maximum value and the first frequency above it where the
+        sweep has dropped 3 dB below it.
+      - insertion_loss_db_<low>-<high>GHz, ripple_db_<low>-<high>GHz: Mean of -values and
+        peak-to-peak variation inside every band.
+    """
+    import warnings
+    import numpy as np
+
+    frequency = np.asarray(frequency, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_rows, n_points = values.shape
+    index = np.arange(n_points)[None, :]
+    lengths = (~np.isnan(values)).sum(axis=1)
+    metrics = {}
+
+    # Deepest minimum, refined with a parabola through its neighbours
+    k = np.where(np.isnan(values), np.inf, values).argmin(axis=1)
+    v_left, v_mid, v_right = _take(values, k - 1), _take(values, k), _take(values, k + 1)
+    curvature = v_left - 2 * v_mid + v_right
+    inner = (k > 0) & (k < lengths - 1) & (curvature > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(inner, 0.5 * (v_left - v_right) / np.where(inner, curvature, 1.0), 0.0)
+    f_left, f_mid, f_right = _take(frequency, k - 1), _take(frequency, k), _take(frequency, k + 1)
+    step = np.where(delta < 0, f_mid - f_left, f_right - f_mid)
+    metrics['resonance_ghz'] = np.where(lengths > 0, f_mid + delta * np.nan_to_num(step), np.nan)
+    metrics['resonance_db'] = np.where(lengths > 0, v_mid - 0.25 * (v_left - v_right) * delta, np.nan)
+
+    # Bands below threshold: count the entries into them, then find the edges around the minimum
+    below = values < threshold
+    above = values >= threshold
+    metrics['resonances'] = (below[:, 1:] & ~below[:, :-1]).sum(axis=1) + below[:, 0]
+    left = np.where(above & (index < k[:, None]), index, -1).max(axis=1)
+    right = np.where(above & (index > k[:, None]), index, n_points).min(axis=1)
+    resonant = below[np.arange(n_rows), k]
+    low = np.where(resonant & (left >= 0), _crossing(frequency, values, left, threshold), np.nan)
+    high = np.where(resonant & (right < n_points), _crossing(frequency, values, right - 1, threshold), np.nan)
+    metrics['bandwidth_low_ghz'] = low
+    metrics['bandwidth_high_ghz'] = high
+    metrics['bandwidth_ghz'] = high - low
+
+    # 3 dB cut-off: first crossing of (peak - 3 dB) after the peak
+    p = np.where(np.isnan(values), -np.inf, values).argmax(axis=1)
+    peak = _take(values, p)
+    dropped = values < (peak - 3.0)[:, None]
+    first = np.where(dropped & (index > p[:, None]), index, n_points).min(axis=1)
+    metrics['peak_db'] = np.where(lengths > 0, peak, np.nan)
+    metrics['cutoff_3db_ghz'] = np.where(first < n_points, _crossing(frequency, values, first - 1, peak - 3.0), np.nan)
+
+    # Insertion loss and ripple inside the requested bands
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Bands outside a sweep give NaN
+        for band_low, band_high in bands:
+            in_band = np.where((frequency >= band_low) & (frequency <= band_high), values, np.nan)
+            name = f'{band_low:g}-{band_high:g}GHz'
+            metrics[f'insertion_loss_db_{name}'] = -np.nanmean(in_band, axis=1)
+            metrics[f'ripple_db_{name}'] = np.nanmax(in_band, axis=1) - np.nanmin(in_band, axis=1)
+    return metrics
+
+
+class StreamingMetrics:
+    """
+    Exact max, min, mean and sweep_metrics of one sweep that is read block by block.
+
+    Besides running sums, only the samples the metrics depend on are kept: the first and last
+    samples, the deepest minimum and its neighbours, the two samples around every threshold
+    crossing, the peak and the two samples around the first 3 dB drop after it. sweep_metrics
+    of these samples equals sweep_metrics of the whole sweep, except for the band means and
+    ripples, which come from the running sums. NaN samples are ignored.
+
+    Parameters:
+    - threshold (float): Level in dB defining a resonance band.
+    - bands (list): (low, high) frequency ranges in GHz for the insertion loss and ripple.
+    """
+
+    def __init__(self, threshold=-10.0, bands=()):
+        self.threshold = threshold
+        self.bands = [tuple(band) for band in bands]
+        self.count = 0
+        self.total = 0.0
+        self.minimum = (float('inf'), -1)  # (value, index) of the deepest minimum so far
+        self.maximum = (float('-inf'), -1)  # (value, index) of the peak so far
+        self._kept = {}  # index -> (frequency, value) of the samples kept for sweep_metrics
+        self._last = None  # (index, frequency, value) of the last sample
+        self._after_minimum = False  # Whether the sample after the minimum is still to come
+        self._dropped = False  # Whether the 3 dB drop after the peak was found
+        self._bands = [[0.0, 0, float('inf'), float('-inf')] for _ in self.bands]  # sum, count, min, max
+
+    def update(self, frequency, values):
+        """
+        Adds the next block of samples.
+
+        Parameters:
+        - frequency (ndarray): Ascending frequencies in GHz.
+        - values (ndarray): Values in dB.
+        """
+        import numpy as np
+
+        frequency = np.asarray(frequency, dtype=float)
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        frequency, values = frequency[valid], values[valid]
+        n = len(values)
+        if not n:
+            return
+        for stats, (band_low, band_high) in zip(self._bands, self.bands):
+            in_band = values[(frequency >= band_low) & (frequency <= band_high)]
+            if len(in_band):
+                stats[0] += float(in_band.sum())
+                stats[1] += len(in_band)
+                stats[2] = min(stats[2], float(in_band.min()))
+                stats[3] = max(stats[3], float(in_band.max()))
+        self.total += float(values.sum())
+
+        # Prepend the last sample of the previous block, so crossings between blocks are seen
+        index = np.arange(self.count, self.count + n)
+        self.count += n
+        if self._last is not None:
+            last_index, last_frequency, last_value = self._last
+            index = np.concatenate([[last_index], index])
+            frequency = np.concatenate([[last_frequency], frequency])
+            values = np.concatenate([[last_value], values])
+        first_new = len(values) - n
+        keep = np.zeros(len(values), dtype=bool)
+        keep[0] = True  # First sample of the sweep, or already kept
+
+        below = values < self.threshold
+        crossing = below[1:] != below[:-1]
+        keep[1:] |= crossing
+        keep[:-1] |= crossing
+
+        if self._after_minimum:
+            keep[first_new] = True
+            self._after_minimum = False
+        k = int(values.argmin())
+        if values[k] < self.minimum[0]:
+            self.minimum = (float(values[k]), int(index[k]))
+            keep[max(k - 1, 0):k + 2] = True
+            self._after_minimum = k == len(values) - 1
+
+        p = int(values.argmax())
+        start = first_new
+        if values[p] > self.maximum[0]:
+            self.maximum = (float(values[p]), int(index[p]))
+            keep[p] = True
+            start, self._dropped = p + 1, False
+        if not self._dropped:
+            dropped = np.flatnonzero(values[start:] < self.maximum[0] - 3.0)
+            if len(dropped):
+                first = start + int(dropped[0])
+                keep[first - 1:first + 1] = True
+                self._dropped = True
+
+        for i in np.flatnonzero(keep):
+            self._kept[int(index[i])] = (float(frequency[i]), float(values[i]))
+        self._last = (int(index[-1]), float(frequency[-1]), float(values[-1]))
+
+    def result(self):
+        """
+        Returns the statistics of the samples added so far.
+
+        Returns:
+        - metrics (dict): 'max', 'min', 'mean' and the metrics of sweep_metrics, as floats
+          (NaN if no sample was added).
+        """
+        import numpy as np
+
+        if self._last is None:
+            return {'max': np.nan, 'min': np.nan, 'mean': np.nan,
+                    **{name: column[0] for name, column in sweep_metrics([[np.nan]], [[np.nan]], self.threshold,
+                                                                         self.bands).items()}}
+        kept = dict(self._kept)
+        kept[self._last[0]] = self._last[1:]
+        frequency, values = np.array([kept[i] for i in sorted(kept)]).T
+        metrics = {name: float(column[0]) for name, column in
+                   sweep_metrics(frequency[None, :], values[None, :], self.threshold, self.bands).items()}
+        for (total, count, low, high), (band_low, band_high) in zip(self._bands, self.bands):
+            name = f'{band_low:g}-{band_high:g}GHz'
+            metrics[f'insertion_loss_db_{name}'] = -total / count if count else np.nan
+            metrics[f'ripple_db_{name}'] = high - low if count else np.nan
+        return {'max': self.maximum[0], 'min': self.minimum[0], 'mean': self.total / self.count, **metrics}
+
+
+# Function to tabulate the figures of merit of the consolidated data
+def figures_of_merit(consolidated_data, params=None, threshold=-10.0, bands=(), exact=None):
+    """
+    Computes the figures of merit of every (param, material, height, try) sweep of a
+    consolidated_data[param][material][height] = [(frequency, values), ...] store.
+
+    Parameters:
+    - consolidated_data (dict): The consolidated store of the HFSS scripts (values in dB).
+    - params (list): Parameters to include (default: all).
+    - threshold (float): Level in dB defining a resonance band.
+    - bands (list): (low, high) frequency ranges in GHz for the insertion loss and ripple.
+    - exact (dict): (param, material, height, try) -> metrics of StreamingMetrics, used instead
+      of the stored values for sweeps that were decimated while reading.
+
+    Returns:
+    - table (DataFrame): One row per sweep with the columns param, material, height, try
+      and the metrics of sweep_metrics.
+    """
+    import pandas as pd
+
+    frames = []
+    for param in params or list(consolidated_data):
+        keys, frequency_rows, value_rows = [], [], []
+        for material, height_data in consolidated_data.get(param, {}).items():
+            for height, data_list in sorted(height_data.items()):
+                for try_index, (frequency, values) in enumerate(data_list):
+                    keys.append((param, material, height, try_index + 1))
+                    frequency_rows.append(frequency)
+                    value_rows.append(values)
+        if not keys:
+            continue
+        metrics = sweep_metrics(stack_rows(frequency_rows), stack_rows(value_rows), threshold, bands)
+        for row, key in enumerate(keys):
+            for name, value in (exact or {}).get(key, {}).items():
+                if name in metrics:
+                    metrics[name][row] = value
+        frame = pd.DataFrame(keys, columns=['param', 'material', 'height', 'try'])
+        frames.append(frame.assign(**metrics))
+    if not frames:
+        return pd.DataFrame(columns=['param', 'material', 'height', 'try'] + METRIC_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
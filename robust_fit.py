@@ -0,0 +1,195 @@
+# Robust straight-line fits of many cutlines at once.
+#
+# Every method works on arrays of shape (lines, points), so a whole measurement campaign
+# (e.g. every row of every ODMR field map) is fitted in one call:
+#   - 'ols': ordinary least squares, from the weighted sums of x, y, x^2 and xy.
+#   - 'huber' / 'tukey': iteratively reweighted least squares starting from OLS. Every
+#     iteration is one pass of weighted sums plus a median for the scale (MAD of the
+#     residuals), so a robust fit costs a few OLS fits. Huber down-weights large residuals,
+#     Tukey's biweight rejects them entirely (it starts from the Huber fit).
+#   - 'ransac': lines through random pairs of points, scored by their number of inliers;
+#     the best line of every cutline is refitted by OLS on its inliers.
+# NaN values are ignored. numpy is imported inside the functions (see check_startup_time.py).
+
+from dataclasses import dataclass
+
+# Tuning constants giving 95% efficiency on Gaussian noise
+HUBER_C = 1.345
+TUKEY_C = 4.685
+
+# Scale factor making the median absolute deviation a standard deviation estimate for Gaussian noise
+MAD_SCALE = 1.4826
+
+ROBUST_METHODS = ('ols', 'huber', 'tukey', 'ransac')
+
+
+@dataclass
+class LineFit:
+    """
+    Straight-line fits of a stack of cutlines.
+
+    Attributes:
+    - slope (ndarray): Slope of every line.
+    - intercept (ndarray): Intercept of every line.
+    - weights (ndarray): Final weight of every point, shape (lines, points); 0 for rejected points.
+    - scale (ndarray): Robust standard deviation of the residuals of every line.
+    - iterations (int): Number of reweighting iterations (RANSAC: number of trial lines).
+    """
+    slope: object
+    intercept: object
+    weights: object
+    scale: object
+    iterations: int = 0
+
+    def predict(self, x):
+        import numpy as np
+        return self.slope[..., None] * np.asarray(x) + self.intercept[..., None]
+
+    @property
+    def outliers(self):
+        # Number of points with less than half the weight of a clean point, per line
+        return (self.weights < 0.5).sum(axis=-1)
+
+
+def _weighted_line(x, y, w):
+    """
+    Weighted least-squares line of every row, from its weighted sums.
+    """
+    import numpy as np
+
+    sw = w.sum(axis=-1)
+    mean_x = (w * x).sum(axis=-1) / sw
+    mean_y = (w * y).sum(axis=-1) / sw
+    dx = x - mean_x[..., None]
+    sxx = (w * dx * dx).sum(axis=-1)
+    sxy = (w * dx * (y - mean_y[..., None])).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+    return slope, mean_y - slope * mean_x
+
+
+def _mad_scale(residual, valid):
+    """
+    Robust standard deviation of the residuals of every row (valid points only).
+    """
+    import numpy as np
+
+    if valid.all():
+        scale = MAD_SCALE * np.median(np.abs(residual), axis=-1)
+    else:
+        scale = MAD_SCALE * np.nanmedian(np.where(valid, np.abs(residual), np.nan), axis=-1)
+    return np.where(scale > 0, scale, np.finfo(float).eps)
+
+
+def _irls_weights(u, method, c):
+    import numpy as np
+
+    u = np.abs(u)
+    if method == 'huber':
+        return np.where(u <= c, 1.0, c / np.maximum(u, c))
+    return np.where(u < c, (1 - (u / c) ** 2) ** 2, 0.0)  # Tukey's biweight
+
+
+# Function to fit straight lines robustly to many cutlines at once
+def robust_line_fit(x, y, method='huber', c=None, max_iterations=50, tolerance=1e-4,
+                    trials=200, threshold=None, seed=0):
+    """
+    Fits y = slope * x + intercept to every cutline of a stack.
+
+    Parameters:
+    - x (ndarray): Positions, shape (points,) shared by all lines or (lines, points).
+    - y (ndarray): Values, shape (points,) or (lines, points); NaN values are ignored.
+    - method (str): 'ols', 'huber', 'tukey' or 'ransac'.
+    - c (float): Tuning constant in units of the residual scale (default: HUBER_C or TUKEY_C;
+      for RANSAC, inliers lie within c scales, default 2.5).
+    - max_iterations (int): Maximum number of reweighting iterations.
+    - tolerance (float): Stop when no fitted line moves by more than this many residual scales.
+    - trials (int): Number of random point pairs tried by RANSAC.
+    - threshold (float): Absolute inlier distance of RANSAC (default: c times the MAD scale of each line).
+    - seed (int): Seed of the RANSAC point pairs.
+
+    Returns:
+    - fit (LineFit): Slopes and intercepts of shape (lines,), or scalars for a single line.
+
+    Raises:
+    - ValueError: If the method is unknown.
+    """
+    import numpy as np
+
+    if method not in ROBUST_METHODS:
+        raise ValueError(f"Unknown fit method '{method}'; choose one of {', '.join(ROBUST_METHODS)}.")
+    single = np.ndim(y) == 1
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+    w = valid.astype(float)
+
+    slope, intercept = _weighted_line(x, y, w)
+    scale = _mad_scale(y - (slope[:, None] * x + intercept[:, None]), valid)
+    iterations = 0
+    if method == 'ransac':
+        slope, intercept, w, scale = _ransac(x, y, valid, slope, intercept, scale, c or 2.5, trials, threshold, seed)
+        iterations = trials
+    elif method in ('huber', 'tukey'):
+        span = np.ptp(x, axis=-1)
+        stages = [('huber', HUBER_C if method == 'tukey' else (c or HUBER_C))]
+        if method == 'tukey':
+            stages.append(('tukey', c or TUKEY_C))  # The biweight needs a good start: refine the Huber fit
+        for weighting, constant in stages:
+            for _ in range(max_iterations):
+                residual = y - (slope[:, None] * x + intercept[:, None])
+                scale = _mad_scale(residual, valid)
+                w = _irls_weights(residual / scale[:, None], weighting, constant) * valid
+                new_slope, new_intercept = _weighted_line(x, y, w)
+                # Largest change of the fitted line over the x range, in units of the residual scale
+                change = np.abs(new_slope - slope) * span + np.abs(new_intercept - intercept)
+                slope, intercept = new_slope, new_intercept
+                iterations += 1
+                if np.all(change <= tolerance * scale):
+                    break
+
+    if single:
+        return LineFit(slope[0], intercept[0], w[0], scale[0], iterations)
+    return LineFit(slope, intercept, w, scale, iterations)
+
+
+def _ransac(x, y, valid, slope, intercept, scale, c, trials, threshold, seed):
+    """
+    RANSAC of every line: trial lines through random pairs of valid points, the one with
+    the most inliers refitted by OLS on them. Trials are evaluated in blocks to bound memory.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    lines, points = y.shape
+    limit = np.full(lines, threshold, dtype=float) if threshold is not None else c * scale
+    best_count = np.full(lines, -1)
+    best_slope, best_intercept = slope.copy(), intercept.copy()
+    rows = np.arange(lines)[:, None]
+    # Random pairs among the valid points of every line: the valid indices come first in order
+    order = np.argsort(~valid, axis=-1, kind='stable')
+    count = valid.sum(axis=-1)
+    block = max(1, 4_000_000 // max(lines * points, 1))
+    for start in range(0, trials, block):
+        n = min(block, trials - start)
+        draw = (rng.random((lines, n, 2)) * count[:, None, None]).astype(int)
+        pair = order[rows[..., None], draw]  # (lines, n, 2); a pair of one point twice is discarded below
+        x1, x2 = x[rows, pair[..., 0]], x[rows, pair[..., 1]]
+        y1, y2 = y[rows, pair[..., 0]], y[rows, pair[..., 1]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            trial_slope = np.where(x1 != x2, (y2 - y1) / (x2 - x1), np.nan)
+        trial_intercept = y1 - trial_slope * x1
+        residual = np.abs(y[:, None, :] - (trial_slope[..., None] * x[:, None, :] + trial_intercept[..., None]))
+        inliers = ((residual <= limit[:, None, None]) & valid[:, None, :]).sum(axis=-1)
+        inliers[np.isnan(trial_slope)] = -1
+        k = np.argmax(inliers, axis=1)
+        better = inliers[np.arange(lines), k] > best_count
+        best_count = np.where(better, inliers[np.arange(lines), k], best_count)
+        best_slope = np.where(better, trial_slope[np.arange(lines), k], best_slope)
+        best_intercept = np.where(better, trial_intercept[np.arange(lines), k], best_intercept)
+
+    inliers = (np.abs(y - (best_slope[:, None] * x + best_intercept[:, None])) <= limit[:, None]) & valid
+    w = inliers.astype(float)
+    slope, intercept = _weighted_line(x, y, w)
+    return slope, intercept, w, _mad_scale(y - (slope[:, None] * x + intercept[:, None]), inliers)
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+from collections import Counter
+
+from memory_budget import MemoryBudget, parse_size
+
+# Per-stage timing for the analysis scripts. Every script wraps its work in
+# profiler.stage('discover' | 'read' | 'parse' | 'fit' | 'consolidate' | 'render' | 'write')
+# and writes a JSON report plus a one-line summary at the end of the run.
+# Every stage also records how much it raised the peak resident memory and, with
+# --trace-memory, the peak of the Python allocations made inside it (tracemalloc).
+# With --memory-budget, the resident memory is checked against the budget (see memory_budget.py).
+
+STAGES = ['discover', 'read', 'parse', 'fit', 'consolidate', 'render', 'write']
+
+
+# Function to read the peak resident memory of this process
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of the current process.
+
+    Returns:
+    - peak (int): Peak RSS in bytes, or None if it cannot be determined on this platform.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+class SamplingProfiler:
+    """
+    Minimal sampling profiler: a background thread records the innermost frame of
+    the profiled thread at a fixed interval.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self.samples[f"{os.path.basename(code.co_filename)}:{frame.f_lineno} ({code.co_name})"] += 1
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def print_stats(self, limit=15):
+        total = sum(self.samples.values()) or 1
+        for location, count in self.samples.most_common(limit):
+            print(f"{100.0 * count / total:6.1f}%  {location}")
+
+
+class StageProfiler:
+    """
+    Collects wall time, CPU time, bytes read and peak memory for every stage of a run.
+
+    Parameters:
+    - name (str): Name of the run, usually the script name.
+    - profile_stage (str): Stage to run under a profiler, or None.
+    - profiler (str): 'cprofile' or 'sample'.
+    - trace_memory (bool): Record the peak of the Python allocations of every stage with tracemalloc
+      (slows the run down).
+    - memory_budget (int): Memory budget in bytes, or None for no budget.
+    """
+
+    def __init__(self, name, profile_stage=None, profiler='cprofile', trace_memory=False, memory_budget=None):
+        self.name = name
+        self.profile_stage = profile_stage
+        self.profiler_kind = profiler
+        self.stages = {}
+        self.files = {}
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self._profiler = None
+        self._profiling = False
+        self._nested = []
+        self.trace_memory = trace_memory
+        self._traces = []  # [traced memory at entry, highest traced peak so far] of the open stages
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.budget = MemoryBudget(memory_budget) if memory_budget else None
+        self.fallbacks = []  # (file, low-memory mode) of every fallback
+
+    def _make_profiler(self):
+        if self.profiler_kind == 'sample':
+            return SamplingProfiler()
+        import cProfile
+        return cProfile.Profile()
+
+    @contextlib.contextmanager
+    def stage(self, name, file=None):
+        """
+        Times the enclosed block as one occurrence of a stage, optionally attributed to a file.
+        Stages may be nested (e.g. 'write' inside 'render'); the time of a nested stage is
+        only counted for the inner stage.
+
+        Parameters:
+        - name (str): Name of the stage.
+        - file (str): Path of the file being processed, or None for run-wide work.
+        """
+        profiling = name == self.profile_stage and not self._profiling
+        if profiling:
+            if self._profiler is None:
+                self._profiler = self._make_profiler()
+            self._profiler.enable()
+            self._profiling = True
+        self._nested.append([0.0, 0.0, 0])
+        if self.trace_memory:
+            self._begin_trace()
+        peak = peak_rss_bytes() or 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            growth = (peak_rss_bytes() or 0) - peak
+            traced = self._end_trace() if self.trace_memory else None
+            if profiling:
+                self._profiler.disable()
+                self._profiling = False
+            nested_wall, nested_cpu, nested_growth = self._nested.pop()
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+                self._nested[-1][2] += growth
+            wall, cpu, growth = wall - nested_wall, cpu - nested_cpu, growth - nested_growth
+            self._record(self.stages, name, wall, cpu, growth, traced)
+            if file is not None:
+                self._record(self.files.setdefault(file, {}), name, wall, cpu, growth, traced)
+            if self.budget is not None:
+                self.budget.check(f"stage '{name}'" + (f" of {os.path.basename(file)}" if file else ''))
+
+    def _begin_trace(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._traces:
+            self._traces[-1][1] = max(self._traces[-1][1], peak)  # Keep the enclosing stage's peak before resetting it
+        tracemalloc.reset_peak()
+        self._traces.append([current, current])
+
+    def _end_trace(self):
+        start, highest = self._traces.pop()
+        peak = max(highest, tracemalloc.get_traced_memory()[1])
+        if self._traces:
+            self._traces[-1][1] = max(self._traces[-1][1], peak)
+        tracemalloc.reset_peak()
+        return peak - start
+
+    @staticmethod
+    def _entry(table, name):
+        return table.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0, 'bytes_read': 0,
+                                       'peak_rss_bytes': None, 'rss_growth_bytes': 0, 'traced_peak_bytes': None})
+
+    def _record(self, table, name, wall, cpu, growth=0, traced=None):
+        entry = self._entry(table, name)
+        entry['wall_s'] += wall
+        entry['cpu_s'] += cpu
+        entry['calls'] += 1
+        entry['peak_rss_bytes'] = peak_rss_bytes()
+        entry['rss_growth_bytes'] += growth  # How much this stage raised the peak resident memory
+        if traced is not None:
+            entry['traced_peak_bytes'] = max(entry['traced_peak_bytes'] or 0, traced)
+
+    def track(self, name, obj):
+        """
+        Registers a structure that holds the data of the run, so the budget warning can name
+        the largest one (no-op without a memory budget).
+        """
+        if self.budget is not None:
+            self.budget.track(name, obj)
+
+    def memory_pressure(self, context=None):
+        """
+        Tells whether the run is close to its memory budget, in which case ingestion should
+        switch to its low-memory mode (and report it with record_fallback).
+
+        Parameters:
+        - context (str): What is about to run, for the warning.
+
+        Returns:
+        - pressure (bool): False without a memory budget.
+        """
+        return self.budget is not None and self.budget.check(context)
+
+    def record_fallback(self, file, mode):
+        """
+        Records that a file was ingested in a low-memory mode (e.g. 'streamed'); the pipeline
+        does not cache outputs computed while a fallback was recorded.
+        """
+        self.fallbacks.append((file, mode))
+
+    def add_bytes(self, n_bytes, file=None, stage='read'):
+        """
+        Adds bytes read from disk to a stage (and to the file, if given).
+        """
+        self._entry(self.stages, stage)['bytes_read'] += n_bytes
+        if file is not None:
+            self._entry(self.files.setdefault(file, {}), stage)['bytes_read'] += n_bytes
+
+    def read_bytes(self, path):
+        """
+        Reads a whole file inside the 'read' stage and accounts for its size.
+
+        Parameters:
+        - path (str): Path of the file.
+
+        Returns:
+        - raw (bytes): The file contents.
+        """
+        with self.stage('read', file=path):
+            with open(path, 'rb') as f:
+                raw = f.read()
+        self.add_bytes(len(raw), file=path)
+        return raw
+
+    def report(self):
+        """
+        Builds the run report.
+
+        Returns:
+        - report (dict): Aggregate and per-file timings of every stage.
+        """
+        ordered = sorted(self.stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+        return {
+            'run': self.name,
+            'wall_s': time.perf_counter() - self.start_wall,
+            'cpu_s': time.process_time() - self.start_cpu,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'bytes_read': sum(entry['bytes_read'] for entry in self.stages.values()),
+            'memory_budget_bytes': self.budget.limit if self.budget is not None else None,
+            'memory_fallbacks': [{'file': file, 'mode': mode} for file, mode in self.fallbacks],
+            'stages': {name: self.stages[name] for name in ordered},
+            'files': self.files,
+        }
+
+    def summary_line(self):
+        """
+        Returns a one-line summary of the run, e.g. 'diamond: 3.21s | read 0.10s | fit 0.40s | ...'.
+        """
+        report = self.report()
+        parts = [f"{self.name}: {report['wall_s']:.2f}s wall, {report['cpu_s']:.2f}s CPU"]
+        parts += [f"{name} {entry['wall_s']:.2f}s" for name, entry in report['stages'].items()]
+        parts.append(f"{len(self.files)} files, {report['bytes_read'] / 1e6:.1f} MB read")
+        if report['peak_rss_bytes'] is not None:
+            growth = {name: entry['rss_growth_bytes'] for name, entry in report['stages'].items()}
+            largest = max(growth, key=growth.get) if growth and max(growth.values()) > 0 else None
+            parts.append(f"peak RSS {report['peak_rss_bytes'] / 1e6:.0f} MB" + (f" (mostly {largest})" if largest else ''))
+        if self.trace_memory:
+            traced = {name: entry['traced_peak_bytes'] or 0 for name, entry in report['stages'].items()}
+            if traced:
+                largest = max(traced, key=traced.get)
+                parts.append(f"largest allocation peak {largest} {traced[largest] / 1e6:.0f} MB")
+        if self.budget is not None:
+            parts.append(f"budget {self.budget.limit / 1e9:.2f} GB, {len({file for file, _ in self.fallbacks})} files in low-memory mode")
+        return ' | '.join(parts)
+
+    def finish(self, report_path=None):
+        """
+        Writes the JSON report, prints the profiler output for the profiled stage and the summary line.
+
+        Parameters:
+        - report_path (str): Where to write the JSON report, or None to skip it.
+        """
+        if report_path:
+            with open(report_path, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+            print(f"Run report saved: {report_path}")
+        if self._profiler is not None:
+            print(f"Profile of stage '{self.profile_stage}':")
+            if self.profiler_kind == 'sample':
+                self._profiler.print_stats()
+            else:
+                import pstats
+                pstats.Stats(self._profiler).sort_stats('cumulative').print_stats(15)
+        print(self.summary_line())
+
+
+# Function to add the profiling options to a script's argument parser
+def add_profiler_arguments(parser):
+    """
+    Adds --report, --profile-stage, --profiler, --trace-memory and --memory-budget to an argparse parser.
+    """
+    parser.add_argument('--report', help='Path of the JSON run report (default: run_report.json in the plot folder)')
+    parser.add_argument('--profile-stage', choices=STAGES, help='Run this stage under a profiler')
+    parser.add_argument('--profiler', choices=['cprofile', 'sample'], default='cprofile', help='Profiler used for --profile-stage')
+    parser.add_argument('--trace-memory', action='store_true', help='Record the peak Python allocations of every stage (slower)')
+    parser.add_argument('--memory-budget', type=parse_size, help='Memory budget, e.g. 8G; ingestion streams and compacts the '
+                                                                 'exports when it is approached')
@@ -0,0 +1,308 @@
+import os
+import argparse
+
+# numpy, pandas and h5py are imported inside the functions that use them
+# so that the script starts quickly (see check_startup_time.py)
+
+# Dataset sizes used by benchmarks.py; every value can be overridden on the command line
+SCALES = {
+    'small': {'comsol_files': 8, 'comsol_points': 500, 'materials': 2, 'tries': 2, 'heights': 3,
+              'freq_points': 401, 'odmr_shape': (60, 80)},
+    'medium': {'comsol_files': 40, 'comsol_points': 5000, 'materials': 4, 'tries': 3, 'heights': 6,
+               'freq_points': 2001, 'odmr_shape': (200, 300)},
+    'large': {'comsol_files': 160, 'comsol_points': 50000, 'materials': 6, 'tries': 4, 'heights': 12,
+              'freq_points': 10001, 'odmr_shape': (600, 800)},
+}
+
+MATERIALS = ['Ti-Au', 'Cr-Au', 'Ti-Pt', 'Cr-Cu', 'Ti-Cu', 'Nb-Au', 'Ta-Au', 'Mo-Au']
+
+# HFSS report column names, as exported by the "Terminal S Parameter" and "Terminal Z Parameter" reports
+S_COLUMNS = {(1, 1): 'dB(St(1,1)) []', (1, 2): 'dB(St(1,2)) []', (2, 1): 'dB(St(2,1)) []', (2, 2): 'dB(St(2,2)) []'}
+Z_COLUMNS = {(1, 1): 're(Zt(1,1)) []', (1, 2): 're(Zt(1,2)) []', (2, 1): 're(Zt(2,1)) []', (2, 2): 're(Zt(2,2)) []'}
+
+# Number of header lines in the COMSOL exports read by each analysis script
+COMSOL_HEADER_LINES = {'diamond': 1, 'glass': 8}
+
+
+# ---------------------------- COMSOL Exports ---------------------------- #
+
+def comsol_header(n_lines, n_points):
+    """
+    Builds a COMSOL-style text export header of the given length.
+
+    Parameters:
+    - n_lines (int): Number of header lines (1 for the diamond exports, 8 for the glass exports).
+    - n_points (int): Number of data rows that follow the header.
+
+    Returns:
+    - header (str): The header lines, each starting with '%'.
+    """
+    lines = [
+        '% Model:              synthetic.mph',
+        '% Version:            COMSOL 6.1.0.252',
+        '% Date:               Jan 1 2024, 00:00',
+        '% Dimension:          3',
+        f'% Nodes:              {n_points}',
+        '% Expressions:        1',
+        '% Description:        Magnetic flux density gradient, z component',
+        '% x                       y                        Bz (G)',
+    ]
+    return '\n'.join(lines[-n_lines:]) + '\n'
+
+
+def write_comsol_exports(folder, n_files=8, n_points=500, header_lines=1, seed=0):
+    """
+    Writes COMSOL cutline exports named after their current density, half of them negative.
+
+    Parameters:
+    - folder (str): The directory where the .txt files are written.
+    - n_files (int): Number of exports to write.
+    - n_points (int): Number of rows per export.
+    - header_lines (int): Number of '%' header lines per export.
+    - seed (int): Seed of the random number generator.
+
+    Returns:
+    - paths (list): Paths of the written files.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    x = np.linspace(-15.0, 15.0, n_points)
+    paths = []
+    for i in range(n_files):
+        magnitude = (i // 2 + 1) * 1e10
+        current = -magnitude if i % 2 else magnitude
+        gradient = 2.5 * current / 1e10
+        # Linear gradient with a weak cubic bend and solver noise
+        field = gradient * x + 1e-3 * gradient * x ** 3 + rng.normal(0.0, 0.05 * abs(gradient), n_points)
+        data = np.column_stack([x, np.zeros(n_points), field])
+
+        path = os.path.join(folder, f'{current:.0e}'.replace('+', '') + '.txt')
+        with open(path, 'w') as f:
+            f.write(comsol_header(header_lines, n_points))
+            np.savetxt(f, data, fmt='%.10g')
+        paths.append(path)
+    return paths
+
+
+# ---------------------------- HFSS Exports ---------------------------- #
+
+def transmission_line_s(freq_hz, z_line, length, loss, z_ref=50.0):
+    """
+    Computes the S matrix of a lossy transmission line between two reference ports.
+
+    Parameters:
+    - freq_hz (ndarray): Frequency axis in Hz.
+    - z_line (float): Characteristic impedance of the line in Ohm.
+    - length (float): Electrical length in m (phase velocity of c/2).
+    - loss (float): Attenuation in Np/m at 1 GHz, scaled with sqrt(f).
+    - z_ref (float): Port reference impedance in Ohm.
+
+    Returns:
+    - s (ndarray): Complex array of shape (n_freq, 2, 2).
+    """
+    import numpy as np
+
+    beta = 2 * np.pi * freq_hz / 1.5e8
+    alpha = loss * np.sqrt(freq_hz / 1e9)
+    gl = (alpha + 1j * beta) * length
+    a, d = np.cosh(gl), np.cosh(gl)
+    b, c = z_line * np.sinh(gl), np.sinh(gl) / z_line
+    denom = a + b / z_ref + c * z_ref + d
+    s = np.empty((len(freq_hz), 2, 2), dtype=complex)
+    s[:, 0, 0] = (a + b / z_ref - c * z_ref - d) / denom
+    s[:, 0, 1] = 2 * (a * d - b * c) / denom
+    s[:, 1, 0] = 2 / denom
+    s[:, 1, 1] = (-a + b / z_ref - c * z_ref + d) / denom
+    return s
+
+
+def synthetic_sweep(material_index, height, freq_hz, rng):
+    """
+    Builds the S matrix of one material/height combination with a little run-to-run noise.
+
+    Parameters:
+    - material_index (int): Index of the material, shifts the line impedance and loss.
+    - height (int): Metal height in nm, lowers the impedance and the loss.
+    - freq_hz (ndarray): Frequency axis in Hz.
+    - rng (Generator): NumPy random number generator.
+
+    Returns:
+    - s (ndarray): Complex array of shape (n_freq, 2, 2).
+    """
+    z_line = 35.0 + 6.0 * material_index + 4000.0 / height + rng.normal(0.0, 0.3)
+    loss = (0.8 + 0.2 * material_index) * 200.0 / height
+    return transmission_line_s(freq_hz, z_line, length=0.02, loss=loss)
+
+
+def write_hfss_tree(root, materials=2, tries=2, heights=3, freq_points=401,
+                    freq_range_mhz=(1000.0, 20000.0), z_export=True, seed=0, report_format='csv'):
+    """
+    Writes HFSS exports laid out as <material>/<try>/<height>nm/*.csv (or *.s2p).
+
+    Parameters:
+    - root (str): The directory where the tree is written.
+    - materials (int): Number of materials.
+    - tries (int): Number of simulation tries per material.
+    - heights (int): Number of heights per try, 200 nm apart.
+    - freq_points (int): Number of frequency points per sweep.
+    - freq_range_mhz (tuple): First and last frequency in MHz.
+    - z_export (bool): Whether a Z-parameter report is written next to every S-parameter report.
+    - seed (int): Seed of the random number generator.
+    - report_format (str): 'csv' for HFSS CSV reports, 'touchstone' for one .s2p file per sweep.
+
+    Returns:
+    - paths (list): Paths of the written files.
+    """
+    import numpy as np
+    import pandas as pd
+    from touchstone import Network, write_touchstone
+    from network_params import s_to_z
+
+    rng = np.random.default_rng(seed)
+    freq_mhz = np.linspace(freq_range_mhz[0], freq_range_mhz[1], freq_points)
+    paths = []
+    for m in range(materials):
+        material = MATERIALS[m % len(MATERIALS)] + ('' if m < len(MATERIALS) else f'-{m}')
+        for t in range(tries):
+            for h in range(heights):
+                height = 200 * (h + 1)
+                folder = os.path.join(root, material, f'try{t + 1}', f'{height}nm')
+                os.makedirs(folder, exist_ok=True)
+                s = synthetic_sweep(m, height, freq_mhz * 1e6, rng)
+
+                if report_format == 'touchstone':
+                    path = os.path.join(folder, 'S Parameter Plot 1.s2p')
+                    write_touchstone(path, Network(freq_mhz * 1e6, s), fmt='MA', unit='MHZ')
+                    paths.append(path)
+                    continue
+
+                columns = {'Freq [MHz]': freq_mhz}
+                for (i, j), name in S_COLUMNS.items():
+                    columns[name] = 20 * np.log10(np.abs(s[:, i - 1, j - 1]))
+                path = os.path.join(folder, 'S Parameter Plot 1.csv')
+                pd.DataFrame(columns).to_csv(path, index=False)
+                paths.append(path)
+
+                if z_export:
+                    z = s_to_z(s, 50.0)
+                    columns = {'Freq [MHz]': freq_mhz}
+                    for (i, j), name in Z_COLUMNS.items():
+                        columns[name] = z[:, i - 1, j - 1].real
+                    path = os.path.join(folder, 'Z Parameter Plot 1.csv')
+                    pd.DataFrame(columns).to_csv(path, index=False)
+                    paths.append(path)
+    return paths
+
+
+# ---------------------------- ODMR Measurements ---------------------------- #
+
+def write_odmr_set(base_folder, shape=(60, 80), currents=('40mA',), spike_fraction=0.002, seed=0):
+    """
+    Writes ODMR fit results (data/fit_param) for the background and signal measurements of each current.
+
+    Parameters:
+    - base_folder (str): The measurement folder; every measurement gets <name>/<name>.hdf5 inside it.
+    - shape (tuple): Number of pixel rows and columns of the fit maps.
+    - currents (tuple): Current labels, e.g. ('20mA', '40mA').
+    - spike_fraction (float): Fraction of pixels replaced by fit-failure spikes.
+    - seed (int): Seed of the random number generator.
+
+    Returns:
+    - filenames (dict): Current label -> measurement names, as expected by AverageCutlineProcessing.
+    """
+    import numpy as np
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    x = np.linspace(-1.0, 1.0, cols)
+    base_map = 2.87e9 + 1e5 * rng.normal(size=shape)
+
+    def write(name, fit_param):
+        folder = os.path.join(base_folder, name)
+        os.makedirs(folder, exist_ok=True)
+        spikes = rng.random(shape) < spike_fraction
+        fit_param = np.where(spikes, fit_param + rng.normal(0.0, 5e6, shape), fit_param)
+        with h5py.File(os.path.join(folder, f'{name}.hdf5'), 'w') as f:
+            f.create_dataset('data/fit_param', data=fit_param)
+
+    filenames = {}
+    for k, current in enumerate(currents):
+        amplitude = 28e3 * 40.0 * (k + 1)
+        gradient = amplitude * x[None, :] * np.ones((rows, 1))
+        names = {
+            'background_right': f'{k:02d}_ODMR_fitted_bg_right',
+            'background_left': f'{k:02d}_ODMR_fitted_bg_left',
+            'signal_right': f'{k:02d}_ODMR_fitted_ro{current}',
+            'signal_left': f'{k:02d}_ODMR_fitted_lo{current}',
+        }
+        write(names['background_right'], base_map + 2e4 * rng.normal(size=shape))
+        write(names['background_left'], base_map + 2e4 * rng.normal(size=shape))
+        write(names['signal_right'], base_map + gradient / 2 + 2e4 * rng.normal(size=shape))
+        write(names['signal_left'], base_map - gradient / 2 + 2e4 * rng.normal(size=shape))
+        filenames[current] = names
+    return filenames
+
+
+# ---------------------------- Main Function ---------------------------- #
+
+def generate(output, scale='small', seed=0, hfss_format='csv', **overrides):
+    """
+    Writes a complete synthetic dataset for every analysis script.
+
+    Parameters:
+    - output (str): The directory where the dataset is written.
+    - scale (str): One of the SCALES presets.
+    - seed (int): Seed of the random number generators.
+    - hfss_format (str): 'csv' or 'touchstone' HFSS exports.
+    - overrides: Values that replace the preset, e.g. freq_points=1001.
+
+    Returns:
+    - layout (dict): Paths of the COMSOL, HFSS and ODMR parts of the dataset and the ODMR filenames.
+    """
+    settings = dict(SCALES[scale])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+
+    layout = {
+        'comsol_diamond': os.path.join(output, 'comsol', 'diamond'),
+        'comsol_glass': os.path.join(output, 'comsol', 'glass slides'),
+        'hfss': os.path.join(output, 'hfss'),
+        'odmr': os.path.join(output, 'odmr'),
+    }
+    for name, header_lines in COMSOL_HEADER_LINES.items():
+        write_comsol_exports(layout[f'comsol_{name}'], settings['comsol_files'], settings['comsol_points'],
+                             header_lines=header_lines, seed=seed)
+    write_hfss_tree(layout['hfss'], settings['materials'], settings['tries'], settings['heights'],
+                    settings['freq_points'], seed=seed, report_format=hfss_format)
+    layout['odmr_filenames'] = write_odmr_set(layout['odmr'], tuple(settings['odmr_shape']), seed=seed)
+    return layout
+
+
+def main():
+    """
+    Main function to execute the script.
+    """
+    parser = argparse.ArgumentParser(description='Write synthetic COMSOL, HFSS and ODMR datasets.')
+    parser.add_argument('output', help='Directory where the dataset is written')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Dataset size preset')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random number generators')
+    parser.add_argument('--comsol-files', type=int, help='Number of COMSOL exports per substrate')
+    parser.add_argument('--comsol-points', type=int, help='Number of rows per COMSOL export')
+    parser.add_argument('--materials', type=int, help='Number of HFSS materials')
+    parser.add_argument('--tries', type=int, help='Number of HFSS tries per material')
+    parser.add_argument('--heights', type=int, help='Number of HFSS heights per try')
+    parser.add_argument('--freq-points', type=int, help='Number of frequency points per HFSS sweep')
+    parser.add_argument('--hfss-format', choices=['csv', 'touchstone'], default='csv', help='Format of the HFSS exports')
+    args = parser.parse_args()
+
+    layout = generate(args.output, args.scale, args.seed, args.hfss_format, comsol_files=args.comsol_files,
+                      comsol_points=args.comsol_points, materials=args.materials, tries=args.tries,
+                      heights=args.heights, freq_points=args.freq_points)
+    for name, path in layout.items():
+        if name != 'odmr_filenames':
+            print(f"{name}: {path}")
+
+if __name__ == '__main__':
+    main()
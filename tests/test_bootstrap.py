@@ -0,0 +1,23 @@
+import numpy as np
+
+from bootstrap import bootstrap_slope, bootstrap_slopes
+
+
+def test_ols_far_from_zero():
+    # Positions of a few nm around 1 mm: sums of x^2 about zero would lose every digit
+    rng = np.random.default_rng(0)
+    x = 1000.0 + np.linspace(0.0, 1e-3, 200)
+    y = 3.0e3 * (x - 1000.0) + 2.0 + rng.normal(0.0, 1e-3, len(x))
+    slope, intercept = np.polyfit(x, y, 1)
+    interval = bootstrap_slope(x, y, replicates=200, seed=1)
+    assert np.isclose(interval.slope, slope, rtol=1e-6)
+    assert np.isclose(interval.intercept, intercept, rtol=1e-6)
+    assert interval.slope_low <= slope <= interval.slope_high
+
+
+def test_seed_independent_of_workers():
+    rng = np.random.default_rng(1)
+    cutlines = [(np.linspace(0, 1, 50), rng.normal(size=50) + k * np.linspace(0, 1, 50)) for k in range(4)]
+    one = bootstrap_slopes(cutlines, replicates=100, seed=3, workers=1)
+    two = bootstrap_slopes(cutlines, replicates=100, seed=3, workers=2)
+    assert one == two
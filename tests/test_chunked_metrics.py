@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hfss_pipeline import build_hfss_pipeline
+from rf_metrics import StreamingMetrics, sweep_metrics
+from synthetic_data import S_COLUMNS, transmission_line_s, write_hfss_tree
+
+BANDS = [(2.0, 5.0), (8.0, 12.0)]
+
+
+def s21_db(points):
+    frequency = np.linspace(1.0, 20.0, points)
+    s = transmission_line_s(frequency * 1e9, z_line=30.0, length=0.02, loss=2.0)
+    return frequency, 20 * np.log10(np.abs(s[:, 0, 0]))
+
+
+@pytest.mark.parametrize('block', [1, 7, 64, 1000])
+def test_streaming_metrics_match_whole_sweep(block):
+    frequency, values = s21_db(1001)
+    reducer = StreamingMetrics(-10.0, BANDS)
+    for start in range(0, len(values), block):
+        reducer.update(frequency[start:start + block], values[start:start + block])
+    streamed = reducer.result()
+    whole = sweep_metrics(frequency[None], values[None], -10.0, BANDS)
+    for name, column in whole.items():
+        assert np.isclose(streamed[name], column[0], equal_nan=True), name
+    assert streamed['max'] == values.max() and streamed['min'] == values.min()
+    assert np.isclose(streamed['mean'], values.mean())
+
+
+def run_tables(directory, plot_folder, **options):
+    os.makedirs(plot_folder)
+    columns = {f'S{i}{j}': name for (i, j), name in S_COLUMNS.items()}
+    pipeline = build_hfss_pipeline(directory, plot_folder, columns, threshold=-10.0, bands=BANDS, **options)
+    pipeline.run(['summary_tables', 'figures_of_merit'])
+    return {name: pd.read_csv(os.path.join(plot_folder, name)) for name in sorted(os.listdir(plot_folder))
+            if name.endswith('.csv')}
+
+
+def test_chunked_reports_match_whole_files(tmp_path):
+    directory = str(tmp_path / 'hfss')
+    write_hfss_tree(directory, materials=2, tries=2, heights=2, freq_points=401, z_export=False)
+    whole = run_tables(directory, str(tmp_path / 'whole'))
+    chunked = run_tables(directory, str(tmp_path / 'chunked'), chunk_rows=37, max_points=50)
+    assert list(chunked) == list(whole)
+    assert 'figures_of_merit.csv' in whole
+    for name, table in whole.items():
+        pd.testing.assert_frame_equal(chunked[name], table, rtol=1e-9, obj=name)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from network_params import convert, renormalize_s, s_to_y, s_to_z, y_to_s, z_to_s
+from synthetic_data import transmission_line_s
+
+
+@pytest.fixture
+def s():
+    return transmission_line_s(np.linspace(1e9, 20e9, 201), z_line=42.0, length=0.02, loss=0.8)
+
+
+def test_s_z_y_round_trips(s):
+    assert np.allclose(z_to_s(s_to_z(s, 50.0), 50.0), s)
+    assert np.allclose(y_to_s(s_to_y(s, 50.0), 50.0), s)
+    assert np.allclose(s_to_y(s, 50.0), np.linalg.inv(s_to_z(s, 50.0)))
+
+
+@pytest.mark.parametrize('target', ['Z', 'Y', 'ABCD'])
+def test_convert_round_trip(s, target):
+    assert np.allclose(convert(convert(s, 'S', target, 50.0), target, 'S', 50.0), s)
+
+
+def test_abcd_of_line(s):
+    # A reciprocal, symmetric line has A = D and AD - BC = 1
+    abcd = convert(s, 'S', 'ABCD')
+    assert np.allclose(abcd[:, 0, 0], abcd[:, 1, 1])
+    assert np.allclose(abcd[:, 0, 0] * abcd[:, 1, 1] - abcd[:, 0, 1] * abcd[:, 1, 0], 1.0)
+
+
+def test_per_port_reference(s):
+    z0 = np.array([50.0, 75.0])
+    assert np.allclose(z_to_s(s_to_z(s, z0), z0), s)
+    assert np.allclose(renormalize_s(renormalize_s(s, 50.0, z0), z0, 50.0), s)
+
+
+def test_four_port_round_trip():
+    rng = np.random.default_rng(0)
+    s = 0.2 * (rng.normal(size=(7, 4, 4)) + 1j * rng.normal(size=(7, 4, 4)))
+    assert np.allclose(convert(convert(s, 'S', 'Z'), 'Z', 'S'), s)
+    assert np.allclose(convert(convert(s, 'S', 'Y'), 'Y', 'S'), s)
+
+
+def test_unknown_parameter(s):
+    with pytest.raises(ValueError):
+        convert(s, 'S', 'H')
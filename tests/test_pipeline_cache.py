@@ -0,0 +1,106 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+from pipeline import Pipeline, PipelineCache, Stage, discover_files, module_fingerprint
+
+STAGES = '''
+from helper import scale
+
+def read_value(item, _item, profiler):
+    with open(item.path) as f:
+        return float(f.read())
+
+def total(values, _items, profiler, factor):
+    return scale(sum(values), factor)
+'''
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """
+    A module of stage functions importing a helper module, and a folder of three inputs.
+    """
+    code = tmp_path / 'code'
+    code.mkdir()
+    (code / 'helper.py').write_text('def scale(value, factor):\n    return value * factor\n')
+    (code / 'stages.py').write_text(STAGES)
+    data = tmp_path / 'data'
+    data.mkdir()
+    for k in range(3):
+        (data / f'{k}.txt').write_text(str(k + 1))
+    monkeypatch.syspath_prepend(str(code))
+    for name in ('stages', 'helper'):
+        sys.modules.pop(name, None)
+    module_fingerprint.cache_clear()
+    yield code, data, tmp_path / 'cache'
+    for name in ('stages', 'helper'):
+        sys.modules.pop(name, None)
+    module_fingerprint.cache_clear()
+
+
+def build(code, data, cache, factor=2):
+    stages = importlib.import_module('stages')
+    return Pipeline('test', lambda: discover_files(str(data), ('.txt',)), [
+        Stage('read', stages.read_value, per_item=True, kind='parse'),
+        Stage('total', stages.total, after='read', kind='fit', factor=factor),
+    ], str(cache))
+
+
+def run(pipeline):
+    value = pipeline.run(['total'])['total']
+    return value, {name: counts['computed'] for name, counts in pipeline.stats.items()}
+
+
+def cache_files(cache):
+    return sorted(os.listdir(cache))
+
+
+def test_unchanged_run_is_cached(project):
+    assert run(build(*project)) == (12.0, {'read': 3, 'total': 1})
+    # The cached total is found without looking up its inputs
+    assert run(build(*project)) == (12.0, {'total': 0})
+
+
+def test_parameter_change_reruns_only_its_stage(project):
+    run(build(*project))
+    assert run(build(*project, factor=3)) == (18.0, {'read': 0, 'total': 1})
+
+
+def test_input_change_reruns_its_item(project):
+    code, data, cache = project
+    run(build(*project))
+    (data / '0.txt').write_text('10')
+    assert run(build(*project)) == (30.0, {'read': 1, 'total': 1})
+
+
+def test_imported_module_change_invalidates(project):
+    code, data, cache = project
+    run(build(*project))
+    (code / 'helper.py').write_text('def scale(value, factor):\n    return value * factor + 1\n')
+    sys.modules.pop('helper', None)
+    sys.modules.pop('stages', None)
+    module_fingerprint.cache_clear()
+    assert run(build(*project)) == (13.0, {'read': 3, 'total': 1})
+
+
+def test_superseded_entries_are_pruned(project):
+    code, data, cache = project
+    run(build(*project))
+    files = cache_files(cache)
+    assert len(files) == 4
+    run(build(*project, factor=3))
+    assert len(cache_files(cache)) == 4
+    assert cache_files(cache) != files
+
+
+def test_namespaces_do_not_prune_each_other(tmp_path):
+    ours, theirs = PipelineCache(str(tmp_path), 'ours'), PipelineCache(str(tmp_path), 'theirs')
+    ours.put('stage', 'a', 1)
+    theirs.put('stage', 'b', 2)
+    assert ours.prune(['stage']) == 0
+    ours.prune(['stage'])
+    assert cache_files(tmp_path) == ['theirs.stage-b.pkl']
+    assert theirs.clear() == 1
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from touchstone import Network, read_touchstone, report_column, write_touchstone
+
+
+def random_network(nports, parameter='S', points=6, seed=0):
+    rng = np.random.default_rng(seed)
+    data = 0.3 * (rng.normal(size=(points, nports, nports)) + 1j * rng.normal(size=(points, nports, nports)))
+    if parameter == 'Z':
+        data = 50.0 * data + 25.0
+    return Network(np.linspace(1e9, 6e9, points), data, parameter)
+
+
+@pytest.mark.parametrize('nports', [1, 2, 3, 4])
+@pytest.mark.parametrize('fmt', ['RI', 'MA', 'DB'])
+def test_write_read_round_trip(tmp_path, nports, fmt):
+    network = random_network(nports)
+    path = str(tmp_path / f'network.s{nports}p')
+    write_touchstone(path, network, fmt=fmt, unit='MHZ')
+    read = read_touchstone(path)
+    assert read.parameter == 'S' and read.z0 == 50.0
+    assert np.allclose(read.frequency, network.frequency)
+    assert np.allclose(read.data, network.data)
+
+
+def test_z_round_trip_is_not_normalised(tmp_path):
+    network = random_network(2, 'Z')
+    path = str(tmp_path / 'network.s2p')
+    write_touchstone(path, network)
+    assert np.allclose(read_touchstone(path).data, network.data)
+
+
+def test_report_column(tmp_path):
+    network = random_network(2)
+    assert np.allclose(report_column(network, 'dB(St(2,1)) []'), 20 * np.log10(np.abs(network.data[:, 1, 0])))
+
+
+def test_bad_number_names_the_line():
+    text = b"# GHZ S RI R 50\n1 0.1 0.2\n2 0.1 x0.2\n"
+    with pytest.raises(ValueError, match='Line 3'):
+        read_touchstone(text, nports=1)
+
+
+def test_version2_reference_on_several_lines():
+    text = (b"[Version] 2.0\n# GHz S RI R 50\n[Number of Ports] 2\n[Two-Port Data Order] 12_21\n"
+            b"[Reference] 75\n  75\n[Network Data]\n1 0.1 0.2 0.3 0.4 0.5 0.6 0.7 0.8\n[End]\n")
+    network = read_touchstone(text)
+    assert network.z0 == 75.0
+    assert network.data.shape == (1, 2, 2)
+    assert np.allclose(network.data[0], [[0.1 + 0.2j, 0.3 + 0.4j], [0.5 + 0.6j, 0.7 + 0.8j]])
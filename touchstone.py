@@ -0,0 +1,419 @@
+import re
+from dataclasses import dataclass
+
+# Reader and writer for Touchstone network files (.s1p, .s2p, .s4p, ... and
+# version 2 .ts files with a [Number of Ports] keyword). A file is parsed in one
+# pass into a complex array of shape (frequencies, ports, ports), so the HFSS
+# scripts can use a single lossless export instead of one CSV report per
+# quantity. numpy and pandas are imported inside the functions that use them
+# (see check_startup_time.py).
+
+# Extensions recognised as Touchstone files ('.s<N>p' for any port count, '.ts' for version 2)
+TOUCHSTONE_PATTERN = re.compile(r'\.(s\d+p|ts)$', re.IGNORECASE)
+TOUCHSTONE_EXTENSIONS = tuple(f'.s{n}p' for n in range(1, 65)) + ('.ts',)
+
+FREQUENCY_UNITS = {'HZ': 1.0, 'KHZ': 1e3, 'MHZ': 1e6, 'GHZ': 1e9}
+
+# HFSS report expressions such as 'dB(St(2,1)) []', 'mag(S(1,1))' or 're(Zt(1,2)) []'
+REPORT_EXPRESSION = re.compile(r'^\s*(dB|mag|re|im|ang_deg|ang_rad)\(\s*([SYZ])t?\((\d+)\s*,\s*(\d+)\)\s*\)', re.IGNORECASE)
+
+
+@dataclass
+class Network:
+    """
+    Network parameters of one Touchstone file.
+
+    Attributes:
+    - frequency (ndarray): Frequency axis in Hz, shape (n_freq,).
+    - data (ndarray): Complex parameter matrices, shape (n_freq, n_ports, n_ports).
+    - parameter (str): 'S', 'Y' or 'Z'. Y and Z are stored in Siemens and Ohm (not normalised).
+    - z0 (float): Reference impedance in Ohm.
+    """
+    frequency: object
+    data: object
+    parameter: str = 'S'
+    z0: float = 50.0
+
+    @property
+    def nports(self):
+        return self.data.shape[1]
+
+    def parameters(self, parameter):
+        """
+        Returns the network in another representation ('S', 'Z', 'Y' or 'ABCD'), converting
+        the whole sweep in one batched call; conversions are kept for later calls.
+        """
+        from network_params import convert
+
+        parameter = parameter.upper()
+        if parameter == self.parameter:
+            return self.data
+        converted = self.__dict__.setdefault('_converted', {})
+        if parameter not in converted:
+            converted[parameter] = convert(self.data, self.parameter, parameter, self.z0)
+        return converted[parameter]
+
+    @property
+    def frequency_ghz(self):
+        return self.frequency / 1e9
+
+
+# Function to check whether a path is a Touchstone file
+def is_touchstone(path):
+    """
+    Returns True if the file name has a Touchstone extension (.s<N>p or .ts).
+    """
+    return TOUCHSTONE_PATTERN.search(path) is not None
+
+
+# Function to determine the port count from a file name
+def ports_from_name(path):
+    """
+    Returns the port count encoded in a '.s<N>p' extension, or None.
+    """
+    match = re.search(r'\.s(\d+)p$', path, re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+# Function to read a Touchstone file
+def read_touchstone(source, nports=None):
+    """
+    Reads a Touchstone file (version 1 or 2) into a Network.
+
+    Parameters:
+    - source (str or bytes): Path of the file, or its raw contents.
+    - nports (int): Port count; required for raw contents of a version 1 file,
+      otherwise taken from the extension or the [Number of Ports] keyword.
+
+    Returns:
+    - network (Network): Frequency axis in Hz and the complex parameter matrices.
+
+    Raises:
+    - ValueError: If the file is malformed (the message names the line of a token that is not
+      a number) or uses an unsupported option (H/G parameters, packed matrices, different
+      reference impedances per port).
+    """
+    import numpy as np
+
+    if isinstance(source, (bytes, bytearray)):
+        text = bytes(source).decode('latin-1')
+    else:
+        if nports is None:
+            nports = ports_from_name(source)
+        with open(source, 'r', encoding='latin-1') as f:
+            text = f.read()
+
+    # Option line defaults of the Touchstone specification
+    unit, parameter, fmt, z0 = 'GHZ', 'S', 'MA', 50.0
+    column_major = None  # 2-port files list 11 21 12 22 unless [Two-Port Data Order] says otherwise
+    version2 = False
+    reference, reference_pending = [], 0  # [Reference] values may continue on the following lines
+    data_lines, line_numbers = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split('!', 1)[0].strip()
+        if not line:
+            continue
+        if reference_pending and not line.startswith(('#', '[')):
+            tokens = line.split()
+            reference += [_parse_number(token, number) for token in tokens[:reference_pending]]
+            reference_pending -= len(tokens[:reference_pending])
+            continue
+        if line.startswith('#'):
+            tokens = line[1:].upper().split()
+            for k, token in enumerate(tokens):
+                if token in FREQUENCY_UNITS:
+                    unit = token
+                elif token in ('S', 'Y', 'Z', 'H', 'G'):
+                    parameter = token
+                elif token in ('DB', 'MA', 'RI'):
+                    fmt = token
+                elif token == 'R' and k + 1 < len(tokens):
+                    z0 = float(tokens[k + 1])
+            continue
+        if line.startswith('['):
+            keyword, _, value = line[1:].partition(']')
+            keyword, value = keyword.strip().upper(), value.strip()
+            if keyword == 'VERSION':
+                version2 = True
+            elif keyword == 'NUMBER OF PORTS':
+                nports = int(value)
+            elif keyword == 'REFERENCE':
+                reference = [_parse_number(token, number) for token in value.split()]
+                reference_pending = max((nports or 1) - len(reference), 0)
+            elif keyword == 'TWO-PORT DATA ORDER':
+                column_major = value.upper() == '21_12'
+            elif keyword == 'MATRIX FORMAT' and value.upper() != 'FULL':
+                raise ValueError(f"Unsupported Touchstone matrix format '{value}' (only Full is supported).")
+            elif keyword in ('NOISE DATA', 'END'):
+                break
+            continue
+        data_lines.append(line)
+        line_numbers.append(number)
+
+    if parameter not in ('S', 'Y', 'Z'):
+        raise ValueError(f"Unsupported Touchstone parameter type '{parameter}'.")
+    if nports is None:
+        raise ValueError("The port count is unknown; pass nports for raw Touchstone data.")
+    if reference_pending:
+        raise ValueError(f"[Reference] lists {len(reference)} impedances for {nports} ports.")
+    if reference:
+        if len(set(reference)) > 1:
+            raise ValueError(f"Different reference impedances per port are not supported: {reference}.")
+        z0 = reference[0]
+    if column_major is None:
+        column_major = nports == 2
+
+    # Parse all numbers at once and split them into one row per frequency
+    per_frequency = 1 + 2 * nports * nports
+    values = _parse_data(data_lines, line_numbers)
+    if values.size % per_frequency or (nports == 2 and values.size // per_frequency != len(data_lines)):
+        # Version 1 two-port files may end with noise parameters (5 numbers per line)
+        kept = [k for k, line in enumerate(data_lines) if len(line.split()) == per_frequency]
+        data_lines, line_numbers = [data_lines[k] for k in kept], [line_numbers[k] for k in kept]
+        values = _parse_data(data_lines, line_numbers)
+        if values.size % per_frequency:
+            raise ValueError(f"Touchstone data does not divide into {nports}-port records of {per_frequency} numbers.")
+    values = values.reshape(-1, per_frequency)
+    if nports == 2 and not version2:
+        # Noise data follows the network data and starts at a frequency at or below the last one
+        restart = np.nonzero(np.diff(values[:, 0]) <= 0)[0]
+        if restart.size:
+            values = values[:restart[0] + 1]
+
+    frequency = values[:, 0] * FREQUENCY_UNITS[unit]
+    a, b = values[:, 1::2], values[:, 2::2]
+    if fmt == 'RI':
+        data = a + 1j * b
+    elif fmt == 'MA':
+        data = a * np.exp(1j * np.deg2rad(b))
+    else:  # DB
+        data = 10 ** (a / 20) * np.exp(1j * np.deg2rad(b))
+    data = data.reshape(-1, nports, nports)
+    if column_major:
+        data = data.transpose(0, 2, 1)
+
+    # Version 1 Y and Z data are normalised to the reference impedance
+    if not version2 and parameter == 'Z':
+        data = data * z0
+    elif not version2 and parameter == 'Y':
+        data = data / z0
+    return Network(frequency, np.ascontiguousarray(data), parameter, z0)
+
+
+def _parse_number(token, number):
+    """
+    Converts one token of line `number` to a float, naming the line if it is not a number.
+    """
+    try:
+        return float(token)
+    except ValueError:
+        raise ValueError(f"Line {number} of the Touchstone file: '{token}' is not a number.") from None
+
+
+def _parse_data(data_lines, line_numbers):
+    """
+    Converts the data lines to one flat float array. The lines are converted in one call;
+    only if that fails are they converted again one by one to find the bad token.
+    """
+    import numpy as np
+
+    try:
+        return np.array(' '.join(data_lines).split(), dtype=float)
+    except ValueError:
+        for line, number in zip(data_lines, line_numbers):
+            for token in line.split():
+                _parse_number(token, number)
+        raise
+
+
+# Function to write a Touchstone file
+def write_touchstone(path, network, fmt='RI', unit='GHZ'):
+    """
+    Writes a Network as a version 1 Touchstone file.
+
+    Parameters:
+    - path (str): Output path; the extension should be '.s<N>p'.
+    - network (Network): The network to write.
+    - fmt (str): 'RI', 'MA' or 'DB'.
+    - unit (str): Frequency unit of the file.
+    """
+    import numpy as np
+
+    data = network.data
+    if network.parameter == 'Z':
+        data = data / network.z0
+    elif network.parameter == 'Y':
+        data = data * network.z0
+    if network.nports == 2:
+        data = data.transpose(0, 2, 1)
+    data = data.reshape(len(network.frequency), -1)
+    if fmt == 'RI':
+        a, b = data.real, data.imag
+    elif fmt == 'MA':
+        a, b = np.abs(data), np.angle(data, deg=True)
+    else:
+        a, b = 20 * np.log10(np.abs(data)), np.angle(data, deg=True)
+    columns = np.empty((len(network.frequency), 1 + 2 * data.shape[1]))
+    columns[:, 0] = network.frequency / FREQUENCY_UNITS[unit.upper()]
+    columns[:, 1::2], columns[:, 2::2] = a, b
+
+    # Beyond two ports, version 1 files start every matrix row on a new line
+    # and hold at most four parameter pairs per line
+    n = 2 * network.nports
+    with open(path, 'w') as f:
+        f.write(f"! {network.nports}-port network\n")
+        f.write(f"# {unit.upper()} {network.parameter} {fmt.upper()} R {network.z0:g}\n")
+        for row in columns:
+            pairs = row[1:]
+            if network.nports > 2:
+                chunks = [pairs[r + k:r + min(k + 8, n)] for r in range(0, len(pairs), n) for k in range(0, n, 8)]
+            else:
+                chunks = [pairs]
+            f.write(f"{row[0]:.12g} " + ' '.join(f"{v:.12g}" for v in chunks[0]) + '\n')
+            for chunk in chunks[1:]:
+                f.write(' ' + ' '.join(f"{v:.12g}" for v in chunk) + '\n')
+
+
+# ---------------------------- HFSS Report Columns ---------------------------- #
+
+# Function to evaluate an HFSS report expression on a network
+def report_column(network, column_name):
+    """
+    Evaluates an HFSS report column, e.g. 'dB(St(2,1)) []', on a Touchstone network.
+
+    Parameters:
+    - network (Network): The parsed network.
+    - column_name (str): HFSS expression of the form <quantity>(<P>t(i,j)) with quantity
+      dB, mag, re, im, ang_deg or ang_rad and P one of S, Y, Z (converted if the network
+      holds another parameter type).
+
+    Returns:
+    - values (ndarray): Real values along the frequency axis.
+
+    Raises:
+    - ValueError: If the expression is not understood or refers to a port the network does not have.
+    """
+    import numpy as np
+
+    match = REPORT_EXPRESSION.match(column_name)
+    if match is None:
+        raise ValueError(f"Unsupported report expression '{column_name}'.")
+    quantity, parameter, i, j = match.group(1).lower(), match.group(2).upper(), int(match.group(3)), int(match.group(4))
+    if not (1 <= i <= network.nports and 1 <= j <= network.nports):
+        raise ValueError(f"'{column_name}' refers to a port the {network.nports}-port network does not have.")
+    # Z and Y columns of an S-parameter file (and vice versa) are converted from the full matrices
+    values = network.parameters(parameter)[:, i - 1, j - 1]
+    if quantity == 'db':
+        return 20 * np.log10(np.abs(values))
+    if quantity == 'mag':
+        return np.abs(values)
+    if quantity == 're':
+        return values.real
+    if quantity == 'im':
+        return values.imag
+    return np.angle(values, deg=quantity == 'ang_deg')
+
+
+# Function to shorten an HFSS report expression to its parameter name
+def parameter_label(column_name):
+    """
+    Returns the parameter a report column refers to, e.g. 'S21' for 'dB(St(2,1)) []',
+    or the column name unchanged if it is not a report expression.
+    """
+    match = REPORT_EXPRESSION.match(column_name)
+    if match is None:
+        return column_name
+    return f'{match.group(2).upper()}{match.group(3)}{match.group(4)}'
+
+
+# Function to present a network in the layout of an HFSS CSV report
+def network_to_report(network, quantity='dB'):
+    """
+    Builds a DataFrame laid out like an HFSS CSV report ('Freq [MHz]' followed by one
+    '<quantity>(<P>t(i,j)) []' column per matrix entry) so that code written for the
+    CSV exports can read Touchstone files unchanged.
+
+    Parameters:
+    - network (Network): The parsed network.
+    - quantity (str): Report quantity of the columns (default 'dB', as the HFSS S-parameter plot).
+
+    Returns:
+    - data (DataFrame): The report table.
+    """
+    import pandas as pd
+
+    columns = {'Freq [MHz]': network.frequency / 1e6}
+    for i in range(1, network.nports + 1):
+        for j in range(1, network.nports + 1):
+            name = f'{quantity}({network.parameter}t({i},{j})) []'
+            columns[name] = report_column(network, name)
+    return pd.DataFrame(columns)
+
+
+# Function to rebuild the complex network from the columns of an HFSS CSV report
+def network_from_report(data, z0=50.0):
+    """
+    Rebuilds the complex matrices from an HFSS report that holds every entry of one
+    parameter type as re/im or mag/ang_deg columns (e.g. 're(St(1,1)) []' and 'im(St(1,1)) []').
+    Reports in dB only, without phase, cannot be converted.
+
+    Parameters:
+    - data (DataFrame): The report table with a 'Freq [MHz]' column.
+    - z0 (float): Reference impedance of the S-parameters in Ohm.
+
+    Returns:
+    - network (Network): The network, or None if the report does not hold complete complex data.
+    """
+    import numpy as np
+
+    if 'Freq [MHz]' not in data.columns:
+        return None
+    entries = {}
+    for column_name in data.columns:
+        match = REPORT_EXPRESSION.match(column_name)
+        if match:
+            parameter, i, j = match.group(2).upper(), int(match.group(3)), int(match.group(4))
+            entries.setdefault(parameter, {}).setdefault((i, j), {})[match.group(1).lower()] = data[column_name].to_numpy()
+
+    for parameter in ('S', 'Z', 'Y'):
+        columns = entries.get(parameter, {})
+        nports = max((max(key) for key in columns), default=0)
+        if nports == 0:
+            continue
+        matrices = np.empty((len(data), nports, nports), dtype=complex)
+        for i in range(1, nports + 1):
+            for j in range(1, nports + 1):
+                entry = columns.get((i, j), {})
+                if 're' in entry and 'im' in entry:
+                    matrices[:, i - 1, j - 1] = entry['re'] + 1j * entry['im']
+                elif 'mag' in entry and 'ang_deg' in entry:
+                    matrices[:, i - 1, j - 1] = entry['mag'] * np.exp(1j * np.deg2rad(entry['ang_deg']))
+                else:
+                    break
+            else:
+                continue
+            break
+        else:
+            return Network(data['Freq [MHz]'].to_numpy() * 1e6, matrices, parameter, z0)
+    return None
+
+
+# Function to load either kind of HFSS export as a report table
+def read_report(path, raw=None):
+    """
+    Reads an HFSS export as a DataFrame: CSV reports as they are, Touchstone files
+    through network_to_report.
+
+    Parameters:
+    - path (str): Path of the export (its extension selects the reader).
+    - raw (bytes): Contents of the file if they were already read.
+
+    Returns:
+    - data (DataFrame): The report table.
+    """
+    import io
+    import pandas as pd
+
+    if is_touchstone(path):
+        return network_to_report(read_touchstone(raw if raw is not None else path, ports_from_name(path)))
+    return pd.read_csv(io.BytesIO(raw) if raw is not None else path)
@@ -0,0 +1,128 @@
+import os
+import time
+
+from figure_writer import flush_figures
+
+# Watch mode for the pipeline scripts. COMSOL and HFSS jobs write their exports
+# over many hours; instead of re-running a script at the end, --watch polls the
+# data folder, waits until each new file has stopped changing and re-runs the
+# pipeline. Per-file stages of files that were already processed come from the
+# pipeline cache, so only the new exports are read, fitted and plotted and the
+# combined/multiline plots are rebuilt from the cached per-file results. Every
+# update drops the cache entries it superseded (see PipelineCache.prune) and the
+# HFSS results store keeps one run per session, so a session of many hours does
+# not fill the memory or the disk.
+
+DEFAULT_INTERVAL = 2.0  # Seconds between two scans of the folder
+DEFAULT_SETTLE = 5.0  # Seconds a file's size and mtime must stay unchanged before it is processed
+
+
+class SettleTracker:
+    """
+    Debounces files that are still being written.
+
+    A file counts as settled once its size and modification time have not changed
+    for `settle` seconds, it is not empty and it can be opened for reading.
+
+    Parameters:
+    - settle (float): Quiet period in seconds.
+    """
+
+    def __init__(self, settle=DEFAULT_SETTLE):
+        self.settle = settle
+        self.seen = {}  # path -> ((size, mtime_ns), time the signature was first seen)
+
+    def update(self, items, now=None):
+        """
+        Records the current state of the discovered files.
+
+        Parameters:
+        - items (list): SourceFile items from the pipeline's discover function.
+        - now (float): Current time.monotonic(), for testing.
+
+        Returns:
+        - settled (list): The items that are ready to be processed, in discovery order.
+        """
+        now = time.monotonic() if now is None else now
+        settled = []
+        current = {}
+        for item in items:
+            signature = (item.size, item.mtime_ns)
+            previous = self.seen.get(item.path)
+            since = previous[1] if previous and previous[0] == signature else now
+            current[item.path] = (signature, since)
+            if item.size > 0 and now - since >= self.settle and readable(item.path):
+                settled.append(item)
+        self.seen = current
+        return settled
+
+
+# Function to check that a file is not locked by the program writing it
+def readable(path):
+    """
+    Returns True if the file can be opened for reading (on Windows a file that is
+    still open for writing by COMSOL or HFSS cannot).
+    """
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+# Function to keep a pipeline up to date with its data folder
+def watch(pipeline, targets=None, interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE, on_update=None, duration=None):
+    """
+    Polls the pipeline's data folder and re-runs the pipeline whenever settled files
+    are added, changed or removed. An update that fails is reported and retried on the next
+    scan. Stops on Ctrl+C (or after `duration` seconds).
+
+    Parameters:
+    - pipeline (Pipeline): The configured pipeline; its cache holds the per-file results between updates.
+    - targets (list): Stages to evaluate on every update (default: all stages).
+    - interval (float): Seconds between two scans.
+    - settle (float): Seconds a file must stay unchanged before it is processed.
+    - on_update (callable): Called with the results dict after every update.
+    - duration (float): Stop after this many seconds, or None to run until interrupted.
+
+    Returns:
+    - updates (int): Number of times the pipeline was re-run.
+    """
+    tracker = SettleTracker(settle)
+    processed = {}  # path -> SourceFile of the last update
+    updates = 0
+    start = time.monotonic()
+    print(f"Watching for new exports every {interval:g}s (press Ctrl+C to stop)...")
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            try:
+                settled = tracker.update(pipeline.discover())
+                current = {item.path: item for item in settled}
+                if current != processed:
+                    added = [os.path.basename(p) for p in current if processed.get(p) != current[p]]
+                    removed = [os.path.basename(p) for p in processed if p not in current]
+                    print(f"Update {updates + 1}: {len(added)} new or changed, {len(removed)} removed file(s)")
+                    results = pipeline.run(targets, items=settled)
+                    flush_figures()  # The plots of this update are on disk before it is reported
+                    if on_update is not None:
+                        on_update(results)
+                    print(pipeline.cache_summary())
+                    processed = current
+                    updates += 1
+            except Exception as e:
+                # processed is left as it was, so the update is retried on the next scan
+                print(f"Error in update {updates + 1}: {e}. Retrying in {interval:g}s.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    return updates
+
+
+def add_watch_arguments(parser):
+    """
+    Adds --watch, --interval and --settle to an argparse parser.
+    """
+    parser.add_argument('--watch', action='store_true', help='Keep running and process new exports as they are written')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Seconds between two scans in --watch mode')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help='Seconds a file must stay unchanged before it is processed in --watch mode')